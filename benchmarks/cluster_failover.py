@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Two-node cluster failover check
+
+Starts two service instances sharing one SQLite cluster store and a local
+FakeRelay, sends every state change to both (as HA would with two webhook
+targets), and checks that:
+- each alert is delivered once, not once per node
+- when the leader is killed mid-send, with alerts claimed and queued, the
+  standby takes over and delivers all of them within the lease TTL (plus one
+  standby renewal interval)
+
+Usage:
+    python benchmarks/cluster_failover.py --lease-ttl 5
+"""
+import argparse
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from fake_relay import FakeRelay
+from load_benchmark import wait_until
+from startup_benchmark import ENTITY_ID, SRC_DIR, post_webhook, service_env, write_config
+
+def start_node(tmp_dir: str, name: str, port: int, relay_url: str, db_path: str, lease_ttl: int) -> subprocess.Popen:
+    config_path = os.path.join(tmp_dir, f'{name}.yaml')
+    write_config(config_path, [relay_url], extra_sections={
+        'cluster': {'enabled': True, 'db_path': db_path, 'node_id': name, 'lease_ttl': lease_ttl, 'dedupe_window': 60}
+    })
+    return subprocess.Popen([sys.executable, '-u', 'main.py'], cwd=SRC_DIR, env=service_env(config_path, port),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def current_leader(db_path: str) -> str:
+    with sqlite3.connect(db_path) as connection:
+        row = connection.execute("SELECT node_id, expires_at FROM leader WHERE id = 1").fetchone()
+    return row[0] if row and row[1] > time.time() else ''
+
+def unsent(db_path: str) -> Dict[str, int]:
+    """Unsent outbox rows by claiming node ('' for unclaimed)"""
+    with sqlite3.connect(db_path) as connection:
+        rows = connection.execute("SELECT COALESCE(claimed_by, ''), COUNT(*) FROM outbox "
+                                  "WHERE sent_at IS NULL GROUP BY 1").fetchall()
+    return dict(rows)
+
+def post_to_all(ports: List[int], state: str) -> None:
+    for port in ports:
+        post_webhook(port, ENTITY_ID, state)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Check active-active dedupe and failover')
+    parser.add_argument('--lease-ttl', type=int, default=5)
+    parser.add_argument('--relay-port', type=int, default=7790)
+    parser.add_argument('--ports', type=int, nargs=2, default=[5091, 5092])
+    parser.add_argument('--alerts', type=int, default=3)
+    args = parser.parse_args()
+
+    relay = FakeRelay(port=args.relay_port)
+    relay.start()
+    nodes: Dict[str, subprocess.Popen] = {}
+    ports = {'node-a': args.ports[0], 'node-b': args.ports[1]}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'cluster.db')
+        try:
+            for name, port in ports.items():
+                nodes[name] = start_node(tmp_dir, name, port, relay.url, db_path, args.lease_ttl)
+            for port in ports.values():
+                if not wait_until(lambda: post_webhook(port, 'sensor.unmonitored') == 200, 30):
+                    raise SystemExit(f"Node on port {port} did not come up")
+            if not wait_until(lambda: current_leader(db_path) != '', 30):
+                raise SystemExit("No leader elected")
+
+            # Dedupe: each alert posted to both nodes must arrive once
+            for index in range(args.alerts):
+                before = relay.stats['accepted']
+                post_to_all(list(ports.values()), f'dedupe-{index}')
+                wait_until(lambda: relay.stats['accepted'] > before, 20)
+                time.sleep(3)
+                print(f"alert {index}: {relay.stats['accepted'] - before} DM(s) at relay (expected 1)")
+
+            # Failover: the relay stops answering, so the leader hangs mid-send with a
+            # claimed alert and more queued behind it; kill it without releasing the lease
+            leader = current_leader(db_path)
+            relay.drop_rate = 1.0
+            dropped = relay.stats['dropped']
+            for index in range(args.alerts):
+                post_to_all(list(ports.values()), f'in-flight-{index}')
+                time.sleep(1)
+            if not wait_until(lambda: relay.stats['dropped'] > dropped and unsent(db_path).get(leader), 20):
+                raise SystemExit(f"Leader {leader} never claimed an alert")
+            pending = unsent(db_path)
+            nodes[leader].send_signal(signal.SIGKILL)
+            nodes[leader].wait()
+            killed_at = time.monotonic()
+            relay.drop_rate = 0.0
+            before = relay.stats['accepted']
+            deadline = args.lease_ttl * 4 / 3 + 5
+            drained = wait_until(lambda: not unsent(db_path), deadline)
+            took = time.monotonic() - killed_at
+            print(f"killed leader {leader} mid-send with unsent alerts {pending}; "
+                  f"new leader {current_leader(db_path) or 'none'}; "
+                  f"{relay.stats['accepted'] - before} DM(s) delivered {took:.2f}s after the kill")
+            if not drained:
+                raise SystemExit(f"Outbox not drained within {deadline:.1f}s of the kill: {unsent(db_path)}")
+        finally:
+            for process in nodes.values():
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait(timeout=10)
+            relay.stop()
+
+if __name__ == "__main__":
+    main()
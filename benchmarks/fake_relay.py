@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Local fake Nostr relay for offline benchmarking
+
+Speaks the subset of NIP-01 used by HA Nostr Alert (EVENT/OK, REQ/EVENT/EOSE,
+CLOSE, NOTICE) and can simulate slow, lossy, rate-limited and flaky relays.
+Plain HTTP requests with `Accept: application/nostr+json` get a NIP-11
+information document whose limits the relay also enforces. With --auth-required
+it sends a NIP-42 AUTH challenge and only accepts events from authenticated
+connections.
+Events are not signature-checked.
+
+Usage:
+    python benchmarks/fake_relay.py --port 7777 --latency 0.05 --drop-rate 0.01 --rate-limit 20
+    python benchmarks/fake_relay.py --max-message-length 4096 --info '{"supported_nips": [1, 11]}'
+"""
+import argparse
+import asyncio
+import http
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import websockets
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeRelay:
+    def __init__(self, host: str = '127.0.0.1', port: int = 7777, latency: float = 0.0,
+                 jitter: float = 0.0, drop_rate: float = 0.0, rate_limit: Optional[float] = None,
+                 disconnect_every: Optional[int] = None, notice: Optional[str] = None,
+                 max_message_length: Optional[int] = None, info: Optional[Dict[str, Any]] = None,
+                 auth_required: bool = False, hide_rate: float = 0.0) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.rate_limit = rate_limit
+        self.disconnect_every = disconnect_every
+        self.notice = notice
+        self.max_message_length = max_message_length
+        self.info = info or {}
+        self.auth_required = auth_required
+        self.hide_rate = hide_rate
+        self.events: List[Dict[str, Any]] = []
+        self.received_at: List[float] = []
+        self.stats: Dict[str, int] = {
+            'connections': 0, 'events': 0, 'accepted': 0, 'rate_limited': 0,
+            'dropped': 0, 'disconnects': 0, 'subscriptions': 0, 'too_large': 0, 'info_requests': 0,
+            'auth_challenges': 0, 'auth_ok': 0, 'auth_required': 0, 'hidden': 0
+        }
+        # Open subscriptions of every connection, so accepted events reach other readers too
+        self._subscribers: Dict[Any, Dict[str, List[Dict[str, Any]]]] = {}
+        self._tokens = rate_limit or 0.0
+        self._last_refill = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Future] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def info_document(self) -> Dict[str, Any]:
+        """NIP-11 document advertising the simulated limits, with --info overrides applied"""
+        limitation: Dict[str, Any] = {'auth_required': self.auth_required}
+        if self.max_message_length:
+            limitation['max_message_length'] = self.max_message_length
+        document: Dict[str, Any] = {
+            'name': 'fake relay',
+            'description': 'HA Nostr Alert benchmark relay',
+            'software': 'ha_nostr_alert/benchmarks/fake_relay.py',
+            'supported_nips': [1, 11, 17, 42, 44, 59],
+            'limitation': limitation
+        }
+        for key, value in self.info.items():
+            if key == 'limitation' and isinstance(value, dict):
+                document['limitation'] = {**limitation, **value}
+            else:
+                document[key] = value
+        return document
+
+    def _process_request(self, connection: Any, request: Any) -> Any:
+        """Answer NIP-11 requests; let WebSocket upgrades through"""
+        if 'application/nostr+json' not in request.headers.get('Accept', '') or 'Upgrade' in request.headers:
+            return None
+        self.stats['info_requests'] += 1
+        response = connection.respond(http.HTTPStatus.OK, json.dumps(self.info_document()))
+        del response.headers['Content-Type']
+        response.headers['Content-Type'] = 'application/nostr+json'
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response
+
+    def _take_token(self) -> bool:
+        """Token bucket allowing rate_limit events per second"""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+        self._last_refill = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    @staticmethod
+    def _matches(event: Dict[str, Any], filter_: Dict[str, Any]) -> bool:
+        """Minimal NIP-01 filter matching"""
+        if 'ids' in filter_ and event.get('id') not in filter_['ids']:
+            return False
+        if 'kinds' in filter_ and event.get('kind') not in filter_['kinds']:
+            return False
+        if 'authors' in filter_ and event.get('pubkey') not in filter_['authors']:
+            return False
+        if 'since' in filter_ and event.get('created_at', 0) < filter_['since']:
+            return False
+        if 'until' in filter_ and event.get('created_at', 0) > filter_['until']:
+            return False
+        for key, values in filter_.items():
+            if key.startswith('#') and len(key) == 2:
+                tag_values = [tag[1] for tag in event.get('tags', []) if len(tag) > 1 and tag[0] == key[1]]
+                if not any(value in tag_values for value in values):
+                    return False
+        return True
+
+    async def _handle_event(self, websocket: Any, event: Dict[str, Any]) -> None:
+        self.stats['events'] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            return
+
+        if not self._take_token():
+            self.stats['rate_limited'] += 1
+            await websocket.send(json.dumps(['OK', event.get('id'), False, 'rate-limited: slow down']))
+            return
+
+        if random.random() < self.hide_rate:
+            # Acknowledged but never stored or served, as a relay that silently loses events
+            self.stats['hidden'] += 1
+            await websocket.send(json.dumps(['OK', event.get('id'), True, '']))
+            return
+
+        self.events.append(event)
+        self.received_at.append(time.monotonic())
+        self.stats['accepted'] += 1
+        await websocket.send(json.dumps(['OK', event.get('id'), True, '']))
+
+        for subscriber, subscriptions in list(self._subscribers.items()):
+            for sub_id, filters in list(subscriptions.items()):
+                if any(self._matches(event, filter_) for filter_ in filters):
+                    try:
+                        await subscriber.send(json.dumps(['EVENT', sub_id, event]))
+                    except websockets.ConnectionClosed:
+                        pass
+
+        if self.disconnect_every and self.stats['accepted'] % self.disconnect_every == 0:
+            self.stats['disconnects'] += 1
+            await websocket.close()
+
+    async def _event_task(self, websocket: Any, event: Dict[str, Any]) -> None:
+        try:
+            await self._handle_event(websocket, event)
+        except websockets.ConnectionClosed:
+            pass
+
+    def _check_auth(self, event: Dict[str, Any], challenge: str) -> bool:
+        """NIP-42 AUTH event for this connection's challenge (signature not checked)"""
+        tags = {tag[0]: tag[1] for tag in event.get('tags', []) if len(tag) > 1}
+        return event.get('kind') == 22242 and tags.get('challenge') == challenge and 'relay' in tags \
+            and abs(time.time() - event.get('created_at', 0)) < 600
+
+    async def _handler(self, websocket: Any) -> None:
+        self.stats['connections'] += 1
+        subscriptions: Dict[str, List[Dict[str, Any]]] = {}
+        self._subscribers[websocket] = subscriptions
+        challenge = secrets.token_hex(16)
+        authenticated = False
+        # EVENTs are handled concurrently, so pipelined publishes get their OKs back independently
+        in_flight: Set[asyncio.Task] = set()
+        if self.auth_required:
+            self.stats['auth_challenges'] += 1
+            await websocket.send(json.dumps(['AUTH', challenge]))
+        if self.notice:
+            await websocket.send(json.dumps(['NOTICE', self.notice]))
+        try:
+            async for raw in websocket:
+                try:
+                    message = json.loads(raw)
+                except ValueError:
+                    await websocket.send(json.dumps(['NOTICE', 'invalid: could not parse message']))
+                    continue
+                if not isinstance(message, list) or not message:
+                    continue
+
+                if message[0] == 'AUTH' and len(message) > 1 and isinstance(message[1], dict):
+                    authenticated = self._check_auth(message[1], challenge)
+                    if authenticated:
+                        self.stats['auth_ok'] += 1
+                    await websocket.send(json.dumps(['OK', message[1].get('id'), authenticated,
+                                                     '' if authenticated else 'invalid: bad AUTH event']))
+                elif message[0] == 'EVENT' and len(message) > 1:
+                    if self.auth_required and not authenticated:
+                        self.stats['auth_required'] += 1
+                        await websocket.send(json.dumps(['OK', message[1].get('id'), False,
+                                                         'auth-required: authenticate to publish']))
+                        continue
+                    if self.max_message_length and len(raw) > self.max_message_length:
+                        self.stats['too_large'] += 1
+                        await websocket.send(json.dumps(['OK', message[1].get('id'), False, 'invalid: event too large']))
+                        continue
+                    task = asyncio.create_task(self._event_task(websocket, message[1]))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+                elif message[0] == 'REQ' and len(message) > 2:
+                    self.stats['subscriptions'] += 1
+                    sub_id, filters = message[1], message[2:]
+                    subscriptions[sub_id] = filters
+                    for event in self.events:
+                        if any(self._matches(event, filter_) for filter_ in filters):
+                            await websocket.send(json.dumps(['EVENT', sub_id, event]))
+                    await websocket.send(json.dumps(['EOSE', sub_id]))
+                elif message[0] == 'CLOSE' and len(message) > 1:
+                    subscriptions.pop(message[1], None)
+                else:
+                    await websocket.send(json.dumps(['NOTICE', f'unsupported message: {message[0]}']))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in in_flight:
+                task.cancel()
+            self._subscribers.pop(websocket, None)
+
+    async def serve(self) -> None:
+        """Serve until stop() is called"""
+        self._loop = asyncio.get_running_loop()
+        self._stop = self._loop.create_future()
+        async with websockets.serve(self._handler, self.host, self.port, process_request=self._process_request,
+                                    max_size=None):
+            logger.info(f"Fake relay listening on {self.url}")
+            self._ready.set()
+            await self._stop
+
+    def start(self) -> None:
+        """Run the relay on a background thread"""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="fake-relay", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+
+    def stop(self) -> None:
+        """Stop a relay started with start()"""
+        if self._loop and self._stop and not self._stop.done():
+            self._loop.call_soon_threadsafe(self._stop.set_result, None)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run a local fake Nostr relay')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before answering OK')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency in seconds')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Fraction of events never answered')
+    parser.add_argument('--rate-limit', type=float, default=None, help='Accepted events per second')
+    parser.add_argument('--disconnect-every', type=int, default=None, help='Close the connection every N events')
+    parser.add_argument('--notice', default=None, help='NOTICE sent on connect')
+    parser.add_argument('--max-message-length', type=int, default=None,
+                        help='Reject EVENT messages larger than this many bytes (advertised via NIP-11)')
+    parser.add_argument('--hide-rate', type=float, default=0.0,
+                        help='Fraction of events acknowledged but never stored or served to subscribers')
+    parser.add_argument('--auth-required', action='store_true', help='Require NIP-42 AUTH before accepting events')
+    parser.add_argument('--info', type=json.loads, default=None,
+                        help='JSON merged into the NIP-11 document, e.g. \'{"limitation": {"auth_required": true}}\'')
+    args = parser.parse_args()
+
+    relay = FakeRelay(
+        host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        drop_rate=args.drop_rate, rate_limit=args.rate_limit,
+        disconnect_every=args.disconnect_every, notice=args.notice,
+        max_message_length=args.max_message_length, info=args.info, auth_required=args.auth_required,
+        hide_rate=args.hide_rate
+    )
+    try:
+        asyncio.run(relay.serve())
+    except KeyboardInterrupt:
+        pass
+    logger.info(f"Fake relay stats: {relay.stats}")
+
+if __name__ == "__main__":
+    main()
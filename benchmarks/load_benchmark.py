@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for HA Nostr Alert
+
+Runs the service against a local FakeRelay, hammers POST /webhook and reports
+webhook throughput, HTTP and end-to-end latency percentiles (webhook accepted
+-> gift wrap received by the relay), drop rate and peak RSS of the service.
+
+With --replay COUNT it instead measures outbox replay after an outage: COUNT
+alerts are queued in a cluster outbox and the leader sends them in batches
+with NostrClient.send_many, compared with sending them one by one.
+
+Usage:
+    python benchmarks/load_benchmark.py --requests 2000 --concurrency 16 --entities 20 \\
+        --relay-latency 0.05 --relay-drop-rate 0.01
+    python benchmarks/load_benchmark.py --replay 300 --relay-latency 0.05
+"""
+import argparse
+import asyncio
+import bisect
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from fake_relay import FakeRelay
+from startup_benchmark import SRC_DIR, post_webhook, service_env, use_config, write_config
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Return p50/p90/p99/max of a list of values"""
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+    return {'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': ordered[-1]}
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """Read the resident set size of a process from /proc (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+class RssSampler:
+    def __init__(self, pid: int, interval: float = 0.2) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            rss = read_rss_kb(self.pid)
+            if rss:
+                self.peak_kb = max(self.peak_kb, rss)
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+def wait_until(predicate: Any, timeout: float, interval: float = 0.05) -> bool:
+    """Poll predicate until it is true or the timeout expires"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+def fire(port: int, entities: List[str], count: int, concurrency: int, rate: Optional[float]) -> List[Tuple[float, Optional[int], float]]:
+    """Send count webhooks, returning (sent_at, status, response_time) per request"""
+    interval = 1.0 / rate if rate else 0.0
+    start = time.monotonic()
+
+    def send(index: int) -> Tuple[float, Optional[int], float]:
+        if interval:
+            delay = start + index * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        sent_at = time.monotonic()
+        status = post_webhook(port, random.choice(entities), str(index))
+        return sent_at, status, time.monotonic() - sent_at
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(send, range(count)))
+
+def replay(relay: FakeRelay, count: int, tmp_dir: str, drain_timeout: float) -> Dict[str, float]:
+    """Time replay of count queued outbox alerts through the cluster leader, then one by one with send_dm"""
+    config_path = os.path.join(tmp_dir, 'config.yaml')
+    write_config(config_path, [relay.url], extra_sections={
+        'cluster': {'enabled': True, 'db_path': os.path.join(tmp_dir, 'cluster.db'), 'node_id': 'replay'},
+        'inbox_relays': {'enabled': False}
+    })
+    use_config(config_path)
+    sys.path.insert(0, SRC_DIR)
+    from cluster import ClusterCoordinator
+    from config import Config
+    from nostr_client import NostrClient
+
+    config = Config()
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    on_loop = lambda coroutine: asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+    client = NostrClient(config)
+    if not on_loop(client.connect_to_primary_relay()):
+        raise SystemExit("Could not connect to the fake relay")
+    cluster = ClusterCoordinator(config)
+    try:
+        for index in range(count):
+            cluster.enqueue(f"replayed alert {index}")
+        before = relay.stats['accepted']
+        start = time.monotonic()
+        cluster.set_nostr_client(client, loop)
+        cluster.start()
+        if not wait_until(lambda: cluster.status()['outbox_unsent'] == 0, drain_timeout):
+            raise SystemExit(f"Outbox not drained within {drain_timeout}s")
+        batched = time.monotonic() - start
+        cluster.stop()
+        delivered = relay.stats['accepted'] - before
+
+        start = time.monotonic()
+        for index in range(count):
+            on_loop(client.send_dm(f"sequential alert {index}"))
+        sequential = time.monotonic() - start
+    finally:
+        cluster.stop()
+        on_loop(client.disconnect_all())
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join(timeout=5)
+    return {'alerts': count, 'delivered': delivered, 'batched_seconds': batched, 'sequential_seconds': sequential}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='End-to-end load benchmark against a fake relay')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=None, help='Target webhooks per second (default: unthrottled)')
+    parser.add_argument('--entities', type=int, default=10, help='Number of distinct monitored entities')
+    parser.add_argument('--queue-size', type=int, default=5)
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--relay-port', type=int, default=7777)
+    parser.add_argument('--relay-latency', type=float, default=0.0)
+    parser.add_argument('--relay-jitter', type=float, default=0.0)
+    parser.add_argument('--relay-drop-rate', type=float, default=0.0)
+    parser.add_argument('--relay-rate-limit', type=float, default=None)
+    parser.add_argument('--relay-disconnect-every', type=int, default=None)
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--replay', type=int, metavar='COUNT',
+                        help='Measure replay of COUNT queued outbox alerts instead of webhook load')
+    args = parser.parse_args()
+
+    relay = FakeRelay(
+        port=args.relay_port, latency=args.relay_latency, jitter=args.relay_jitter,
+        drop_rate=args.relay_drop_rate, rate_limit=args.relay_rate_limit,
+        disconnect_every=args.relay_disconnect_every
+    )
+    relay.start()
+    if args.replay:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                result = replay(relay, args.replay, tmp_dir, args.drain_timeout)
+            finally:
+                relay.stop()
+        print(f"outbox replay:       {result['delivered']}/{result['alerts']} alerts in "
+              f"{result['batched_seconds']:.2f}s ({result['alerts'] / result['batched_seconds']:.1f} alerts/s) "
+              f"with send_many")
+        print(f"one by one:          {result['alerts']} alerts in {result['sequential_seconds']:.2f}s "
+              f"({result['alerts'] / result['sequential_seconds']:.1f} alerts/s) with send_dm")
+        return
+    entities = [f'input_number.bench_{index}' for index in range(args.entities)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'config.yaml')
+        write_config(config_path, [relay.url], entities=entities, max_queue_size=args.queue_size)
+        process = subprocess.Popen(
+            [sys.executable, '-u', 'main.py'], cwd=SRC_DIR, env=service_env(config_path, args.port),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        sampler = RssSampler(process.pid)
+        sampler.start()
+        try:
+            # Warm up: wait for the listener and the first DM so connection setup is excluded
+            if not wait_until(lambda: post_webhook(args.port, entities[0], 'warmup') == 200, 30):
+                raise SystemExit("Webhook listener did not come up")
+            if not wait_until(lambda: relay.stats['accepted'] > 0, 30):
+                raise SystemExit("No DM reached the fake relay during warmup")
+            baseline_events = len(relay.received_at)
+
+            start = time.monotonic()
+            results = fire(args.port, entities, args.requests, args.concurrency, args.rate)
+            send_duration = time.monotonic() - start
+
+            # Drain: wait until the relay has seen an event after the last accepted webhook
+            accepted_times = [sent_at for sent_at, status, _ in results if status == 200]
+            last_accepted = max(accepted_times) if accepted_times else start
+            wait_until(lambda: relay.received_at and relay.received_at[-1] >= last_accepted, args.drain_timeout)
+            total_duration = time.monotonic() - start
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            sampler.stop()
+            relay.stop()
+
+    arrivals = relay.received_at[baseline_events:]
+    end_to_end: List[float] = []
+    undelivered = 0
+    for sent_at in accepted_times:
+        index = bisect.bisect_left(arrivals, sent_at)
+        if index < len(arrivals):
+            end_to_end.append(arrivals[index] - sent_at)
+        else:
+            undelivered += 1
+
+    statuses: Dict[str, int] = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    http_latency = percentiles([response_time for _, _, response_time in results])
+    e2e_latency = percentiles(end_to_end)
+    fmt = lambda stats: " ".join(f"{key}={value * 1000:.1f}ms" if value is not None else f"{key}=n/a"
+                                  for key, value in stats.items())
+
+    print(f"requests:            {args.requests} in {send_duration:.2f}s "
+          f"({args.requests / send_duration:.1f} req/s), statuses {statuses}")
+    print(f"accepted throughput: {len(accepted_times) / send_duration:.1f} webhooks/s")
+    print(f"webhook drop rate:   {1 - len(accepted_times) / args.requests:.2%} (non-200 responses)")
+    print(f"http latency:        {fmt(http_latency)}")
+    print(f"DMs at relay:        {len(arrivals)} in {total_duration:.2f}s, "
+          f"coalescing ratio {len(accepted_times) / max(1, len(arrivals)):.1f} webhooks/DM")
+    print(f"end-to-end latency:  {fmt(e2e_latency)}")
+    print(f"undelivered:         {undelivered} accepted webhooks with no later DM")
+    print(f"relay stats:         {relay.stats}")
+    print(f"peak service RSS:    {sampler.peak_kb / 1024:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
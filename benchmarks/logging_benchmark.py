@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Webhook throughput with logging enabled
+
+Runs the webhook handler and message processor in-process (Flask test client,
+no Nostr client attached) and measures webhook requests per second under
+different logging setups, all writing to a real file:
+- sync:     StreamHandler on the root logger, formatting and writing in the request thread
+- queue:    queue handler + background writer, text format
+- json:     queue handler + background writer, JSON lines
+- sampled:  queue handler, per-event records sampled 1-in-N and rate limited
+- off:      level WARNING, per-event records never created
+
+Usage:
+    python benchmarks/logging_benchmark.py --requests 20000
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from startup_benchmark import ENTITY_ID, use_config, write_config
+
+MODES: Dict[str, Dict[str, Any]] = {
+    'sync': {},
+    'queue': {'level': 'INFO', 'format': 'text', 'per_event_sample_rate': 1, 'per_event_max_per_second': 0},
+    'json': {'level': 'INFO', 'format': 'json', 'per_event_sample_rate': 1, 'per_event_max_per_second': 0},
+    'sampled': {'level': 'INFO', 'format': 'text', 'per_event_sample_rate': 100, 'per_event_max_per_second': 10},
+    'off': {'level': 'WARNING', 'format': 'text', 'per_event_sample_rate': 1, 'per_event_max_per_second': 0}
+}
+
+def setup_logging(mode: str, log_file: Any) -> None:
+    from logging_setup import TEXT_FORMAT, configure_logging, stop_logging
+    stop_logging()
+    if mode == 'sync':
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        handler = logging.StreamHandler(log_file)
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        configure_logging(MODES[mode], stream=log_file)
+
+def run_mode(mode: str, requests: int, tmp_dir: str) -> Dict[str, Any]:
+    from config import Config
+    from logging_setup import stop_logging
+    from message_processor import MessageProcessor
+    from webhook_server import WebhookServer
+
+    log_path = os.path.join(tmp_dir, f'{mode}.log')
+    with open(log_path, 'w') as log_file:
+        setup_logging(mode, log_file)
+        config = Config()
+        message_queue: queue.Queue = queue.Queue(maxsize=config.max_queue_size)
+        processor = MessageProcessor(config, message_queue, None)
+        server = WebhookServer(config, message_queue)
+        client = server.app.test_client()
+        processor.start()
+        try:
+            payloads = [json.dumps({
+                'entity_id': ENTITY_ID,
+                'new_state': {'state': str(index), 'attributes': {'friendly_name': 'Benchmark'}}
+            }) for index in range(requests)]
+            rejected = 0
+            started = time.perf_counter()
+            for payload in payloads:
+                if client.post('/webhook', data=payload, content_type='application/json').status_code != 200:
+                    rejected += 1
+            elapsed = time.perf_counter() - started
+        finally:
+            processor.stop()
+            stop_logging()
+            logging.getLogger().handlers.clear()
+    with open(log_path) as log_file:
+        lines = sum(1 for _ in log_file)
+    return {'mode': mode, 'req_per_s': requests / elapsed, 'rejected': rejected, 'log_lines': lines}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure webhook throughput under different logging setups')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'config.yaml')
+        write_config(config_path, ['ws://127.0.0.1:7777'], max_queue_size=args.requests + 1)
+        use_config(config_path)
+        results = [run_mode(mode, args.requests, tmp_dir) for mode in args.modes]
+
+    print(f"{'mode':<10}{'req/s':>10}{'rejected':>10}{'log lines':>12}")
+    for result in results:
+        print(f"{result['mode']:<10}{result['req_per_s']:>10.0f}{result['rejected']:>10}{result['log_lines']:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Consolidated alert payload benchmark
+
+Renders synthetic dashboards of increasing entity count in each payload
+format, splits them under a relay's size budget exactly like send_dm, builds
+real NIP-17 gift wraps for every part and reports message size, part count,
+bytes on the wire and gift wrap build (encryption and signing) time.
+
+Usage:
+    python benchmarks/payload_benchmark.py --entities 10 100 500 1000 --max-message-length 16384
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from startup_benchmark import SRC_DIR
+
+sys.path.insert(0, SRC_DIR)
+
+from nostr_sdk import EventBuilder, Keys, Kind, Nip44Version, NostrSigner, Tag, nip44_encrypt  # noqa: E402
+from payload import encode_rows, json_text_size, max_message_size, split_message  # noqa: E402
+
+FORMATS = ('lines', 'compact', 'auto')
+
+# Typical Home Assistant dashboard mix: mostly binary entities sharing a handful of states
+ROOMS = ['Kitchen', 'Living Room', 'Hallway', 'Bedroom', 'Office', 'Garage', 'Garden', 'Bathroom']
+BINARY_KINDS = [('Light', ['on', 'off']), ('Door', ['open', 'closed']), ('Window', ['open', 'closed']),
+                ('Motion', ['detected', 'clear']), ('Plug', ['on', 'off'])]
+
+def dashboard(entity_count: int, seed: int = 1) -> List[Tuple[str, str]]:
+    """Synthetic (friendly_name, state) rows: 80% binary entities, 20% numeric sensors"""
+    rng = random.Random(seed)
+    rows: List[Tuple[str, str]] = []
+    for index in range(entity_count):
+        room = ROOMS[index % len(ROOMS)]
+        if rng.random() < 0.8:
+            kind, states = BINARY_KINDS[index % len(BINARY_KINDS)]
+            # Most entities sit in their resting state
+            rows.append((f"{room} {kind} {index}", states[1] if rng.random() < 0.85 else states[0]))
+        else:
+            rows.append((f"{room} Temperature {index}", f"{rng.uniform(15, 30):.1f} °C"))
+    return rows
+
+async def build_gift_wrap(sender: Keys, signer: NostrSigner, recipient: Keys, message: str) -> str:
+    """Gift wrap of message as sent by NostrClient, returned as the EVENT message sent to the relay"""
+    recipient_public_key = recipient.public_key()
+    rumor = EventBuilder.private_msg_rumor(recipient_public_key, message).build(sender.public_key())
+    seal = await (await EventBuilder.seal(signer, recipient_public_key, rumor)).sign(signer)
+    ephemeral_keys = Keys.generate()
+    content = nip44_encrypt(ephemeral_keys.secret_key(), recipient_public_key, seal.as_json(), Nip44Version.V2)
+    gift_wrap = EventBuilder(Kind(1059), content).tags([Tag.public_key(recipient_public_key)]).sign_with_keys(ephemeral_keys)
+    return f'["EVENT",{gift_wrap.as_json()}]'
+
+async def measure(rows: List[Tuple[str, str]], payload_format: str, max_event_size: Optional[int],
+                  repeat: int) -> Dict[str, float]:
+    """Sizes and mean gift wrap build time of one dashboard in one format"""
+    sender, recipient = Keys.generate(), Keys.generate()
+    signer = NostrSigner.keys(sender)
+    message = "2024-01-01 00:00:00\n" + encode_rows(rows, payload_format)
+    parts = split_message(message, max_message_size(max_event_size))
+
+    wire_bytes = 0
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        wire_bytes = 0
+        for part in parts:
+            wire_bytes += len((await build_gift_wrap(sender, signer, recipient, part)).encode('utf-8'))
+    elapsed = (time.perf_counter() - start_time) / repeat
+
+    return {
+        'message_bytes': json_text_size(message),
+        'parts': len(parts),
+        'wire_bytes': wire_bytes,
+        'encrypt_ms': elapsed * 1000
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure alert payload size and encryption time vs entity count')
+    parser.add_argument('--entities', type=int, nargs='+', default=[10, 50, 100, 250, 500, 1000])
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS), choices=list(FORMATS))
+    parser.add_argument('--max-message-length', type=int, default=None,
+                        help="Relay's NIP-11 max_message_length in bytes (default: only the NIP-44 limit applies)")
+    parser.add_argument('--repeat', type=int, default=5, help='Gift wrap builds averaged per measurement')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for entity_count in args.entities:
+        rows = dashboard(entity_count)
+        for payload_format in args.formats:
+            result = asyncio.run(measure(rows, payload_format, args.max_message_length, args.repeat))
+            results.append({'entities': entity_count, 'format': payload_format, **result})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'entities':>9}{'format':>9}{'msg bytes':>11}{'parts':>7}{'wire bytes':>12}{'encrypt ms':>12}")
+    for result in results:
+        print(f"{result['entities']:>9}{result['format']:>9}{result['message_bytes']:>11}{result['parts']:>7}"
+              f"{result['wire_bytes']:>12}{result['encrypt_ms']:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Replay of captured webhook traffic through the message pipeline
+
+Feeds a capture written by the add-on's `capture` option (or --synthesize'd
+here) into the webhook handler and message processor in-process, keeping the
+original inter-arrival times scaled by each --speeds factor ('max' sends
+back to back). Alerts go to a stub Nostr client that only records them, so
+the numbers reflect MessageProcessor and not relays: accepted throughput,
+coalescing ratio (accepted webhooks per alert) and latency from webhook
+accepted to the first alert sent after it.
+
+Usage:
+    python benchmarks/replay_benchmark.py --capture /share/webhook_capture.ndjson --speeds 1 10 max
+    python benchmarks/replay_benchmark.py --synthesize 2000 --speeds 10 max --config my_config.yaml
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from load_benchmark import percentiles, wait_until
+from startup_benchmark import SRC_DIR, use_config, write_config
+from stub_nostr import StubNostrClient
+
+sys.path.insert(0, SRC_DIR)
+
+from capture import read_capture  # noqa: E402
+
+def synthesize(count: int, entities: int, rate: float, seed: int = 1) -> List[Tuple[float, Any]]:
+    """Bursty synthetic capture: Poisson arrivals over a skewed mix of entities"""
+    rng = random.Random(seed)
+    entity_ids = [f'sensor.replay_{index}' for index in range(entities)]
+    weights = [1.0 / (index + 1) for index in range(entities)]
+    received_at = time.time()
+    capture: List[Tuple[float, Any]] = []
+    for index in range(count):
+        received_at += rng.expovariate(rate)
+        entity_id = rng.choices(entity_ids, weights)[0]
+        capture.append((received_at, {
+            'entity_id': entity_id,
+            'new_state': {'state': str(index), 'attributes': {'friendly_name': entity_id}}
+        }))
+    return capture
+
+def replay(capture: List[Tuple[float, Any]], speed: Optional[float], send_latency: float,
+           drain_timeout: float) -> Dict[str, Any]:
+    """Replay a capture once through a fresh webhook server and message processor"""
+    from config import Config
+    from message_processor import MessageProcessor
+    from webhook_server import WebhookServer
+
+    config = Config()
+    message_queue: queue.Queue = queue.Queue(maxsize=config.max_queue_size)
+    stub = StubNostrClient(send_latency)
+    processor = MessageProcessor(config, message_queue, stub)
+    server = WebhookServer(config, message_queue)
+    # Replays must not append to the capture they are reading
+    server.capture = None
+    client = server.app.test_client()
+    payloads = [json.dumps(payload) for _, payload in capture]
+
+    accepted_at: List[float] = []
+    statuses: Dict[str, int] = {}
+    processor.start()
+    try:
+        first_received = capture[0][0]
+        start = time.monotonic()
+        for (received_at, _), payload in zip(capture, payloads):
+            if speed:
+                delay = start + (received_at - first_received) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            status = client.post('/webhook', data=payload, content_type='application/json').status_code
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                accepted_at.append(time.monotonic())
+        send_duration = time.monotonic() - start
+
+        last_accepted = accepted_at[-1] if accepted_at else start
+        wait_until(lambda: stub.sent and stub.sent[-1][0] >= last_accepted, drain_timeout)
+        total_duration = time.monotonic() - start
+    finally:
+        processor.stop()
+
+    # Only alerts after the first accepted webhook count; startup may send nothing else
+    alerts = [sent_at for sent_at, _ in stub.sent if accepted_at and sent_at >= accepted_at[0]]
+    latency: List[float] = []
+    undelivered = 0
+    for sent_at in accepted_at:
+        index = bisect.bisect_left(alerts, sent_at)
+        if index < len(alerts):
+            latency.append(alerts[index] - sent_at)
+        else:
+            undelivered += 1
+
+    return {
+        'speed': f"{speed:g}x" if speed else 'max',
+        'webhooks': len(capture),
+        'accepted': len(accepted_at),
+        'statuses': statuses,
+        'send_seconds': send_duration,
+        'total_seconds': total_duration,
+        'accepted_per_s': len(accepted_at) / send_duration if send_duration else 0.0,
+        'alerts': len(alerts),
+        'coalescing_ratio': len(accepted_at) / max(1, len(alerts)),
+        'undelivered': undelivered,
+        'latency': percentiles(latency)
+    }
+
+def parse_speed(value: str) -> Optional[float]:
+    if value == 'max':
+        return None
+    speed = float(value.rstrip('x'))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay captured webhooks against a stub Nostr client')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--capture', help='Capture file written by the capture option')
+    source.add_argument('--synthesize', type=int, metavar='COUNT', help='Replay COUNT synthetic webhooks instead')
+    parser.add_argument('--speeds', type=parse_speed, nargs='+', default=[1.0, 10.0, None],
+                        help="Replay speed factors, e.g. 1 10 max (default: 1 10 max)")
+    parser.add_argument('--config', help='Config YAML to replay with (default: monitor every captured entity)')
+    parser.add_argument('--queue-size', type=int, default=5, help='Webhook queue size of the generated config')
+    parser.add_argument('--entities', type=int, default=20, help='Distinct entities in a synthesized capture')
+    parser.add_argument('--rate', type=float, default=20.0, help='Mean webhooks per second of a synthesized capture')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='Seconds each stub send_dm takes')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='Service log level; per-event INFO logging slows the replay down')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level)
+
+    capture = list(read_capture(args.capture)) if args.capture \
+        else synthesize(args.synthesize, args.entities, args.rate)
+    if not capture:
+        raise SystemExit("Capture is empty")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = args.config
+        if config_path is None:
+            entities = sorted({payload['entity_id'] for _, payload in capture
+                               if isinstance(payload, dict) and isinstance(payload.get('entity_id'), str)})
+            config_path = os.path.join(tmp_dir, 'config.yaml')
+            write_config(config_path, ['ws://127.0.0.1:7777'], entities=entities, max_queue_size=args.queue_size)
+        use_config(config_path)
+        results = [replay(capture, speed, args.send_latency, args.drain_timeout) for speed in args.speeds]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    fmt = lambda value: f"{value * 1000:.1f}" if value is not None else "n/a"
+    print(f"{'speed':>7}{'webhooks':>10}{'accepted':>10}{'acc/s':>10}{'alerts':>8}{'coalesce':>10}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'undeliv':>9}")
+    for result in results:
+        latency = result['latency']
+        print(f"{result['speed']:>7}{result['webhooks']:>10}{result['accepted']:>10}"
+              f"{result['accepted_per_s']:>10.1f}{result['alerts']:>8}{result['coalescing_ratio']:>10.1f}"
+              f"{fmt(latency['p50']):>9}{fmt(latency['p90']):>9}{fmt(latency['p99']):>9}"
+              f"{fmt(latency['max']):>9}{result['undelivered']:>9}")
+
+if __name__ == "__main__":
+    main()
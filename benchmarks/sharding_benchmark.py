@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Dispatch worker scaling benchmark
+
+Feeds a steady stream of entity updates straight into MessageProcessor with a
+stub Nostr client that takes --publish-latency seconds per DM, and reports DM
+throughput, update-to-DM latency and per-entity ordering (within the DMs of the
+worker owning the entity) for each worker count.
+
+Usage:
+    python benchmarks/sharding_benchmark.py --workers 1 2 4 8 --entities 64 --rate 50 --duration 20
+"""
+import argparse
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from load_benchmark import percentiles
+from startup_benchmark import SRC_DIR, use_config, write_config
+from stub_nostr import StubNostrClient
+
+sys.path.insert(0, SRC_DIR)
+
+from config import Config  # noqa: E402
+from message_processor import MessageProcessor  # noqa: E402
+
+def run(workers: int, entities: List[str], rate: float, duration: float, publish_latency: float,
+        queue_size: int) -> Dict[str, object]:
+    """Run one load shape against a MessageProcessor with the given worker count"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'config.yaml')
+        write_config(config_path, ['wss://relay.example.com'], entities=entities, max_queue_size=queue_size,
+                     extra_sections={'dispatch': {'workers': workers, 'min_send_interval': 0}})
+        use_config(config_path)
+        config = Config()
+
+    message_queue: queue.Queue = queue.Queue()
+    client = StubNostrClient(publish_latency)
+    processor = MessageProcessor(config, message_queue, client)
+    processor.start()
+
+    # sequence -> time it was queued, per entity
+    queued_at: Dict[str, Dict[int, float]] = {entity_id: {} for entity_id in entities}
+    start = time.monotonic()
+    sequence = 0
+    while time.monotonic() - start < duration:
+        entity_id = entities[sequence % len(entities)]
+        queued_at[entity_id][sequence] = time.monotonic()
+        message_queue.put({'entity_id': entity_id, 'new_state': {'state': str(sequence), 'attributes': {}}})
+        sequence += 1
+        time.sleep(1.0 / rate)
+
+    # Let the workers drain
+    time.sleep(2 + publish_latency * 2)
+    processor.stop()
+
+    # Parse "<entity>: <sequence>" lines back out of the DMs. Every DM lists all entities, but only
+    # those of the sending worker's partition are ordered; the others are a snapshot of another worker
+    latencies: List[float] = []
+    last_seen: Dict[str, int] = {}
+    order_violations = 0
+    for (sent_at, message), sender in zip(client.sent, client.senders):
+        worker_index = int(sender.rsplit('-', 1)[1])
+        for line in message.splitlines()[1:]:
+            entity_id, _, value = line.rpartition(': ')
+            if entity_id not in queued_at or processor.partition_for(entity_id) != worker_index:
+                continue
+            seq = int(value)
+            if seq < last_seen.get(entity_id, -1):
+                order_violations += 1
+            if seq != last_seen.get(entity_id):
+                latencies.append(sent_at - queued_at[entity_id][seq])
+            last_seen[entity_id] = seq
+
+    return {
+        'updates': sequence,
+        'dms': len(client.sent),
+        'dm_rate': len(client.sent) / duration,
+        'latency': percentiles(latencies),
+        'order_violations': order_violations
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure dispatch throughput vs worker count')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--entities', type=int, default=64)
+    parser.add_argument('--rate', type=float, default=50.0, help='Updates per second')
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--publish-latency', type=float, default=0.5)
+    parser.add_argument('--queue-size', type=int, default=1000,
+                        help='queue.max_size; also bounds each worker queue, so keep it above one second of updates')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    entities = [f'sensor.shard_{index}' for index in range(args.entities)]
+    print(f"{'workers':>7} {'updates':>8} {'DMs':>6} {'DM/s':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'order':>6}")
+    for workers in args.workers:
+        result = run(workers, entities, args.rate, args.duration, args.publish_latency, args.queue_size)
+        latency = result['latency']
+        fmt = lambda value: f"{value:.2f}s" if value is not None else 'n/a'
+        print(f"{workers:>7} {result['updates']:>8} {result['dms']:>6} {result['dm_rate']:>7.2f} "
+              f"{fmt(latency['p50']):>8} {fmt(latency['p90']):>8} {fmt(latency['p99']):>8} "
+              f"{result['order_violations']:>6}")
+
+if __name__ == "__main__":
+    main()
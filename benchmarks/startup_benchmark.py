@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for HA Nostr Alert
+
+Starts the service as a subprocess and measures:
+- time-to-first-accepted-webhook: until POST /webhook returns 200
+- time-to-first-DM: until the first consolidated alert is reported as sent
+
+Relay state and the config snapshot are persisted next to the config, so every
+run after the first is a warm restart; pass --cold to discard them before each run.
+
+Usage:
+    python benchmarks/startup_benchmark.py --relay wss://relay.damus.io --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+ENTITY_ID = 'input_text.benchmark'
+DM_SENT_MARKER = 'Sent consolidated alert successfully'
+
+def write_config(path: str, relay_urls: List[str], recipient_npub: str = '', private_key: str = '',
+                 entities: Optional[List[str]] = None, max_queue_size: int = 5,
+                 extra_sections: Optional[Dict[str, Any]] = None) -> None:
+    """Write a minimal YAML config monitoring the benchmark entities"""
+    import yaml
+    entities = entities or [ENTITY_ID]
+    config = {
+        'nostr': {
+            'relay_urls': relay_urls,
+            'recipient_npub': recipient_npub,
+            'private_key': private_key
+        },
+        'alerts': {
+            'monitored_entities': entities,
+            'consolidated_entities': entities
+        },
+        'queue': {'max_size': max_queue_size},
+        'relay_state': {'path': os.path.join(os.path.dirname(os.path.abspath(path)), 'relay_state.json')}
+    }
+    config.update(extra_sections or {})
+    with open(path, 'w') as file:
+        yaml.dump(config, file, default_flow_style=False)
+
+def snapshot_path(config_path: str) -> str:
+    """Config snapshot kept next to the benchmark config instead of the add-on's /data"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), 'config_snapshot.json')
+
+def use_config(config_path: str) -> None:
+    """Point Config() in this process at config_path and its snapshot"""
+    os.environ['CONFIG_PATH'] = config_path
+    os.environ['CONFIG_SNAPSHOT_PATH'] = snapshot_path(config_path)
+
+def service_env(config_path: str, port: int) -> Dict[str, str]:
+    """Environment of a main.py subprocess serving webhooks on port with config_path"""
+    return dict(os.environ, CONFIG_PATH=config_path, CONFIG_SNAPSHOT_PATH=snapshot_path(config_path),
+                WEBHOOK_PORT=str(port))
+
+def post_webhook(port: int, entity_id: str = ENTITY_ID, state: str = 'on') -> Optional[int]:
+    """POST a single state change, returning the HTTP status or None if the port is not bound"""
+    payload = json.dumps({
+        'entity_id': entity_id,
+        'new_state': {'state': state, 'attributes': {'friendly_name': entity_id}}
+    }).encode()
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/webhook', data=payload,
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=1.0) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None
+
+def run_once(config_path: str, port: int, timeout: float) -> Dict[str, Optional[float]]:
+    """Start the service once and time the startup milestones"""
+    env = service_env(config_path, port)
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-u', 'main.py'], cwd=SRC_DIR, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    result: Dict[str, Optional[float]] = {'first_webhook': None, 'first_dm': None}
+    dm_sent = threading.Event()
+
+    def watch_output() -> None:
+        for line in process.stdout:
+            if DM_SENT_MARKER in line and not dm_sent.is_set():
+                result['first_dm'] = time.monotonic() - start
+                dm_sent.set()
+
+    watcher = threading.Thread(target=watch_output, daemon=True)
+    watcher.start()
+
+    try:
+        while time.monotonic() - start < timeout:
+            if post_webhook(port) == 200:
+                result['first_webhook'] = time.monotonic() - start
+                break
+            time.sleep(0.01)
+        dm_sent.wait(max(0.0, timeout - (time.monotonic() - start)))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+def summarize(name: str, values: List[Optional[float]]) -> None:
+    """Print min/median/max of the successful measurements"""
+    measured = [value for value in values if value is not None]
+    if not measured:
+        print(f"{name}: no successful measurements")
+        return
+    print(f"{name}: min={min(measured):.3f}s median={statistics.median(measured):.3f}s "
+          f"max={max(measured):.3f}s ({len(measured)}/{len(values)} runs)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure HA Nostr Alert startup latency')
+    parser.add_argument('--relay', action='append', dest='relays', help='Relay URL (repeatable)')
+    parser.add_argument('--recipient-npub', default='')
+    parser.add_argument('--private-key', default='')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--cold', action='store_true',
+                        help='Discard persisted relay state and config snapshot before each run')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'config.yaml')
+        write_config(config_path, args.relays or ['wss://relay.damus.io'], args.recipient_npub, args.private_key)
+
+        state_paths = [os.path.join(tmp_dir, 'relay_state.json'), snapshot_path(config_path)]
+        results = []
+        for _ in range(args.runs):
+            for state_path in state_paths:
+                if args.cold and os.path.exists(state_path):
+                    os.remove(state_path)
+            results.append(run_once(config_path, args.port, args.timeout))
+
+    summarize('time-to-first-accepted-webhook', [result['first_webhook'] for result in results])
+    summarize('time-to-first-DM', [result['first_dm'] for result in results])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Stub Nostr client for in-process benchmarks
+
+Stands in for NostrClient in benchmarks that drive MessageProcessor directly,
+so the numbers reflect dispatch and not relays.
+"""
+import asyncio
+import threading
+import time
+from typing import List, Optional, Tuple
+
+class StubNostrClient:
+    """Records each DM with the time it was sent, after a simulated publish latency, and returns a fake event id"""
+
+    def __init__(self, publish_latency: float = 0.0) -> None:
+        self.publish_latency = publish_latency
+        self.sent: List[Tuple[float, str]] = []
+        # Name of the thread each DM was sent from, in the order of sent
+        self.senders: List[str] = []
+        self._lock = threading.Lock()
+
+    async def send_dm(self, message: str, recipient: Optional[str] = None) -> Optional[str]:
+        if self.publish_latency:
+            await asyncio.sleep(self.publish_latency)
+        with self._lock:
+            self.sent.append((time.monotonic(), message))
+            self.senders.append(threading.current_thread().name)
+            return f"stub-{len(self.sent)}"
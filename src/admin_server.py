@@ -0,0 +1,146 @@
+"""
+Authenticated admin API for live introspection and runtime control
+
+Served by its own Flask server on a separate port and thread, so admin
+traffic never queues behind (or in front of) Home Assistant webhooks.
+"""
+from flask import Flask, request, jsonify
+import asyncio
+import hmac
+import logging
+import time
+from typing import Any, Coroutine, Optional
+from exceptions import RelayConnectionError
+from tracing import get_tracing_stats
+
+logger = logging.getLogger(__name__)
+
+# Seconds an admin request may wait on the Nostr event loop
+ACTION_TIMEOUT = 30.0
+
+class AdminServer:
+    def __init__(self, config: Any, message_processor: Any, cluster: Any = None):
+        self.app: Flask = Flask(__name__)
+        self.config = config
+        self.token: str = config.admin_config.get('token', '')
+        self.message_processor = message_processor
+        self.cluster = cluster
+        self.nostr_client: Any = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.started_at = time.time()
+        self.setup_routes()
+
+    def set_nostr_client(self, nostr_client: Any, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach the Nostr client and the event loop its relay connections live on"""
+        self.nostr_client = nostr_client
+        self.loop = loop
+
+    def setup_routes(self) -> None:
+        """Set up Flask routes, all behind bearer token authentication"""
+        self.app.before_request(self.authenticate)
+        self.app.add_url_rule('/admin/status', 'status', self.status, methods=['GET'])
+        self.app.add_url_rule('/admin/relays', 'relays', self.relays, methods=['GET'])
+        self.app.add_url_rule('/admin/entities', 'entities', self.entities, methods=['GET'])
+        self.app.add_url_rule('/admin/drain', 'drain', self.drain, methods=['POST'])
+        self.app.add_url_rule('/admin/pause', 'pause', self.pause, methods=['POST'])
+        self.app.add_url_rule('/admin/resume', 'resume', self.resume, methods=['POST'])
+        self.app.add_url_rule('/admin/relays/active', 'switch_relay', self.switch_relay, methods=['POST'])
+        self.app.add_url_rule('/admin/relays/reconnect', 'reconnect_relay', self.reconnect_relay, methods=['POST'])
+
+    def authenticate(self):
+        """Reject requests without `Authorization: Bearer <admin.token>`"""
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+            logger.warning(f"Rejected unauthenticated admin request from {request.remote_addr}")
+            return jsonify({"status": "error", "message": "Unauthorized"}), 401
+        return None
+
+    def _on_nostr_loop(self, coroutine: Coroutine) -> Any:
+        """Run a coroutine on the Nostr client's event loop and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout=ACTION_TIMEOUT)
+        except TimeoutError:
+            # Don't leave the action running on the Nostr loop after the request gave up
+            future.cancel()
+            raise
+
+    def _client_not_ready(self):
+        return jsonify({"status": "error", "message": "Nostr client not ready"}), 503
+
+    def status(self):
+        """Dispatch state, queue and outbox depth, active relay and delivery/tracing counters"""
+        result = {
+            "status": "ok",
+            "uptime": time.time() - self.started_at,
+            "dispatch": self.message_processor.status(),
+            "cluster": self.cluster.status() if self.cluster else None,
+            "tracing": get_tracing_stats(),
+            "active_relay": None,
+            "delivery": None
+        }
+        if self.nostr_client is not None:
+            result["active_relay"] = self.nostr_client.active_relay
+            result["delivery"] = self.nostr_client.get_delivery_stats()
+        return jsonify(result), 200
+
+    def relays(self):
+        """Relay pool state, read on the Nostr loop so it is consistent"""
+        if self.nostr_client is None:
+            return self._client_not_ready()
+
+        async def snapshot() -> Any:
+            return self.nostr_client.get_pool_state()
+        return jsonify({"status": "ok", **self._on_nostr_loop(snapshot())}), 200
+
+    def entities(self):
+        """Per-entity latest update and latest alert times (unix seconds)"""
+        return jsonify({"status": "ok", "entities": self.message_processor.entity_times()}), 200
+
+    def drain(self):
+        self.message_processor.drain()
+        return jsonify({"status": "ok", "message": "Buffered alerts are being sent"}), 200
+
+    def pause(self):
+        self.message_processor.pause()
+        return jsonify({"status": "ok", "paused": True}), 200
+
+    def resume(self):
+        self.message_processor.resume()
+        return jsonify({"status": "ok", "paused": False}), 200
+
+    def _relay_action(self, action: str):
+        if self.nostr_client is None:
+            return self._client_not_ready()
+        data = request.get_json(silent=True)
+        relay_url = data.get('relay_url') if isinstance(data, dict) else None
+        if not isinstance(relay_url, str) or not relay_url:
+            return jsonify({"status": "error", "message": "Missing 'relay_url'"}), 400
+
+        try:
+            if action == 'switch':
+                done = self._on_nostr_loop(self.nostr_client.switch_active_relay(relay_url))
+            else:
+                done = self._on_nostr_loop(self.nostr_client.reconnect_relay(relay_url))
+        except RelayConnectionError as e:
+            return jsonify({"status": "error", "message": str(e)}), 404
+        except TimeoutError:
+            return jsonify({"status": "error", "message": f"Timed out waiting for {relay_url}"}), 504
+
+        logger.info(f"Admin {action} of relay {relay_url}: {'succeeded' if done else 'failed'}")
+        if not done:
+            return jsonify({"status": "error", "message": f"Could not connect to {relay_url}"}), 502
+        return jsonify({"status": "ok", "active_relay": self.nostr_client.active_relay}), 200
+
+    def switch_relay(self):
+        """Make the posted relay_url the active relay"""
+        return self._relay_action('switch')
+
+    def reconnect_relay(self):
+        """Reconnect the posted relay_url"""
+        return self._relay_action('reconnect')
+
+    def run(self, host: str = '127.0.0.1', port: int = 5001) -> None:
+        """Run the admin server"""
+        logger.info(f"Starting admin API on {host}:{port}")
+        self.app.run(host=host, port=port, debug=False)
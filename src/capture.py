@@ -0,0 +1,95 @@
+"""
+Capture of incoming webhook payloads for offline replay
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class WebhookCapture:
+    """Appends received webhook payloads with their arrival time as NDJSON
+
+    Each line is {"t": unix seconds, "p": payload}. Lines are written from a
+    background thread so capturing never blocks the webhook handler; payloads
+    arriving while max_queue lines are waiting to be written are dropped.
+    """
+
+    def __init__(self, capture_config: Dict[str, Any]) -> None:
+        self.path: str = capture_config.get('path', '/data/webhook_capture.ndjson')
+        self.max_file_size: int = capture_config.get('max_file_size', 50 * 1024 * 1024)
+        self.flush_interval: float = capture_config.get('flush_interval', 1)
+        self.stats: Dict[str, int] = {'captured': 0, 'dropped': 0, 'write_errors': 0}
+        # record() runs on the webhook handler threads, flush() on the writer thread and at stop
+        self._stats_lock = threading.Lock()
+        # stop() flushes too, possibly while a writer thread that outlived its join is still writing
+        self._write_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=capture_config.get('max_queue', 10000))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="webhook-capture", daemon=True)
+        self._thread.start()
+        logger.info(f"Capturing webhooks to {self.path}")
+
+    def record(self, payload: Any) -> None:
+        """Queue a payload as received, before validation or filtering"""
+        try:
+            self._queue.put_nowait((time.time(), payload))
+        except queue.Full:
+            with self._stats_lock:
+                self.stats['dropped'] += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything queued so far"""
+        with self._write_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        lines: List[str] = []
+        while True:
+            try:
+                received_at, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            lines.append(json.dumps({'t': received_at, 'p': payload}, separators=(',', ':')))
+        if not lines:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.max_file_size and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_file_size:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, 'a') as file:
+                file.write("\n".join(lines) + "\n")
+            with self._stats_lock:
+                self.stats['captured'] += len(lines)
+        except OSError as e:
+            with self._stats_lock:
+                self.stats['write_errors'] += 1
+            logger.warning(f"Could not write {len(lines)} captured webhook(s) to {self.path}: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+def read_capture(path: str) -> Iterator[Tuple[float, Any]]:
+    """Yield (received_at, payload) from a capture file, skipping malformed lines"""
+    with open(path, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                yield float(entry['t']), entry['p']
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Skipping malformed capture line {line_number} in {path}")
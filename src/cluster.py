@@ -0,0 +1,304 @@
+"""
+Active-active clustering: shared SQLite outbox with lease-based leader election
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sent outbox rows are kept this long for deduplication and inspection
+OUTBOX_RETENTION = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leader (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    node_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_hash TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    node_id TEXT NOT NULL,
+    sent_at REAL,
+    event_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_hash ON outbox (content_hash, created_at);
+CREATE INDEX IF NOT EXISTS outbox_unsent ON outbox (sent_at, id);
+"""
+
+def content_hash(content: str) -> str:
+    """Hash alert content for cross-node deduplication"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+class ClusterCoordinator:
+    def __init__(self, config: Any, nostr_client: Any = None) -> None:
+        cluster_config: Dict[str, Any] = config.cluster_config
+        self.db_path: str = cluster_config.get('db_path', '/share/ha_nostr_alert/cluster.db')
+        self.node_id: str = cluster_config.get('node_id') or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl: float = cluster_config.get('lease_ttl', 10)
+        self.dedupe_window: float = cluster_config.get('dedupe_window', 60)
+        # Outbox rows claimed and sent together with NostrClient.send_many
+        self.batch_size: int = config.batch_config.get('max_concurrency', 16)
+        self.nostr_client = nostr_client
+        # content hash -> (identical alerts enqueued in a row, time of the latest), see enqueue()
+        self._occurrences: Dict[str, Tuple[int, float]] = {}
+        # Event loop owning the Nostr client's connections; sends are submitted to it
+        self.nostr_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.is_leader = False
+        self.running = False
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; rollback journal rather than WAL so it works on shared volumes"""
+        connection = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+        connection.execute("PRAGMA busy_timeout = 5000")
+        return connection
+
+    def _init_db(self) -> None:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.executescript(SCHEMA)
+            # Outboxes created before rows were claimed
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(outbox)")}
+            for column, column_type in (('claimed_by', 'TEXT'), ('claimed_at', 'REAL')):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE outbox ADD COLUMN {column} {column_type}")
+        logger.info(f"Cluster node {self.node_id} using shared store {self.db_path}")
+
+    def set_nostr_client(self, nostr_client: Any, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Attach the Nostr client used when this node is the dispatcher, and the loop it runs on"""
+        self.nostr_loop = loop
+        self.nostr_client = nostr_client
+        self._wakeup.set()
+
+    def _occurrence(self, digest: str, now: float) -> int:
+        """Number of this content in the current run of identical alerts enqueued by this node"""
+        count, last = self._occurrences.get(digest, (0, 0.0))
+        count = count + 1 if now - last < self.dedupe_window else 1
+        self._occurrences[digest] = (count, now)
+        if len(self._occurrences) > 1024:
+            self._occurrences = {key: value for key, value in self._occurrences.items()
+                                 if now - value[1] < self.dedupe_window}
+        return count
+
+    def enqueue(self, message: str, dedupe_content: Optional[str] = None) -> bool:
+        """Add an alert to the shared outbox unless another node already queued it within the dedupe window
+
+        The n-th identical alert of this node only matches another node's n-th, so a
+        state that really changes back and forth within the window is still sent.
+        """
+        content = dedupe_content if dedupe_content is not None else message
+        now = time.time()
+        digest = content_hash(f"{self._occurrence(content_hash(content), now)}:{content}")
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            duplicate = connection.execute(
+                "SELECT id FROM outbox WHERE content_hash = ? AND created_at > ? LIMIT 1",
+                (digest, now - self.dedupe_window)
+            ).fetchone()
+            if duplicate:
+                connection.execute("COMMIT")
+                logger.info(f"Skipping duplicate alert {digest[:12]} (already queued as #{duplicate[0]})")
+                return False
+            connection.execute(
+                "INSERT INTO outbox (content_hash, message, created_at, node_id) VALUES (?, ?, ?, ?)",
+                (digest, message, now, self.node_id)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        self._wakeup.set()
+        return True
+
+    def try_acquire_lease(self) -> bool:
+        """Take or renew the dispatcher lease; returns whether this node is the leader"""
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT node_id, expires_at FROM leader WHERE id = 1").fetchone()
+            if row is None or row[0] == self.node_id or row[1] < now:
+                connection.execute(
+                    "INSERT INTO leader (id, node_id, expires_at) VALUES (1, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET node_id = excluded.node_id, expires_at = excluded.expires_at",
+                    (self.node_id, now + self.lease_ttl)
+                )
+                leader = True
+            else:
+                leader = False
+            connection.execute("COMMIT")
+        except Exception as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            logger.error(f"Error acquiring cluster lease: {e}")
+            leader = False
+        finally:
+            connection.close()
+
+        if leader != self.is_leader:
+            logger.info(f"Cluster node {self.node_id} is now {'leader' if leader else 'standby'}")
+        self.is_leader = leader
+        return leader
+
+    def release_lease(self) -> None:
+        """Give up the lease so a standby can take over immediately"""
+        with closing(self._connect()) as connection:
+            connection.execute("DELETE FROM leader WHERE id = 1 AND node_id = ?", (self.node_id,))
+        self.is_leader = False
+
+    def _claim(self, limit: int = 1) -> List[Tuple[int, str]]:
+        """Claim the next unsent rows for this node while it holds the lease, so no other node sends them
+
+        A claim is only valid while its node holds the lease: rows claimed by a
+        node that lost the lease (say it died mid-send) are claimed again by the
+        next leader.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            leader = connection.execute("SELECT node_id, expires_at FROM leader WHERE id = 1").fetchone()
+            if leader is None or leader[0] != self.node_id or leader[1] < now:
+                connection.execute("COMMIT")
+                return []
+            rows = connection.execute(
+                "SELECT id, message FROM outbox WHERE sent_at IS NULL AND (claimed_by IS NULL "
+                "OR claimed_by NOT IN (SELECT node_id FROM leader WHERE id = 1 AND expires_at >= ?) "
+                "OR claimed_by = ?) ORDER BY id LIMIT ?",
+                (now, self.node_id, limit)
+            ).fetchall()
+            connection.executemany("UPDATE outbox SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                                   [(self.node_id, now, outbox_id) for outbox_id, _ in rows])
+            connection.execute("COMMIT")
+            return rows
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def _mark(self, outbox_id: int, event_id: Optional[str]) -> None:
+        """Record a send attempt of a row this node claimed; a failed row is released for retry"""
+        with closing(self._connect()) as connection:
+            if event_id:
+                updated = connection.execute(
+                    "UPDATE outbox SET sent_at = ?, event_id = ?, attempts = attempts + 1, claimed_by = NULL "
+                    "WHERE id = ? AND claimed_by = ?", (time.time(), event_id, outbox_id, self.node_id)
+                ).rowcount
+                if not updated:
+                    logger.warning(f"Claim on outbox alert #{outbox_id} was taken over while it was being sent, "
+                                   "it may be delivered twice")
+            else:
+                connection.execute(
+                    "UPDATE outbox SET attempts = attempts + 1, claimed_by = NULL, claimed_at = NULL "
+                    "WHERE id = ? AND claimed_by = ?", (outbox_id, self.node_id)
+                )
+
+    def _prune(self) -> None:
+        with closing(self._connect()) as connection:
+            connection.execute("DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?",
+                               (time.time() - OUTBOX_RETENTION,))
+
+    async def _dispatch_pending(self) -> None:
+        """Send unsent outbox rows in batches, renewing the lease and claiming each batch just before its send"""
+        while self.running and self.try_acquire_lease():
+            claimed = self._claim(self.batch_size)
+            if not claimed:
+                return
+            event_ids = await self._send_under_lease([message for _, message in claimed])
+            for (outbox_id, _), event_id in zip(claimed, event_ids):
+                self._mark(outbox_id, event_id)
+            failed = [outbox_id for (outbox_id, _), event_id in zip(claimed, event_ids) if not event_id]
+            if failed:
+                logger.error(f"Failed to dispatch outbox alert(s) {', '.join(f'#{i}' for i in failed)}, will retry")
+                return
+
+    async def _send_under_lease(self, messages: List[str]) -> List[Optional[str]]:
+        """Send a batch, renewing the lease (and so the claims) while slow sends or failover run"""
+        send = asyncio.ensure_future(self._send_many(messages))
+        while True:
+            done, _ = await asyncio.wait({send}, timeout=self.lease_ttl / 3)
+            if done:
+                return send.result()
+            self.try_acquire_lease()
+
+    async def _send_many(self, messages: List[str]) -> List[Optional[str]]:
+        items = [(None, message) for message in messages]
+        if self.nostr_loop is None:
+            return await self.nostr_client.send_many(items)
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self.nostr_client.send_many(items), self.nostr_loop))
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        last_prune = 0.0
+        while self.running:
+            try:
+                if self.try_acquire_lease() and self.nostr_client is not None:
+                    loop.run_until_complete(self._dispatch_pending())
+                    if time.time() - last_prune > 3600:
+                        self._prune()
+                        last_prune = time.time()
+            except Exception as e:
+                logger.error(f"Error in cluster dispatcher: {e}")
+            # Renew well inside the lease so a healthy leader never lapses
+            self._wakeup.wait(self.lease_ttl / 3)
+            self._wakeup.clear()
+        loop.close()
+
+    def start(self) -> None:
+        """Start lease renewal and outbox dispatch"""
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="cluster-dispatcher")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"Started cluster coordinator (lease_ttl={self.lease_ttl}s)")
+
+    def stop(self) -> None:
+        """Stop dispatching and release the lease"""
+        self.running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+        try:
+            self.release_lease()
+        except Exception as e:
+            logger.error(f"Error releasing cluster lease: {e}")
+        logger.info("Stopped cluster coordinator")
+
+    def status(self) -> Dict[str, Any]:
+        """Return leader and outbox depth information"""
+        with closing(self._connect()) as connection:
+            leader = connection.execute("SELECT node_id, expires_at FROM leader WHERE id = 1").fetchone()
+            unsent = connection.execute("SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL").fetchone()[0]
+        return {
+            'node_id': self.node_id,
+            'is_leader': self.is_leader,
+            'leader': leader[0] if leader else None,
+            'lease_expires_at': leader[1] if leader else None,
+            'outbox_unsent': unsent
+        }
@@ -6,33 +6,159 @@ import json
 import os
 import logging
 import re
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, FrozenSet, List, Any, Optional, Union
+from urllib.parse import urlparse
+from config_snapshot import ConfigSnapshotStore, snapshot_key
 from exceptions import ConfigurationError, ValidationError
+from rules import RuleSet
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compiled configuration reused while options.json / the YAML file are unchanged
+CONFIG_SNAPSHOT_PATH = '/data/config_snapshot.json'
+
+# Hosts allowed to use unencrypted ws:// relay URLs
+LOCAL_RELAY_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+# Optional sections and their defaults, merged into both HA options and YAML configs
+SECTION_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'key_pool': {
+        'enabled': True,
+        'size': 16,
+        'low_water': 4
+    },
+    'batch': {
+        'max_concurrency': 16
+    },
+    'dispatch': {
+        'workers': 1,
+        'min_send_interval': 0
+    },
+    'cluster': {
+        'enabled': False,
+        'db_path': '/share/ha_nostr_alert/cluster.db',
+        'node_id': '',
+        'lease_ttl': 10,
+        'dedupe_window': 60
+    },
+    'digest': {
+        'entities': [],
+        'windows': [1, 5, 15],
+        'interval': 5,
+        'bucket_seconds': 60
+    },
+    'relay_state': {
+        'enabled': True,
+        'path': '/data/relay_state.json',
+        'backoff_base': 30,
+        'backoff_max': 3600
+    },
+    'relay_info': {
+        'enabled': True,
+        'ttl': 86400,
+        'timeout': 5
+    },
+    'inbox_relays': {
+        'enabled': True,
+        'ttl': 3600,
+        'max_relays': 3,
+        'timeout': 5
+    },
+    'delivery': {
+        'verify': False,
+        'deadline': 10,
+        'max_republish': 1,
+        'verify_relays': []
+    },
+    'logging': {
+        'level': 'INFO',
+        'format': 'text',
+        'per_event_sample_rate': 1,
+        'per_event_max_per_second': 0
+    },
+    'payload': {
+        'format': 'lines',
+        'line_width': 512
+    },
+    'admin': {
+        'enabled': False,
+        'host': '127.0.0.1',
+        'port': 5001,
+        'token': ''
+    },
+    'tracing': {
+        'sample_rate': 0,
+        'exporter': 'file',
+        'path': '/data/traces.jsonl',
+        'max_file_size': 10 * 1024 * 1024,
+        'otlp_endpoint': 'http://localhost:4318/v1/traces',
+        'export_interval': 5,
+        'max_queue': 2048
+    },
+    'capture': {
+        'enabled': False,
+        'path': '/data/webhook_capture.ndjson',
+        'max_file_size': 50 * 1024 * 1024,
+        'flush_interval': 1,
+        'max_queue': 10000
+    }
+}
+
+LOG_FORMATS = ('text', 'json')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+TRACE_EXPORTERS = ('file', 'otlp')
+PAYLOAD_FORMATS = ('lines', 'compact', 'auto')
+MIN_ADMIN_TOKEN_LENGTH = 16
+
 class Config:
     def __init__(self, config_path: str = '/config.yaml'):
         # Allow overriding config path through environment variable for testing
         self.config_path = os.environ.get('CONFIG_PATH', config_path)
+        self.snapshot_store = ConfigSnapshotStore(os.environ.get('CONFIG_SNAPSHOT_PATH', CONFIG_SNAPSHOT_PATH))
+        # True when the validated config came from the snapshot instead of being parsed and validated
+        self.from_snapshot = False
+        self.indexes: Dict[str, List[str]] = {}
+        self._entity_sets: Dict[str, FrozenSet[str]] = {}
         self.config = self.load_config()
     
     def load_config(self) -> Dict[str, Any]:
-        """Load configuration from Home Assistant add-on options or YAML file"""
+        """Load configuration from Home Assistant add-on options or YAML file
+
+        Parsing and validation are skipped when a snapshot compiled from the
+        exact same file contents (and add-on code) exists.
+        """
         # First check if we're in Home Assistant add-on environment
         if os.path.exists('/data/options.json'):
             logger.info("Loading configuration from Home Assistant add-on options")
-            return self.load_ha_config()
+            source_path, load = '/data/options.json', self.load_ha_config
+        elif os.path.exists(self.config_path):
+            logger.info("Loading configuration from YAML file")
+            source_path, load = self.config_path, self.load_yaml_config
         else:
             logger.info("Loading configuration from YAML file")
             return self.load_yaml_config()
+        
+        with open(source_path, 'rb') as file:
+            source = file.read()
+        key = snapshot_key(source)
+        snapshot = self.snapshot_store.load(key)
+        if snapshot is not None:
+            logger.info("Using validated configuration snapshot")
+            self.from_snapshot = True
+            self.indexes = snapshot['indexes']
+            return snapshot['config']
+        
+        config = load(source)
+        self.indexes = self.build_indexes(config)
+        self.snapshot_store.save(key, config, self.indexes)
+        return config
     
-    def load_ha_config(self) -> Dict[str, Any]:
-        """Load configuration from Home Assistant add-on options"""
-        with open('/data/options.json', 'r') as file:
-            options: Dict[str, Any] = json.load(file)
+    def load_ha_config(self, source: Optional[bytes] = None) -> Dict[str, Any]:
+        """Load configuration from Home Assistant add-on options (source: raw options.json, if already read)"""
+        if source is None:
+            with open('/data/options.json', 'rb') as file:
+                source = file.read()
+        options: Dict[str, Any] = json.loads(source)
         
         # Handle backward compatibility for single relay_url
         relay_urls: List[str] = options.get('relay_urls')
@@ -52,6 +178,7 @@ class Config:
                 'monitored_entities': options.get('monitored_entities', []),
                 'consolidated_entities': options.get('consolidated_entities', [])
             },
+            'rules': options.get('rules', []),
             'queue': {
                 'max_size': 5  # Default value
             },
@@ -61,14 +188,15 @@ class Config:
                 'retry_backoff_factor': 2
             }
         }
+        self.apply_section_defaults(config, options)
         
         # Validate configuration
         self.validate_config(config)
         return config
     
-    def load_yaml_config(self) -> Dict[str, Any]:
-        """Load configuration from YAML file"""
-        if not os.path.exists(self.config_path):
+    def load_yaml_config(self, source: Optional[bytes] = None) -> Dict[str, Any]:
+        """Load configuration from YAML file (source: raw file contents, if already read)"""
+        if source is None and not os.path.exists(self.config_path):
             # Create default configuration with multiple relays
             default_config: Dict[str, Any] = {
                 'nostr': {
@@ -101,28 +229,43 @@ class Config:
                     'retry_backoff_factor': 2
                 }
             }
+            self.apply_section_defaults(default_config, {})
             self.save_config(default_config)
             return default_config
         
-        with open(self.config_path, 'r') as file:
-            config: Dict[str, Any] = yaml.safe_load(file)
-            # Handle backward compatibility for single relay_url
-            if 'nostr' in config and 'relay_url' in config['nostr'] and 'relay_urls' not in config['nostr']:
-                config['nostr']['relay_urls'] = [config['nostr']['relay_url']]
-                # Remove the old single relay_url field
-                del config['nostr']['relay_url']
-            
-            # Add default relay_health config if missing
-            if 'relay_health' not in config:
-                config['relay_health'] = {
-                    'check_interval': 300,  # 5 minutes
-                    'retry_attempts': 3,
-                    'retry_backoff_factor': 2
-                }
-            
-            # Validate configuration
-            self.validate_config(config)
-            return config
+        if source is None:
+            with open(self.config_path, 'rb') as file:
+                source = file.read()
+        config: Dict[str, Any] = yaml.safe_load(source)
+        # Handle backward compatibility for single relay_url
+        if 'nostr' in config and 'relay_url' in config['nostr'] and 'relay_urls' not in config['nostr']:
+            config['nostr']['relay_urls'] = [config['nostr']['relay_url']]
+            # Remove the old single relay_url field
+            del config['nostr']['relay_url']
+        
+        # Add default relay_health config if missing
+        if 'relay_health' not in config:
+            config['relay_health'] = {
+                'check_interval': 300,  # 5 minutes
+                'retry_attempts': 3,
+                'retry_backoff_factor': 2
+            }
+        
+        # Add defaults for optional sections
+        self.apply_section_defaults(config, config)
+        config.setdefault('rules', [])
+        
+        # Validate configuration
+        self.validate_config(config)
+        return config
+    
+    def apply_section_defaults(self, config: Dict[str, Any], source: Dict[str, Any]) -> None:
+        """Fill optional sections from source, falling back to SECTION_DEFAULTS"""
+        for section, defaults in SECTION_DEFAULTS.items():
+            overrides = source.get(section) or {}
+            if not isinstance(overrides, dict):
+                raise ConfigurationError(f"'{section}' must be a mapping")
+            config[section] = {**defaults, **overrides}
     
     def validate_config(self, config: Dict[str, Any]) -> None:
         """Validate configuration parameters"""
@@ -190,8 +333,145 @@ class Config:
             if field not in relay_health_section:
                 raise ConfigurationError(f"Missing '{field}' in relay_health configuration")
         
+        # Check key_pool section
+        key_pool_section: Dict[str, Any] = config.get('key_pool', SECTION_DEFAULTS['key_pool'])
+        for field in ['size', 'low_water']:
+            self._validate_positive_int(key_pool_section, field, 'key_pool')
+        if key_pool_section['low_water'] > key_pool_section['size']:
+            raise ConfigurationError("'low_water' must not exceed 'size' in key_pool configuration")
+        
+        # Check batch section
+        self._validate_positive_int(config.get('batch', SECTION_DEFAULTS['batch']), 'max_concurrency', 'batch')
+        
+        # Check dispatch section
+        dispatch_section: Dict[str, Any] = config.get('dispatch', SECTION_DEFAULTS['dispatch'])
+        self._validate_positive_int(dispatch_section, 'workers', 'dispatch')
+        self._validate_non_negative_number(dispatch_section, 'min_send_interval', 'dispatch')
+        
+        # Check cluster section
+        cluster_section: Dict[str, Any] = config.get('cluster', SECTION_DEFAULTS['cluster'])
+        if cluster_section.get('enabled'):
+            if not cluster_section.get('db_path'):
+                raise ConfigurationError("'db_path' is required when cluster mode is enabled")
+            self._validate_positive_int(cluster_section, 'lease_ttl', 'cluster')
+            self._validate_non_negative_number(cluster_section, 'dedupe_window', 'cluster')
+        
+        # Check digest section
+        digest_section: Dict[str, Any] = config.get('digest', SECTION_DEFAULTS['digest'])
+        if not isinstance(digest_section.get('entities'), list):
+            raise ConfigurationError("'entities' must be a list in digest configuration")
+        windows = digest_section.get('windows')
+        if not isinstance(windows, list) or not windows or \
+                not all(isinstance(window, int) and not isinstance(window, bool) and window > 0 for window in windows):
+            raise ConfigurationError("'windows' must be a non-empty list of positive minutes in digest configuration")
+        self._validate_positive_int(digest_section, 'bucket_seconds', 'digest')
+        if digest_section['bucket_seconds'] > min(windows) * 60:
+            raise ConfigurationError("'bucket_seconds' must not exceed the shortest digest window")
+        self._validate_non_negative_number(digest_section, 'interval', 'digest')
+        
+        # Check relay_state section
+        relay_state_section: Dict[str, Any] = config.get('relay_state', SECTION_DEFAULTS['relay_state'])
+        if relay_state_section.get('enabled'):
+            if not relay_state_section.get('path'):
+                raise ConfigurationError("'path' is required when relay state persistence is enabled")
+            self._validate_non_negative_number(relay_state_section, 'backoff_base', 'relay_state')
+            self._validate_non_negative_number(relay_state_section, 'backoff_max', 'relay_state')
+        
+        # Check relay_info section
+        relay_info_section: Dict[str, Any] = config.get('relay_info', SECTION_DEFAULTS['relay_info'])
+        self._validate_non_negative_number(relay_info_section, 'ttl', 'relay_info')
+        self._validate_non_negative_number(relay_info_section, 'timeout', 'relay_info')
+        
+        # Check inbox_relays section
+        inbox_relays_section: Dict[str, Any] = config.get('inbox_relays', SECTION_DEFAULTS['inbox_relays'])
+        self._validate_non_negative_number(inbox_relays_section, 'ttl', 'inbox_relays')
+        self._validate_positive_int(inbox_relays_section, 'max_relays', 'inbox_relays')
+        self._validate_non_negative_number(inbox_relays_section, 'timeout', 'inbox_relays')
+        
+        # Check delivery section
+        delivery_section: Dict[str, Any] = config.get('delivery', SECTION_DEFAULTS['delivery'])
+        self._validate_non_negative_number(delivery_section, 'deadline', 'delivery')
+        max_republish = delivery_section.get('max_republish')
+        if not isinstance(max_republish, int) or isinstance(max_republish, bool) or max_republish < 0:
+            raise ConfigurationError("'max_republish' must be a non-negative integer in delivery configuration")
+        verify_relays = delivery_section.get('verify_relays')
+        if not isinstance(verify_relays, list) or not all(self._validate_relay_url(url) for url in verify_relays):
+            raise ConfigurationError("'verify_relays' must be a list of valid relay URLs in delivery configuration")
+        
+        # Check logging section
+        logging_section: Dict[str, Any] = config.get('logging', SECTION_DEFAULTS['logging'])
+        if logging_section.get('format') not in LOG_FORMATS:
+            raise ConfigurationError(f"'format' must be one of {', '.join(LOG_FORMATS)} in logging configuration")
+        if str(logging_section.get('level', '')).upper() not in LOG_LEVELS:
+            raise ConfigurationError(f"'level' must be one of {', '.join(LOG_LEVELS)} in logging configuration")
+        self._validate_positive_int(logging_section, 'per_event_sample_rate', 'logging')
+        self._validate_non_negative_number(logging_section, 'per_event_max_per_second', 'logging')
+        
+        # Check payload section
+        payload_section: Dict[str, Any] = config.get('payload', SECTION_DEFAULTS['payload'])
+        if payload_section.get('format') not in PAYLOAD_FORMATS:
+            raise ConfigurationError(f"'format' must be one of {', '.join(PAYLOAD_FORMATS)} in payload configuration")
+        self._validate_positive_int(payload_section, 'line_width', 'payload')
+        
+        # Check admin section
+        admin_section: Dict[str, Any] = config.get('admin', SECTION_DEFAULTS['admin'])
+        self._validate_positive_int(admin_section, 'port', 'admin')
+        if admin_section['port'] > 65535:
+            raise ConfigurationError("'port' must be at most 65535 in admin configuration")
+        if admin_section.get('enabled'):
+            token = admin_section.get('token')
+            if not isinstance(token, str) or len(token) < MIN_ADMIN_TOKEN_LENGTH:
+                raise ConfigurationError(f"'token' must be at least {MIN_ADMIN_TOKEN_LENGTH} characters "
+                                         "in admin configuration when the admin API is enabled")
+        
+        # Check tracing section
+        tracing_section: Dict[str, Any] = config.get('tracing', SECTION_DEFAULTS['tracing'])
+        self._validate_non_negative_number(tracing_section, 'sample_rate', 'tracing')
+        if tracing_section['sample_rate'] > 1:
+            raise ConfigurationError("'sample_rate' must be between 0 and 1 in tracing configuration")
+        if tracing_section.get('exporter') not in TRACE_EXPORTERS:
+            raise ConfigurationError(f"'exporter' must be one of {', '.join(TRACE_EXPORTERS)} in tracing configuration")
+        if not isinstance(tracing_section.get('path'), str) or not tracing_section['path']:
+            raise ConfigurationError("'path' must be a non-empty string in tracing configuration")
+        if not str(tracing_section.get('otlp_endpoint')).startswith(('http://', 'https://')):
+            raise ConfigurationError("'otlp_endpoint' must be an http(s) URL in tracing configuration")
+        self._validate_non_negative_number(tracing_section, 'max_file_size', 'tracing')
+        self._validate_positive_int(tracing_section, 'export_interval', 'tracing')
+        self._validate_positive_int(tracing_section, 'max_queue', 'tracing')
+        
+        # Check capture section
+        capture_section: Dict[str, Any] = config.get('capture', SECTION_DEFAULTS['capture'])
+        if not isinstance(capture_section.get('path'), str) or not capture_section['path']:
+            raise ConfigurationError("'path' must be a non-empty string in capture configuration")
+        self._validate_non_negative_number(capture_section, 'max_file_size', 'capture')
+        self._validate_positive_int(capture_section, 'flush_interval', 'capture')
+        self._validate_positive_int(capture_section, 'max_queue', 'capture')
+        
+        # Compile rules once; raises ConfigurationError on invalid expressions
+        rules_section = config.get('rules') or []
+        if not isinstance(rules_section, list):
+            raise ConfigurationError("'rules' must be a list")
+        self._rule_set = RuleSet(rules_section)
+        
         logger.info("Configuration validation completed")
     
+    def build_indexes(self, config: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Entity lookups used for every webhook, computed once per configuration"""
+        rule_set = getattr(self, '_rule_set', None) or RuleSet(config.get('rules') or [])
+        monitored = set(config['alerts']['monitored_entities'])
+        accepted = monitored | set(config['digest'].get('entities', [])) | rule_set.entities
+        return {
+            'monitored_entities': sorted(monitored),
+            'accepted_entities': sorted(accepted)
+        }
+    
+    def _entity_set(self, name: str) -> FrozenSet[str]:
+        if name not in self._entity_sets:
+            if not self.indexes:
+                self.indexes = self.build_indexes(self.config)
+            self._entity_sets[name] = frozenset(self.indexes[name])
+        return self._entity_sets[name]
+    
     def save_config(self, config: Dict[str, Any]) -> None:
         """Save configuration to YAML file"""
         with open(self.config_path, 'w') as file:
@@ -218,6 +498,15 @@ class Config:
     def monitored_entities(self) -> List[str]:
         return self.config['alerts']['monitored_entities']
     
+    @property
+    def monitored_entity_set(self) -> FrozenSet[str]:
+        return self._entity_set('monitored_entities')
+    
+    @property
+    def accepted_entities(self) -> FrozenSet[str]:
+        """Entities whose webhooks are queued: monitored, digest and rule inputs"""
+        return self._entity_set('accepted_entities')
+    
     @property
     def consolidated_entities(self) -> List[str]:
         return self.config['alerts']['consolidated_entities']
@@ -234,18 +523,98 @@ class Config:
             'retry_backoff_factor': 2
         })
 
+    @property
+    def key_pool_config(self) -> Dict[str, Any]:
+        return self.config.get('key_pool', SECTION_DEFAULTS['key_pool'])
+
+    @property
+    def batch_config(self) -> Dict[str, Any]:
+        return self.config.get('batch', SECTION_DEFAULTS['batch'])
+
+    @property
+    def dispatch_config(self) -> Dict[str, Any]:
+        return self.config.get('dispatch', SECTION_DEFAULTS['dispatch'])
+
+    @property
+    def cluster_config(self) -> Dict[str, Any]:
+        return self.config.get('cluster', SECTION_DEFAULTS['cluster'])
+
+    @property
+    def digest_config(self) -> Dict[str, Any]:
+        return self.config.get('digest', SECTION_DEFAULTS['digest'])
+
+    @property
+    def digest_entities(self) -> List[str]:
+        return self.digest_config.get('entities', [])
+
+    @property
+    def relay_state_config(self) -> Dict[str, Any]:
+        return self.config.get('relay_state', SECTION_DEFAULTS['relay_state'])
+
+    @property
+    def relay_info_config(self) -> Dict[str, Any]:
+        return self.config.get('relay_info', SECTION_DEFAULTS['relay_info'])
+
+    @property
+    def inbox_relays_config(self) -> Dict[str, Any]:
+        return self.config.get('inbox_relays', SECTION_DEFAULTS['inbox_relays'])
+
+    @property
+    def delivery_config(self) -> Dict[str, Any]:
+        return self.config.get('delivery', SECTION_DEFAULTS['delivery'])
+
+    @property
+    def logging_config(self) -> Dict[str, Any]:
+        return self.config.get('logging', SECTION_DEFAULTS['logging'])
+
+    @property
+    def payload_config(self) -> Dict[str, Any]:
+        return self.config.get('payload', SECTION_DEFAULTS['payload'])
+
+    @property
+    def admin_config(self) -> Dict[str, Any]:
+        return self.config.get('admin', SECTION_DEFAULTS['admin'])
+
+    @property
+    def tracing_config(self) -> Dict[str, Any]:
+        return self.config.get('tracing', SECTION_DEFAULTS['tracing'])
+
+    @property
+    def capture_config(self) -> Dict[str, Any]:
+        return self.config.get('capture', SECTION_DEFAULTS['capture'])
+
+    @property
+    def rule_set(self) -> RuleSet:
+        if not hasattr(self, '_rule_set'):
+            self._rule_set = RuleSet(self.config.get('rules') or [])
+        return self._rule_set
+
+    def _validate_positive_int(self, section: Dict[str, Any], field: str, section_name: str) -> None:
+        """Ensure section[field] is a positive integer"""
+        value = section.get(field)
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise ConfigurationError(f"'{field}' must be a positive integer in {section_name} configuration")
+
+    def _validate_non_negative_number(self, section: Dict[str, Any], field: str, section_name: str) -> None:
+        """Ensure section[field] is a number >= 0"""
+        value = section.get(field)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            raise ConfigurationError(f"'{field}' must be a non-negative number in {section_name} configuration")
+
     def _validate_relay_url(self, url: str) -> bool:
         """Validate that a relay URL is properly formatted"""
         if not isinstance(url, str):
             return False
         
-        if not url.startswith('wss://'):
+        if not url.startswith(('wss://', 'ws://')):
             return False
         
         # Use urllib to parse and validate URL structure
         try:
-            from urllib.parse import urlparse
             parsed = urlparse(url)
+            # Plain ws:// is only accepted for local relays (e.g. the benchmark fake relay)
+            if parsed.scheme == 'ws':
+                return parsed.hostname in LOCAL_RELAY_HOSTS
             if not parsed.hostname or '.' not in parsed.hostname:
                 return False
             return True
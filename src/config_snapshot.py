@@ -0,0 +1,76 @@
+"""
+Validated, normalized configuration cached across restarts, keyed by a content hash
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Modules whose code decides what a validated config looks like; editing them invalidates snapshots
+SCHEMA_MODULES = ('config.py', 'rules.py', 'config_snapshot.py')
+
+_code_fingerprint: Optional[str] = None
+
+def code_fingerprint() -> str:
+    """Hash of the config schema modules, so an upgraded add-on never reuses an old snapshot"""
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in SCHEMA_MODULES:
+            with open(os.path.join(directory, module), 'rb') as file:
+                digest.update(file.read())
+        _code_fingerprint = digest.hexdigest()
+    return _code_fingerprint
+
+def snapshot_key(source: bytes) -> str:
+    """Key of a snapshot compiled from the raw options.json or YAML bytes"""
+    digest = hashlib.sha256(f"{SNAPSHOT_VERSION}:{code_fingerprint()}:".encode('utf-8'))
+    digest.update(source)
+    return digest.hexdigest()
+
+class ConfigSnapshotStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return {'config', 'indexes'} when a snapshot for key exists, otherwise None"""
+        try:
+            with open(self.path, 'r') as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable config snapshot {self.path}: {e}")
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('key') != key:
+            logger.debug("Config snapshot is for another configuration, recompiling")
+            return None
+        return {'config': snapshot['config'], 'indexes': snapshot['indexes']}
+
+    def save(self, key: str, config: Dict[str, Any], indexes: Dict[str, Any]) -> bool:
+        """Atomically replace the snapshot; readable by the owner only, as it holds the private key"""
+        temp_path = f"{self.path}.tmp"
+        try:
+            content = json.dumps({'key': key, 'saved_at': time.time(), 'config': config, 'indexes': indexes})
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Configuration cannot be snapshotted: {e}")
+            return False
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, 'w') as file:
+                file.write(content)
+            os.replace(temp_path, self.path)
+            return True
+        except OSError as e:
+            logger.debug(f"Could not save config snapshot to {self.path}: {e}")
+            return False
@@ -0,0 +1,201 @@
+"""
+Delivery confirmation: read published gift wraps back through one shared subscription
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
+from nostr_sdk import Client, Event, Filter, HandleNotification, Kind, NostrSigner, PublicKey, RelayUrl
+from metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_ID = 'ha-nostr-alert-delivery'
+
+# Seconds between deadline checks
+CHECK_INTERVAL = 1.0
+# How long events read back before track() was called are remembered
+EARLY_SIGHTING_TTL = 60.0
+
+class PendingDelivery:
+    __slots__ = ('event_id', 'event', 'published_at', 'deadline', 'relays', 'attempts')
+
+    def __init__(self, event_id: str, event: Optional[Event], relays: List[str], published_at: float,
+                 deadline: float) -> None:
+        self.event_id = event_id
+        self.event = event  # None when the SDK built the gift wrap; it can then be confirmed but not re-published
+        self.published_at = published_at
+        self.deadline = time.monotonic() + deadline
+        self.relays: Set[str] = set(relays)
+        self.attempts = 0
+
+class _Notifications(HandleNotification):
+    def __init__(self, verifier: 'DeliveryVerifier') -> None:
+        super().__init__()
+        self.verifier = verifier
+
+    async def handle(self, relay_url: RelayUrl, subscription_id: str, event: Event) -> None:
+        if subscription_id == SUBSCRIPTION_ID:
+            self.verifier.confirm(event.id().to_hex(), str(relay_url))
+
+    async def handle_msg(self, relay_url: RelayUrl, msg: Any) -> None:
+        pass
+
+class DeliveryVerifier:
+    """Tracks published gift wraps until a separate reader connection sees them
+
+    A single REQ for kind 1059 events tagged to the tracked recipients stays
+    open on the verification relays, so each alert costs no extra subscription.
+    Alerts not seen before the deadline are re-published to verification
+    relays they were not sent to.
+    """
+
+    def __init__(self, signer: NostrSigner, relay_urls: List[str], deadline: float = 10,
+                 max_republish: int = 1) -> None:
+        self.signer = signer
+        self.relay_urls: List[str] = list(relay_urls)
+        self.deadline = deadline
+        self.max_republish = max_republish
+        self.client: Optional[Client] = None
+        # Re-publishing from the reader client would make it drop the read-back as already seen
+        self.publisher: Optional[Client] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.time_to_visible = LatencyHistogram()
+        self.stats: Dict[str, int] = {'tracked': 0, 'confirmed': 0, 'republished': 0, 'unconfirmed': 0}
+        self._pending: Dict[str, PendingDelivery] = {}
+        self._recipients: Set[str] = set()
+        # Gift wraps read back before their publish returned, event id -> monotonic time seen
+        self._early: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, recipients: List[PublicKey]) -> None:
+        """Connect the reader client and open the shared subscription (on the calling loop)"""
+        self.loop = asyncio.get_running_loop()
+        self.client = Client(self.signer)
+        self.publisher = Client(self.signer)
+        for client in (self.client, self.publisher):
+            client.automatic_authentication(True)
+            for relay_url in self.relay_urls:
+                await client.add_relay(RelayUrl.parse(relay_url))
+            await client.connect()
+        await self.client.wait_for_connection(timedelta(seconds=2))
+        self._recipients = {recipient.to_hex() for recipient in recipients}
+        await self._subscribe()
+        self._tasks = [
+            asyncio.create_task(self.client.handle_notifications(_Notifications(self))),
+            asyncio.create_task(self._check_deadlines())
+        ]
+        logger.info(f"Delivery verification reading back from {', '.join(self.relay_urls)}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for client in (self.client, self.publisher):
+            if client:
+                try:
+                    await asyncio.wait_for(client.disconnect(), timeout=5.0)
+                except Exception as e:
+                    logger.debug(f"Error disconnecting delivery verifier: {e}")
+        self.client = None
+        self.publisher = None
+
+    async def _subscribe(self) -> None:
+        # limit 0: only events arriving from now on, the stored backlog is not wanted
+        event_filter = Filter().kind(Kind(1059))\
+            .pubkeys([PublicKey.parse(recipient) for recipient in sorted(self._recipients)]).limit(0)
+        await self.client.subscribe_with_id(SUBSCRIPTION_ID, event_filter)
+
+    async def _add_relays(self, relay_urls: List[str]) -> None:
+        """Read from relays an alert was sent to that we are not connected to yet (they inherit the REQ)"""
+        for relay_url in relay_urls:
+            if relay_url not in self.relay_urls:
+                self.relay_urls.append(relay_url)
+                for client in (self.client, self.publisher):
+                    await client.add_relay(RelayUrl.parse(relay_url))
+                    await client.connect_relay(RelayUrl.parse(relay_url))
+
+    def track(self, event_id: str, event: Optional[Event], recipient: PublicKey, relay_urls: List[str],
+              published_at: Optional[float] = None) -> None:
+        """Start waiting for a published gift wrap; safe to call from any thread
+
+        published_at is the time.monotonic() at which publishing started.
+        """
+        if self.client is None or self.loop is None:
+            return
+        published_at = published_at if published_at is not None else time.monotonic()
+        recipient_hex = recipient.to_hex()
+        with self._lock:
+            self.stats['tracked'] += 1
+            seen_at = self._early.pop(event_id, None)
+            if seen_at is not None:
+                self.stats['confirmed'] += 1
+            else:
+                self._pending[event_id] = PendingDelivery(event_id, event, relay_urls, published_at, self.deadline)
+            new_recipient = recipient_hex not in self._recipients
+            self._recipients.add(recipient_hex)
+        if seen_at is not None:
+            self.time_to_visible.observe(max(0.0, seen_at - published_at))
+        missing = [relay_url for relay_url in relay_urls if relay_url not in self.relay_urls]
+        if missing:
+            asyncio.run_coroutine_threadsafe(self._add_relays(missing), self.loop)
+        if new_recipient:
+            # Replaces the shared REQ rather than opening another one
+            asyncio.run_coroutine_threadsafe(self._subscribe(), self.loop)
+
+    def confirm(self, event_id: str, relay_url: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.pop(event_id, None)
+            if pending is None:
+                # Either not ours or read back before its publish returned
+                self._early[event_id] = now
+                return
+            self.stats['confirmed'] += 1
+        elapsed = now - pending.published_at
+        self.time_to_visible.observe(elapsed)
+        logger.debug(f"Event {event_id} visible on {relay_url} after {elapsed:.3f}s")
+
+    async def _check_deadlines(self) -> None:
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                expired = [pending for pending in self._pending.values() if pending.deadline <= now]
+                self._early = {event_id: seen_at for event_id, seen_at in self._early.items()
+                               if now - seen_at < EARLY_SIGHTING_TTL}
+            for pending in expired:
+                await self._handle_expired(pending)
+
+    async def _handle_expired(self, pending: PendingDelivery) -> None:
+        others = [relay_url for relay_url in self.relay_urls if relay_url not in pending.relays]
+        if pending.event is None or pending.attempts >= self.max_republish or not others:
+            with self._lock:
+                if self._pending.pop(pending.event_id, None) is None:
+                    return
+                self.stats['unconfirmed'] += 1
+            logger.warning(f"Event {pending.event_id} was not seen on any relay within the deadline")
+            return
+
+        pending.attempts += 1
+        pending.deadline = time.monotonic() + self.deadline
+        try:
+            output = await asyncio.wait_for(
+                self.publisher.send_event_to([RelayUrl.parse(relay_url) for relay_url in others], pending.event),
+                timeout=15.0
+            )
+            pending.relays.update(others)
+            self.stats['republished'] += 1
+            logger.warning(f"Event {pending.event_id} not seen within {self.deadline}s, re-published to "
+                           f"{len(output.success)}/{len(others)} other relay(s)")
+        except Exception as e:
+            logger.error(f"Error re-publishing event {pending.event_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.stats, pending=len(self._pending))
+        stats['time_to_visible'] = self.time_to_visible.snapshot()
+        return stats
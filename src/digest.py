@@ -0,0 +1,141 @@
+"""
+Windowed aggregation of high-frequency entities into periodic digest messages
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class BucketStats:
+    """Running count/sum/min/max/last for one time bucket"""
+    __slots__ = ('bucket', 'count', 'numeric_count', 'total', 'min', 'max', 'last')
+
+    def __init__(self) -> None:
+        self.reset(-1)
+
+    def reset(self, bucket: int) -> None:
+        self.bucket = bucket
+        self.count = 0
+        self.numeric_count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.last: Optional[str] = None
+
+    def add(self, value: str) -> None:
+        self.count += 1
+        self.last = value
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return
+        self.numeric_count += 1
+        self.total += number
+        self.min = number if self.min is None else min(self.min, number)
+        self.max = number if self.max is None else max(self.max, number)
+
+class EntityWindow:
+    """Ring buffer of per-bucket stats covering the longest configured window"""
+
+    def __init__(self, slots: int, bucket_seconds: int) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.ring: List[BucketStats] = [BucketStats() for _ in range(slots)]
+        self.friendly_name: Optional[str] = None
+        self.last: Optional[str] = None
+
+    def add(self, value: str, timestamp: float) -> None:
+        bucket = int(timestamp // self.bucket_seconds)
+        slot = self.ring[bucket % len(self.ring)]
+        if slot.bucket != bucket:
+            # Slot still holds an expired bucket from a previous lap of the ring
+            slot.reset(bucket)
+        slot.add(value)
+        self.last = value
+
+    def summary(self, buckets: int, now: float) -> Dict[str, Any]:
+        """Fold the most recent buckets into min/max/mean/count/last"""
+        current = int(now // self.bucket_seconds)
+        count = numeric_count = 0
+        total = 0.0
+        minimum: Optional[float] = None
+        maximum: Optional[float] = None
+        last: Optional[str] = None
+        last_bucket = -1
+        for slot in self.ring:
+            if slot.count == 0 or not current - buckets < slot.bucket <= current:
+                continue
+            count += slot.count
+            numeric_count += slot.numeric_count
+            total += slot.total
+            if slot.min is not None:
+                minimum = slot.min if minimum is None else min(minimum, slot.min)
+                maximum = slot.max if maximum is None else max(maximum, slot.max)
+            if slot.bucket > last_bucket:
+                last_bucket, last = slot.bucket, slot.last
+        return {
+            'count': count,
+            'min': minimum,
+            'max': maximum,
+            'mean': total / numeric_count if numeric_count else None,
+            'last': last
+        }
+
+class DigestAggregator:
+    def __init__(self, config: Any) -> None:
+        digest_config: Dict[str, Any] = config.digest_config
+        self.entities = set(digest_config.get('entities', []))
+        self.windows: List[int] = sorted(digest_config.get('windows', [1, 5, 15]))
+        self.interval: float = digest_config.get('interval', 5) * 60
+        self.bucket_seconds: int = digest_config.get('bucket_seconds', 60)
+        self._slots = max(1, max(self.windows) * 60 // self.bucket_seconds)
+        self._entity_windows: Dict[str, EntityWindow] = {}
+        self._lock = threading.Lock()
+        self._next_digest = time.time() + self.interval
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self.entities
+
+    def record(self, data: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        """Add a webhook state change for a digest entity"""
+        entity_id: str = data.get('entity_id')
+        new_state: Dict[str, Any] = data.get('new_state') or {}
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            window = self._entity_windows.get(entity_id)
+            if window is None:
+                window = self._entity_windows[entity_id] = EntityWindow(self._slots, self.bucket_seconds)
+            window.friendly_name = new_state.get('attributes', {}).get('friendly_name', entity_id)
+            window.add(str(new_state.get('state', 'N/A')), timestamp)
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Whether the next digest should be sent"""
+        return (now if now is not None else time.time()) >= self._next_digest
+
+    def render(self, now: Optional[float] = None) -> Optional[str]:
+        """Build the digest message and schedule the next one; None if nothing was recorded"""
+        now = now if now is not None else time.time()
+        self._next_digest = now + self.interval
+        lines: List[str] = []
+        with self._lock:
+            for entity_id in sorted(self._entity_windows):
+                window = self._entity_windows[entity_id]
+                stats = [(minutes, window.summary(max(1, minutes * 60 // self.bucket_seconds), now))
+                         for minutes in self.windows]
+                if not any(summary['count'] for _, summary in stats):
+                    continue
+                lines.append(f"{window.friendly_name}: {window.last}")
+                for minutes, summary in stats:
+                    if summary['count'] == 0:
+                        continue
+                    if summary['mean'] is None:
+                        lines.append(f"  {minutes}m: n={summary['count']} last {summary['last']}")
+                    else:
+                        lines.append(f"  {minutes}m: min {summary['min']:g} max {summary['max']:g} "
+                                     f"mean {summary['mean']:.2f} n={summary['count']}")
+        if not lines:
+            return None
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        return f"{timestamp} digest\n" + "\n".join(lines)
@@ -13,6 +13,10 @@ class RelayConnectionError(HA_Nostr_Alert_Error):
     """Raised when relay connection fails"""
     pass
 
+class RelayRejectedError(HA_Nostr_Alert_Error):
+    """Raised when connected relays refuse an event (e.g. rate limited)"""
+    pass
+
 class MessageProcessingError(HA_Nostr_Alert_Error):
     """Raised when message processing fails"""
     pass
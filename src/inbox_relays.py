@@ -0,0 +1,65 @@
+"""
+NIP-17 DM inbox relays (kind 10050) advertised by recipients
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from config import LOCAL_RELAY_HOSTS
+
+logger = logging.getLogger(__name__)
+
+INBOX_RELAYS_KIND = 10050
+
+def usable_relay_url(url: str) -> bool:
+    """wss:// relays, or ws:// on a loopback host; rejects anything a recipient could abuse"""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return False
+    if not parsed.hostname:
+        return False
+    return parsed.scheme == 'wss' or (parsed.scheme == 'ws' and parsed.hostname in LOCAL_RELAY_HOSTS)
+
+def parse_inbox_relays(tags: List[List[str]], max_relays: int) -> List[str]:
+    """Relay urls from the ["relay", url] tags of a kind 10050 event, in order, deduplicated"""
+    relays: List[str] = []
+    for tag in tags:
+        if len(tag) < 2 or tag[0] != 'relay':
+            continue
+        url = tag[1].strip()
+        if usable_relay_url(url) and url.rstrip('/') not in (relay.rstrip('/') for relay in relays):
+            relays.append(url)
+        if len(relays) >= max_relays:
+            break
+    return relays
+
+class InboxRelayCache:
+    """Per-recipient inbox relay lists with a TTL; empty lists are cached too"""
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[List[str], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, recipient_hex: str, now: Optional[float] = None) -> Optional[List[str]]:
+        """Cached relays, or None when unknown or expired"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self._entries.get(recipient_hex)
+        if entry is None or now - entry[1] >= self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, recipient_hex: str, relays: List[str], now: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[recipient_hex] = (relays, now if now is not None else time.time())
+
+    def invalidate(self, recipient_hex: str) -> None:
+        with self._lock:
+            self._entries.pop(recipient_hex, None)
+
+    def snapshot(self) -> Dict[str, List[str]]:
+        with self._lock:
+            return {recipient: relays for recipient, (relays, _) in self._entries.items()}
@@ -0,0 +1,85 @@
+"""
+Pre-generated ephemeral key pool for NIP-59 gift wraps
+"""
+from nostr_sdk import Keys
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class EphemeralKeyPool:
+    def __init__(self, size: int = 16, low_water: int = 4) -> None:
+        self.size = size
+        self.low_water = low_water
+        self._keys: Deque[Keys] = deque()
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._running = False
+        self._refill_thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def start(self) -> None:
+        """Start the background refill thread and fill the pool"""
+        if self._running:
+            return
+        self._running = True
+        self._refill_needed.set()
+        self._refill_thread = threading.Thread(target=self._refill_loop, name="ephemeral-key-pool")
+        self._refill_thread.daemon = True
+        self._refill_thread.start()
+        logger.info(f"Started ephemeral key pool (size={self.size}, low_water={self.low_water})")
+
+    def stop(self) -> None:
+        """Stop the background refill thread"""
+        self._running = False
+        self._refill_needed.set()
+        if self._refill_thread:
+            self._refill_thread.join(timeout=5.0)
+            self._refill_thread = None
+        logger.info("Stopped ephemeral key pool")
+
+    def acquire(self) -> Keys:
+        """Take a pre-generated key, or generate one inline if the pool is empty"""
+        with self._lock:
+            keys = self._keys.popleft() if self._keys else None
+            if keys is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if len(self._keys) <= self.low_water:
+                self._refill_needed.set()
+
+        if keys is None:
+            keys = Keys.generate()
+        return keys
+
+    def _refill_loop(self) -> None:
+        """Top up the pool whenever it drops to the low-water mark"""
+        while self._running:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            while self._running:
+                with self._lock:
+                    if len(self._keys) >= self.size:
+                        break
+                # Generate outside the lock so acquire() never waits on key generation
+                keys = Keys.generate()
+                with self._lock:
+                    self._keys.append(keys)
+                    self.generated += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters"""
+        with self._lock:
+            return {
+                'available': len(self._keys),
+                'size': self.size,
+                'low_water': self.low_water,
+                'hits': self.hits,
+                'misses': self.misses,
+                'generated': self.generated
+            }
@@ -0,0 +1,135 @@
+"""
+Non-blocking, optionally structured logging with sampling for per-event messages
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Pass as extra= on per-event log calls so they can be sampled and rate limited
+PER_EVENT: Dict[str, Any] = {'per_event': True}
+
+# LogRecord attributes that are not user supplied extras
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'per_event'}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def event_extra(**fields: Any) -> Dict[str, Any]:
+    """extra= for a per-event log call carrying structured fields (e.g. entity_id)"""
+    return {'per_event': True, **fields}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class PerEventFilter(logging.Filter):
+    """Sample 1-in-N and rate limit per-event records, keyed by logger and message template"""
+
+    def __init__(self, sample_rate: int = 1, max_per_second: float = 0) -> None:
+        super().__init__()
+        self.sample_rate = max(1, sample_rate)
+        self.max_per_second = max_per_second
+        # (logger, template) -> [seen, tokens, last_refill, suppressed]
+        self._state: Dict[Tuple[str, Any], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'per_event', False):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = self._state[key] = [0, self.max_per_second, now, 0]
+            state[0] += 1
+            if (state[0] - 1) % self.sample_rate:
+                state[3] += 1
+                return False
+            if self.max_per_second:
+                state[1] = min(self.max_per_second, state[1] + (now - state[2]) * self.max_per_second)
+                state[2] = now
+                if state[1] < 1:
+                    state[3] += 1
+                    return False
+                state[1] -= 1
+            suppressed, state[3] = state[3], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks must be rendered here, before the frames go away
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class _SuppressedSuffixFormatter(logging.Formatter):
+    """Text formatter that notes how many similar per-event records were dropped"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        formatted = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{formatted} ({suppressed} similar suppressed)" if suppressed else formatted
+
+def configure_logging(logging_config: Dict[str, Any], stream: Any = None) -> None:
+    """Route all logging through a queue to a background writer thread"""
+    global _listener
+    stop_logging()
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if logging_config.get('format', 'text') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(_SuppressedSuffixFormatter(TEXT_FORMAT))
+
+    queue_handler = DeferredFormatQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(PerEventFilter(
+        sample_rate=logging_config.get('per_event_sample_rate', 1),
+        max_per_second=logging_config.get('per_event_max_per_second', 0)
+    ))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(logging_config.get('level', 'INFO').upper())
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging() -> None:
+    """Flush and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
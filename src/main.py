@@ -11,134 +11,157 @@ import logging
 import asyncio
 import signal
 
-# Add debug logging at the very beginning
-print("=== main.py starting ===", file=sys.stderr)
-print(f"Python version: {sys.version}", file=sys.stderr)
-print(f"Current working directory: {os.getcwd()}", file=sys.stderr)
-print(f"Python path: {sys.path}", file=sys.stderr)
-
-# Try to import modules and catch any import errors
-try:
-    from config import Config  # noqa: E402
-    from exceptions import HA_Nostr_Alert_Error, ConfigurationError, RelayConnectionError, MessageProcessingError
-    print("=== Successfully imported config ===", file=sys.stderr)
-except Exception as e:
-    print(f"=== Failed to import config: {e} ===", file=sys.stderr)
-    import traceback
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
-
-try:
-    from webhook_server import WebhookServer
-    print("=== Successfully imported webhook_server ===", file=sys.stderr)
-except Exception as e:
-    print(f"=== Failed to import webhook_server: {e} ===", file=sys.stderr)
-    import traceback
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
-
-try:
-    from nostr_client import NostrClient
-    print("=== Successfully imported nostr_client ===", file=sys.stderr)
-except Exception as e:
-    print(f"=== Failed to import nostr_client: {e} ===", file=sys.stderr)
-    import traceback
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
-
-try:
-    from message_processor import MessageProcessor
-    print("=== Successfully imported message_processor ===", file=sys.stderr)
-except Exception as e:
-    print(f"=== Failed to import message_processor: {e} ===", file=sys.stderr)
-    import traceback
-    traceback.print_exc(file=sys.stderr)
-    sys.exit(1)
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from config import Config
+from exceptions import HA_Nostr_Alert_Error, ConfigurationError, RelayConnectionError, MessageProcessingError
+from logging_setup import TEXT_FORMAT, configure_logging, stop_logging
+from tracing import configure_tracing, stop_tracing
+from admin_server import AdminServer
+from message_processor import MessageProcessor
+from webhook_server import WebhookServer
+
+# Plain synchronous logging until the configuration is loaded
+logging.basicConfig(level=logging.INFO, format=TEXT_FORMAT)
 logger = logging.getLogger(__name__)
-logger.info("Starting HA Nostr Alert service")
+
+# Attempts at bringing up the Nostr client before the service exits, and the delay before the first retry
+NOSTR_INIT_ATTEMPTS = 5
+NOSTR_INIT_RETRY_DELAY = 5
 
 # Global variables for cleanup
 message_processor = None
+cluster = None
+admin_server = None
+webhook_server = None
 nostr_client = None
 loop = None
+loop_thread = None
+# Set when the Nostr client could not be initialized, so webhooks are not accepted for nothing
+nostr_init_failed = threading.Event()
+# A signal handler and the main loop's cleanup may both call shutdown(); only the first one runs it
+shutdown_lock = threading.Lock()
+shutdown_done = False
+
+async def _shutdown_nostr_client() -> None:
+    """Stop health monitoring and disconnect from all relays"""
+    await nostr_client.stop_health_monitoring()
+    await nostr_client.disconnect_all()
+
+def shutdown() -> None:
+    """Stop the message processor, the webhook capture and the Nostr client event loop"""
+    global shutdown_done
+    with shutdown_lock:
+        if shutdown_done:
+            return
+        shutdown_done = True
+    if webhook_server:
+        webhook_server.stop_capture()
+    if message_processor:
+        message_processor.stop()
+    if cluster:
+        cluster.stop()
+    if loop and loop.is_running():
+        if nostr_client:
+            try:
+                asyncio.run_coroutine_threadsafe(_shutdown_nostr_client(), loop).result(timeout=30)
+            except Exception as e:
+                logger.error(f"Error disconnecting from Nostr: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if loop_thread:
+            loop_thread.join(timeout=5)
 
 def signal_handler(signum, frame):
     """Handle shutdown signals"""
     logger.info(f"Received signal {signum}, shutting down gracefully...")
-    if message_processor:
-        message_processor.stop()
-    if nostr_client and loop:
+    shutdown()
+    sys.exit(0)
+
+def init_nostr_client(config: Config) -> None:
+    """Create the Nostr client, connect it and attach it to the components that send"""
+    global nostr_client
+    # Imported here so the nostr_sdk bindings load after the webhook listener is already bound
+    from nostr_client import NostrClient
+
+    logger.info("Initializing Nostr client...")
+    client = NostrClient(config)
+    nostr_client = client
+    logger.info("Connecting to Nostr relay...")
+    loop.run_until_complete(client.connect_to_primary_relay())
+    loop.run_until_complete(client.start_health_monitoring())
+    # Every client call runs on this loop; the others submit their sends to it
+    message_processor.set_nostr_client(client, loop)
+    if cluster:
+        cluster.set_nostr_client(client, loop)
+    if admin_server:
+        admin_server.set_nostr_client(client, loop)
+    logger.info("Nostr client initialized successfully")
+
+def run_nostr_loop(config: Config) -> None:
+    """Bring relays up in the background, then keep the event loop running for the client"""
+    global nostr_client
+    asyncio.set_event_loop(loop)
+
+    for attempt in range(1, NOSTR_INIT_ATTEMPTS + 1):
         try:
-            # Cancel any pending tasks
-            pending = asyncio.all_tasks(loop)
-            for task in pending:
-                task.cancel()
-            
-            # Create a new async function to handle the cleanup
-            async def cleanup():
-                await nostr_client.stop_health_monitoring()
-                await nostr_client.disconnect_all()
-            
-            loop.run_until_complete(cleanup())
-            loop.run_until_complete(loop.shutdown_asyncgens())
+            init_nostr_client(config)
+            break
         except Exception as e:
-            logger.error(f"Error disconnecting from Nostr: {e}")
-        finally:
-            loop.close()
-    sys.exit(0)
+            logger.error(f"Failed to initialize Nostr client (attempt {attempt}/{NOSTR_INIT_ATTEMPTS}): {e}")
+            if nostr_client is not None:
+                try:
+                    loop.run_until_complete(_shutdown_nostr_client())
+                except Exception as cleanup_error:
+                    logger.debug(f"Error cleaning up Nostr client: {cleanup_error}")
+                nostr_client = None
+            if attempt == NOSTR_INIT_ATTEMPTS:
+                nostr_init_failed.set()
+                return
+            time.sleep(NOSTR_INIT_RETRY_DELAY * 2 ** (attempt - 1))
+
+    loop.run_forever()
 
 def main():
     """Main function to start the HA Nostr Alert service"""
-    logger.info("Starting HA Nostr Alert service main function")
-    
+    logger.info("Starting HA Nostr Alert service")
+
     # Set up signal handlers for graceful shutdown
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
-    
-    global message_processor, nostr_client, loop
-    
+
+    global message_processor, cluster, admin_server, webhook_server, loop, loop_thread
+
     # Load configuration
     try:
         logger.info("Loading configuration...")
         config = Config()
+        configure_logging(config.logging_config)
+        configure_tracing(config.tracing_config)
         logger.info("Configuration loaded successfully")
     except Exception as e:
         logger.error(f"Failed to load configuration: {e}")
         return
-    
+
     # Create message queue
     message_queue = queue.Queue(maxsize=config.max_queue_size)
+
+    # Join the cluster when running active-active
+    if config.cluster_config.get('enabled'):
+        try:
+            from cluster import ClusterCoordinator
+            logger.info("Initializing cluster coordinator...")
+            cluster = ClusterCoordinator(config)
+        except Exception as e:
+            logger.error(f"Failed to initialize cluster coordinator: {e}")
+            return
     
-    # Create event loop for main thread
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    # Initialize Nostr client
-    try:
-        logger.info("Initializing Nostr client...")
-        nostr_client = NostrClient(config)
-        # Connect to primary relay
-        logger.info("Connecting to Nostr relay...")
-        loop.run_until_complete(nostr_client.connect_to_primary_relay())
-        # Start health monitoring
-        loop.run_until_complete(nostr_client.start_health_monitoring())
-        logger.info("Nostr client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Nostr client: {e}")
-        return
-    
-    # Initialize message processor
+    # Initialize message processor; updates are buffered until the Nostr client is attached
     try:
         logger.info("Initializing message processor...")
-        message_processor = MessageProcessor(config, message_queue, nostr_client)
+        message_processor = MessageProcessor(config, message_queue, None, cluster)
         logger.info("Message processor initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize message processor: {e}")
         return
-    
+
     # Initialize webhook server
     try:
         logger.info("Initializing webhook server...")
@@ -147,44 +170,71 @@ def main():
     except Exception as e:
         logger.error(f"Failed to initialize webhook server: {e}")
         return
-    
+
+    # The admin API gets its own server so admin requests never compete with webhooks
+    admin_config = config.admin_config
+    if admin_config.get('enabled'):
+        try:
+            logger.info("Initializing admin API...")
+            admin_server = AdminServer(config, message_processor, cluster)
+        except Exception as e:
+            logger.error(f"Failed to initialize admin API: {e}")
+            return
+
     # Start components
+    exit_code = 0
     try:
-        # Start message processor
-        logger.info("Starting message processor...")
-        message_processor.start()
-        
-        # Start webhook server in a separate thread
+        # Start webhook server first so Home Assistant webhooks are accepted during boot
+        port = int(os.environ.get('WEBHOOK_PORT', 5000))
         logger.info("Starting webhook server...")
         server_thread = threading.Thread(
             target=webhook_server.run,
-            kwargs={'host': '0.0.0.0', 'port': 5000}
+            kwargs={'host': '0.0.0.0', 'port': port}
         )
         server_thread.daemon = True
         server_thread.start()
-        
+
+        if admin_server:
+            admin_thread = threading.Thread(
+                target=admin_server.run,
+                kwargs={'host': admin_config.get('host', '127.0.0.1'), 'port': admin_config.get('port', 5001)},
+                name="admin-api"
+            )
+            admin_thread.daemon = True
+            admin_thread.start()
+
+        # Start message processor
+        logger.info("Starting message processor...")
+        message_processor.start()
+        if cluster:
+            cluster.start()
+
+        # Bring relays up in the background
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=run_nostr_loop, args=(config,), name="nostr-loop")
+        loop_thread.daemon = True
+        loop_thread.start()
+
         logger.info("HA Nostr Alert service started successfully")
-        
-        # Keep the main thread alive
-        while True:
-            time.sleep(1)
-            
+
+        # Keep the main thread alive; without a Nostr client nothing could ever be sent
+        while not nostr_init_failed.wait(1):
+            pass
+        logger.error("Giving up, the Nostr client could not be initialized")
+        exit_code = 1
+
     except Exception as e:
         logger.error(f"Error in main loop: {e}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
     finally:
         # Clean up
-        if message_processor:
-            message_processor.stop()
-        if nostr_client and loop:
-            try:
-                loop.run_until_complete(nostr_client.stop_health_monitoring())
-                loop.run_until_complete(nostr_client.disconnect_all())
-            except Exception as e:
-                logger.error(f"Error disconnecting from Nostr: {e}")
+        shutdown()
         logger.info("HA Nostr Alert service stopped")
+        stop_tracing()
+        stop_logging()
+    if exit_code:
+        sys.exit(exit_code)
 
 if __name__ == "__main__":
-    print("=== About to call main() ===", file=sys.stderr)
     main()
@@ -6,73 +6,243 @@ import threading
 import time
 import asyncio
 import queue
+import zlib
 from collections import defaultdict
-from typing import Any, Dict, Set, Optional
+from typing import Any, Dict, List, Set, Optional, Tuple
 from datetime import datetime
 from exceptions import MessageProcessingError
+from logging_setup import PER_EVENT, event_extra
+from payload import encode_rows, json_text_size
+from digest import DigestAggregator
+from rules import Rule, RuleEngine
+from tracing import SPAN_KIND_INTERNAL, SpanContext, current_span, run_in_span, start_span, start_trace
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Most webhook traces linked from one consolidated alert
+MAX_TRACE_LINKS = 32
+
 class MessageProcessor:
-    def __init__(self, config: Any, message_queue: queue.Queue, nostr_client: Any):
+    def __init__(self, config: Any, message_queue: queue.Queue, nostr_client: Any, cluster: Any = None):
         self.config = config
         self.message_queue = message_queue
         self.nostr_client = nostr_client
+        # Event loop owning the Nostr client's connections; sends are submitted to it
+        self.nostr_loop: Optional[asyncio.AbstractEventLoop] = None
+        # In cluster mode alerts go to the shared outbox and the elected leader sends them
+        self.cluster = cluster
         self.running = False
         self.entity_states: Dict[str, Any] = {}
         self.processed_messages: Set[str] = set()
         self._lock = threading.Lock()
         
+        dispatch_config: Dict[str, Any] = config.dispatch_config
+        self.num_workers: int = dispatch_config.get('workers', 1)
+        self.min_send_interval: float = dispatch_config.get('min_send_interval', 0)
+        # Per-worker input queues; with a single worker it reads the webhook queue directly. Each is bounded
+        # like the webhook queue, so a worker that falls behind pushes back on webhooks (503) instead of growing
+        self.worker_queues: List[queue.Queue] = [message_queue] if self.num_workers == 1 \
+            else [queue.Queue(maxsize=config.max_queue_size) for _ in range(self.num_workers)]
+        # High-frequency entities aggregated into periodic digests instead of per-change alerts
+        self.digest: Optional[DigestAggregator] = DigestAggregator(config) if config.digest_config.get('entities') else None
+        # Incremental rule evaluation; only rules reading the changed entity are re-evaluated
+        self.rule_engine: Optional[RuleEngine] = RuleEngine(config.rule_set) if config.rule_set.rules else None
+        self.worker_threads: List[threading.Thread] = []
+        self.router_thread: Optional[threading.Thread] = None
+        # Runtime control from the admin API: paused workers keep ingesting but hold alerts
+        self.paused = False
+        self._wakeups: List[threading.Event] = [threading.Event() for _ in range(self.num_workers)]
+        # Wall-clock times of each entity's latest update and of the latest alert that included it
+        self.last_update_at: Dict[str, float] = {}
+        self.last_alert_at: Dict[str, float] = {}
+        
     def start(self) -> None:
         """Start the message processor"""
         self.running = True
-        self.processor_thread = threading.Thread(target=self._process_messages)
-        self.processor_thread.start()
-        logger.info("Message processor started")
+        for worker_index, worker_queue in enumerate(self.worker_queues):
+            worker_thread = threading.Thread(
+                target=self._process_messages,
+                args=(worker_queue, worker_index),
+                name=f"dispatch-worker-{worker_index}"
+            )
+            worker_thread.start()
+            self.worker_threads.append(worker_thread)
+        
+        if self.num_workers > 1:
+            self.router_thread = threading.Thread(target=self._route_messages, name="dispatch-router")
+            self.router_thread.start()
+        logger.info(f"Message processor started with {self.num_workers} worker(s)")
     
     def stop(self) -> None:
         """Stop the message processor"""
         self.running = False
-        if hasattr(self, 'processor_thread'):
-            self.processor_thread.join()
+        for wakeup in self._wakeups:
+            wakeup.set()
+        if self.router_thread:
+            self.router_thread.join()
+        for worker_thread in self.worker_threads:
+            worker_thread.join()
+        self.worker_threads = []
+        self.router_thread = None
         logger.info("Message processor stopped")
     
-    def _process_messages(self) -> None:
-        """Process messages from the queue"""
+    def drain(self) -> None:
+        """Wake every worker and send buffered alerts now, ignoring min_send_interval"""
+        for wakeup in self._wakeups:
+            wakeup.set()
+    
+    def pause(self) -> None:
+        """Hold alerts; updates keep being ingested and go out on resume"""
+        self.paused = True
+        logger.info("Alert dispatch paused")
+    
+    def resume(self) -> None:
+        self.paused = False
+        logger.info("Alert dispatch resumed")
+        self.drain()
+    
+    def status(self) -> Dict[str, Any]:
+        """Queue depths and dispatch state"""
+        with self._lock:
+            tracked_entities = len(self.entity_states)
+        return {
+            'running': self.running,
+            'paused': self.paused,
+            'workers': self.num_workers,
+            'queue_size': self.message_queue.qsize(),
+            'worker_queue_sizes': [worker_queue.qsize() for worker_queue in self.worker_queues]
+                                  if self.num_workers > 1 else [],
+            'entity_states': tracked_entities,
+            'client_attached': self.nostr_client is not None
+        }
+    
+    def entity_times(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Latest update and latest alert time of every entity seen so far"""
+        with self._lock:
+            return {entity_id: {'last_update': updated_at, 'last_alert': self.last_alert_at.get(entity_id)}
+                    for entity_id, updated_at in self.last_update_at.items()}
+    
+    def set_nostr_client(self, nostr_client: Any, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Attach the Nostr client once relays are up; buffered updates go out on the next cycle
+
+        loop is the event loop the client's connections live on. Workers then
+        send through it instead of using the client from their own loops.
+        """
+        with self._lock:
+            self.nostr_loop = loop
+            self.nostr_client = nostr_client
+        logger.info("Nostr client attached to message processor")
+    
+    def partition_for(self, entity_id: str) -> int:
+        """Return the worker index owning an entity (stable across restarts)"""
+        if self.num_workers == 1:
+            return 0
+        return zlib.crc32(entity_id.encode('utf-8')) % self.num_workers
+    
+    def _route_messages(self) -> None:
+        """Hash-partition webhook updates onto the worker queues, preserving per-entity order"""
+        while self.running:
+            try:
+                data = self.message_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            worker_queue = self.worker_queues[self.partition_for(data.get('entity_id', ''))]
+            # Block while the owning worker is behind; the webhook queue then fills up and rejects
+            while self.running:
+                try:
+                    worker_queue.put(data, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            self.message_queue.task_done()
+    
+    def _process_messages(self, source_queue: queue.Queue, worker_index: int = 0) -> None:
+        """Process messages from a worker queue"""
         # Create a new event loop for this thread
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         
+        # Set when updates arrive before the Nostr client is ready or within min_send_interval
+        pending_alert = False
+        last_sent = 0.0
+        # Sampled webhook traces waiting for the next consolidated alert, handoff_ns = when dequeued
+        pending_traces: List[SpanContext] = []
+        # Fired rules not yet delivered: dispatch is paused, the client is not ready or the send failed
+        fired_rules: List[Rule] = []
+        wakeup = self._wakeups[worker_index]
+        
         while self.running:
             try:
+                # Set by drain(): send what is buffered without waiting for min_send_interval
+                drain = wakeup.is_set()
+                wakeup.clear()
+                
                 # Process all available messages in the queue
                 processed_entities: Set[str] = set()
                 
-                # Use a more thread-safe approach
+                # Drain only what is already queued so a steady stream cannot starve sending
                 while self.running:
                     try:
-                        data = self.message_queue.get(timeout=0.1)  # Non-blocking with timeout
+                        data = source_queue.get_nowait()
                         entity_id: str = data.get('entity_id')
+                        trace_context: Optional[SpanContext] = data.get('trace_context')
+                        if trace_context is not None:
+                            start_span('queue.wait', {'entity_id': entity_id, 'worker': worker_index},
+                                       parent=trace_context, start_ns=trace_context.handoff_ns).end()
+                            if entity_id in self.config.monitored_entity_set:
+                                pending_traces.append(trace_context._replace(handoff_ns=time.time_ns()))
+                                del pending_traces[:-MAX_TRACE_LINKS]
                         
                         with self._lock:
                             # Store the latest state for each entity
                             self.entity_states[entity_id] = data
-                            processed_entities.add(entity_id)
-                            logger.info(f"Processed entity update: {entity_id}")
-                        self.message_queue.task_done()
+                            self.last_update_at[entity_id] = time.time()
+                            if self.digest is not None and entity_id in self.digest:
+                                self.digest.record(data)
+                            else:
+                                processed_entities.add(entity_id)
+                            logger.info("Processed entity update: %s", entity_id, extra=event_extra(entity_id=entity_id))
+                        if self.rule_engine is not None:
+                            fired_rules.extend(self.rule_engine.update(data))
+                        source_queue.task_done()
                     except queue.Empty:
                         break  # No more items in queue
                 
                 # If we have updates to monitored entities, send consolidated message
-                if processed_entities and any(entity in self.config.monitored_entities 
-                                            for entity in processed_entities):
-                    # Use the event loop to handle the async operation
-                    loop.run_until_complete(self._send_consolidated_alert())
+                if processed_entities and not self.config.monitored_entity_set.isdisjoint(processed_entities):
+                    pending_alert = True
+                
+                # Updates stay buffered in entity_states until the client is ready and the worker may send
+                if pending_alert and not self.paused and (self.nostr_client is not None or self.cluster is not None) \
+                        and (drain or time.monotonic() - last_sent >= self.min_send_interval):
+                    pending_alert = False
+                    last_sent = time.monotonic()
+                    # Time spent buffered: the poll sleep, min_send_interval or waiting for the client
+                    for trace_context in pending_traces:
+                        start_span('processor.hold', {'worker': worker_index}, parent=trace_context,
+                                   start_ns=trace_context.handoff_ns).end()
+                    traces, pending_traces = pending_traces, []
+                    # The alert continues the latest update's trace and links the others it consolidates
+                    with start_span('alert.send', {'worker': worker_index, 'alert.updates': len(traces)},
+                                    parent=traces[-1] if traces else None, links=traces[:-1]):
+                        # Only ingest is sharded: the alert holds every consolidated entity, whichever worker sends it
+                        loop.run_until_complete(self._send_consolidated_alert())
+                
+                # Rules with a 'for' duration fire from the first worker's tick
+                if self.rule_engine is not None and worker_index == 0:
+                    fired_rules.extend(self.rule_engine.tick())
+                if fired_rules and not self.paused and (self.nostr_client is not None or self.cluster is not None):
+                    with start_trace('alert.rule', {'rules': len(fired_rules)}, kind=SPAN_KIND_INTERNAL):
+                        fired_rules = loop.run_until_complete(self._send_rule_alerts(fired_rules))
+                
+                # The first worker owns the digest schedule
+                if worker_index == 0 and self.digest is not None and not self.paused and self.digest.due() \
+                        and (self.nostr_client is not None or self.cluster is not None):
+                    with start_trace('alert.digest', kind=SPAN_KIND_INTERNAL):
+                        loop.run_until_complete(self._send_digest())
                 
                 # Wait a bit before checking the queue again
-                time.sleep(1)
+                wakeup.wait(1)
                 
             except Exception as e:
                 logger.error(f"Error processing messages: {e}")
@@ -81,34 +251,96 @@ class MessageProcessor:
         # Close the event loop when stopping
         loop.close()
     
-    async def _send_consolidated_alert(self) -> None:
-        """Send consolidated alert with all relevant entity states"""
+    async def _send_consolidated_alert(self, entity_ids: Optional[List[str]] = None) -> None:
+        """Send consolidated alert with the states of entity_ids (default: all consolidated entities)"""
+        if entity_ids is None:
+            entity_ids = self.config.consolidated_entities
         try:
-            # Log what entities we're processing
-            available_entities = [eid for eid in self.config.consolidated_entities if eid in self.entity_states]
-            logger.debug(f"Preparing consolidated alert for entities: {available_entities}")
+            # Snapshot the states; the other workers keep updating them
+            with self._lock:
+                states: Dict[str, Any] = {eid: self.entity_states[eid] for eid in entity_ids if eid in self.entity_states}
+            available_entities = list(states)
+            logger.debug("Preparing consolidated alert for entities: %s", available_entities)
+            if not available_entities:
+                logger.debug("No consolidated entity has a state yet, not sending an empty alert")
+                return
             
-            # Gather information from consolidated entities
-            message_parts: list = []
-            
-            for entity_id in self.config.consolidated_entities:
-                if entity_id in self.entity_states:
-                    state_data: Dict[str, Any] = self.entity_states[entity_id]
+            with start_span('alert.render', {'entities': len(available_entities)}):
+                # Gather information from consolidated entities
+                rows: List[Tuple[str, str]] = []
+                
+                for entity_id, state_data in states.items():
                     state_value: str = state_data.get('new_state', {}).get('state', 'N/A')
                     friendly_name: str = state_data.get('new_state', {}).get('attributes', {}).get('friendly_name', entity_id)
-                    message_parts.append(f"{friendly_name}: {state_value}")
-            
-            # Create consolidated message with timestamp
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            consolidated_message: str = f"{timestamp}\n" + "\n".join(message_parts)
-            logger.info(f"Sending consolidated alert with {len(message_parts)} entities")
+                    rows.append((friendly_name, str(state_value)))
+                
+                payload_config: Dict[str, Any] = self.config.payload_config
+                body: str = encode_rows(rows, payload_config.get('format', 'lines'), payload_config.get('line_width', 512))
+                
+                # Create consolidated message with timestamp
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                consolidated_message: str = f"{timestamp}\n" + body
+            logger.info("Sending consolidated alert with %d entities (%d bytes)", len(rows),
+                        json_text_size(consolidated_message), extra=PER_EVENT)
             
-            # Send via Nostr (async operation)
-            result: Optional[str] = await self.nostr_client.send_dm(consolidated_message)
-            if result:
-                logger.info(f"Sent consolidated alert successfully: {result}")
-            else:
-                logger.error(f"Failed to send consolidated alert: {consolidated_message}")
+            if await self._deliver(consolidated_message, body):
+                self._record_alert(available_entities)
             
         except Exception as e:
+            current_span().set_error(str(e))
             logger.error(f"Error sending consolidated alert: {e}")
+    
+    async def _send_rule_alerts(self, rules: List[Rule]) -> List[Rule]:
+        """Send one alert per fired rule; returns the rules whose alert was not delivered, to retry"""
+        undelivered: List[Rule] = []
+        for rule in rules:
+            try:
+                logger.info(f"Rule '{rule.name}' triggered")
+                rule_message = self.rule_engine.render(rule)
+                if await self._deliver(rule_message, rule_message.split("\n", 1)[-1]):
+                    self._record_alert(rule.dependencies)
+                    continue
+            except Exception as e:
+                logger.error(f"Error sending alert for rule '{rule.name}': {e}")
+            undelivered.append(rule)
+        return undelivered
+    
+    async def _send_digest(self) -> None:
+        """Send the windowed aggregation digest for digest entities"""
+        try:
+            digest_message: Optional[str] = self.digest.render()
+            if digest_message is None:
+                logger.debug("No digest entity updates in the current window")
+                return
+            logger.info("Sending digest alert")
+            if await self._deliver(digest_message, digest_message.split("\n", 1)[-1]):
+                self._record_alert(self.digest.entities)
+        except Exception as e:
+            logger.error(f"Error sending digest alert: {e}")
+    
+    def _record_alert(self, entity_ids: Any) -> None:
+        now = time.time()
+        with self._lock:
+            for entity_id in entity_ids:
+                self.last_alert_at[entity_id] = now
+    
+    async def _deliver(self, message: str, dedupe_content: str) -> bool:
+        """Send a rendered alert, or hand it to the cluster outbox in cluster mode; True when done"""
+        if self.cluster is not None:
+            # Dedupe on the content only, the timestamp differs between nodes
+            with start_span('cluster.enqueue'):
+                self.cluster.enqueue(message, dedupe_content=dedupe_content)
+            return True
+        
+        # Send via Nostr on the client's own loop; the client is not safe to share between loops
+        if self.nostr_loop is not None:
+            result: Optional[str] = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+                run_in_span(current_span(), self.nostr_client.send_dm(message)), self.nostr_loop))
+        else:
+            result = await self.nostr_client.send_dm(message)
+        if result:
+            logger.info("Sent consolidated alert successfully: %s", result)
+            return True
+        current_span().set_error("not delivered")
+        logger.error(f"Failed to send consolidated alert: {message}")
+        return False
@@ -0,0 +1,72 @@
+"""
+Lightweight in-process metrics for relay publishing
+"""
+import bisect
+import threading
+from typing import Any, Dict, List, Optional
+
+# Upper bounds (seconds) of the publish latency buckets; anything slower lands in the overflow bucket
+DEFAULT_LATENCY_BUCKETS: List[float] = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0]
+
+# NIP-01 machine-readable prefixes for OK/CLOSED messages
+REJECTION_PREFIXES: List[str] = [
+    'rate-limited', 'auth-required', 'blocked', 'restricted', 'pow', 'duplicate', 'invalid', 'error'
+]
+
+def classify_rejection(message: Optional[str]) -> str:
+    """Map a relay rejection message to its NIP-01 prefix, 'timeout' or 'other'"""
+    if not message:
+        return 'other'
+    lowered = message.strip().lower()
+    for prefix in REJECTION_PREFIXES:
+        if lowered.startswith(f"{prefix}:") or f" {prefix}:" in lowered:
+            return prefix
+    if 'timeout' in lowered or 'timed out' in lowered:
+        return 'timeout'
+    return 'other'
+
+class LatencyHistogram:
+    def __init__(self, buckets: Optional[List[float]] = None) -> None:
+        self.buckets: List[float] = sorted(buckets or DEFAULT_LATENCY_BUCKETS)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Record a single observation in seconds"""
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Approximate percentile (0-100) as the upper bound of the bucket containing it"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = q / 100.0 * self.count
+            cumulative = 0
+            for index, bucket_count in enumerate(self.counts):
+                cumulative += bucket_count
+                if cumulative >= target:
+                    return self.buckets[index] if index < len(self.buckets) else self.max
+            return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable view of the histogram"""
+        p50, p90, p99 = self.percentile(50), self.percentile(90), self.percentile(99)
+        with self._lock:
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'max': self.max,
+                'p50': p50,
+                'p90': p90,
+                'p99': p99,
+                'buckets': dict(zip(bounds, self.counts))
+            }
@@ -1,19 +1,33 @@
 """
 Nostr client for sending NIP-17 encrypted DMs with multi-relay failover support
 """
-from nostr_sdk import Client, Keys, PublicKey, EventBuilder, NostrSigner, RelayUrl
+from nostr_sdk import Client, Keys, PublicKey, EventBuilder, NostrSigner, RelayUrl, Event, Kind, Tag, Timestamp, Nip44Version, nip44_encrypt, Filter
 import logging
 import time
 import asyncio
+import copy
+import hashlib
 import random
-from typing import List, Dict, Optional, Any, Union
+from typing import List, Dict, Optional, Any, Tuple, Union
 import traceback
-from exceptions import RelayConnectionError, MessageProcessingError
+from datetime import timedelta
+from exceptions import RelayConnectionError, RelayRejectedError, MessageProcessingError
+from delivery import DeliveryVerifier
+from inbox_relays import INBOX_RELAYS_KIND, InboxRelayCache, parse_inbox_relays
+from key_pool import EphemeralKeyPool
+from metrics import LatencyHistogram, classify_rejection
+from payload import json_text_size, max_message_size, split_message
+from relay_info import advertises_gift_wraps, fetch_relay_info, max_event_size, parse_limits, publish_blockers, slow_down, speed_up
+from relay_state import RelayStateStore, backoff_delay, rank_relays, update_latency
+from tracing import SPAN_KIND_CLIENT, current_span, start_span
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# NIP-59 gift wraps use a created_at randomised up to two days in the past
+GIFT_WRAP_TIME_TWEAK = 2 * 24 * 60 * 60
+# How long the delivered parts of a partly sent split message are remembered for a retry
+PARTIAL_SEND_TTL = 3600
+
 class NostrClient:
     def __init__(self, config: Any) -> None:
         self.config = config
@@ -22,8 +36,25 @@ class NostrClient:
         self.signer: Optional[NostrSigner] = None
         self.recipient_public_key: Optional[PublicKey] = None
         self.active_relay: Optional[str] = None
-        self.relay_status: Dict[str, Dict[str, Union[bool, int, float]]] = {}  # relay_url -> {connected, last_checked, failure_count}
+        self.last_good_relay: Optional[str] = None  # Survives restarts when relay state is persisted
+        self.relay_status: Dict[str, Dict[str, Any]] = {}  # relay_url -> {connected, last_checked, failure_count, ack counters}
+        self.publish_latency: Dict[str, LatencyHistogram] = {}  # relay_url -> OK latency histogram
+        self._relay_url_index: Dict[str, str] = {}  # normalized relay url -> configured relay url
         self.health_check_task: Optional[asyncio.Task] = None
+        self.key_pool: Optional[EphemeralKeyPool] = None
+        self.relay_state_store: Optional[RelayStateStore] = None
+        self._next_publish_at: Dict[str, float] = {}  # relay_url -> earliest time the next event may go out
+        # Recipients' NIP-17 DM inbox relays and the client publishing to them
+        self.inbox_relays = InboxRelayCache(self.config.inbox_relays_config.get('ttl', 3600))
+        self.inbox_client: Optional[Client] = None
+        # Connection state on the inbox client, kept apart from the configured relays' clients
+        self.inbox_connected: Dict[str, bool] = {}
+        self.delivery: Optional[DeliveryVerifier] = None
+        # Split messages with undelivered parts: message key -> (time, part hash -> event id)
+        self._delivered_parts: Dict[str, Tuple[float, Dict[str, str]]] = {}
+        # Serializes (re)connects and failover: concurrent sends that all find a relay dead
+        # would otherwise each replace the client the previous one just connected
+        self._connect_lock = asyncio.Lock()
         self.connect()  # Initialize components immediately
     
     def connect(self) -> None:
@@ -53,13 +84,25 @@ class NostrClient:
             # Create signer from keys
             self.signer = NostrSigner.keys(self.keys)
             
+            # Start the ephemeral key pool used for gift wraps
+            key_pool_config = self.config.key_pool_config
+            if key_pool_config.get('enabled', True) and self.key_pool is None:
+                self.key_pool = EphemeralKeyPool(
+                    size=key_pool_config.get('size', 16),
+                    low_water=key_pool_config.get('low_water', 4)
+                )
+                self.key_pool.start()
+            
             # Initialize relay status tracking
             for relay_url in self.config.relay_urls:
-                self.relay_status[relay_url] = {
-                    'connected': False,
-                    'last_checked': 0,
-                    'failure_count': 0
-                }
+                self._ensure_relay_status(relay_url)
+                self._relay_url_index[relay_url.rstrip('/')] = relay_url
+            
+            # Warm start from the relay health learned before the last restart
+            relay_state_config = self.config.relay_state_config
+            if relay_state_config.get('enabled', True) and self.relay_state_store is None:
+                self.relay_state_store = RelayStateStore(relay_state_config.get('path', '/data/relay_state.json'))
+                self._load_relay_state()
             
             logger.info(f"Initialized Nostr client with {len(self.config.relay_urls)} relays")
             
@@ -67,6 +110,154 @@ class NostrClient:
             logger.error(f"Error initializing Nostr client: {e}")
             raise  # Re-raise the exception
     
+    def _ensure_relay_status(self, relay_url: str) -> Dict[str, Any]:
+        """Create the status and latency tracking entries for a relay if missing"""
+        if relay_url not in self.relay_status:
+            self.relay_status[relay_url] = {
+                'connected': False,
+                'last_checked': 0,
+                'failure_count': 0,
+                'accepted': 0,
+                'rejected': 0,
+                'rejection_reasons': {},
+                'last_rejection': None,
+                'retry_after': 0,  # No connection attempts before this time unless every other relay failed
+                'latency': None,  # Moving average of connect/publish latency in seconds
+                'limits': {}
+            }
+            self.publish_latency[relay_url] = LatencyHistogram()
+        return self.relay_status[relay_url]
+    
+    def _load_relay_state(self) -> None:
+        """Restore persisted health for relays that are still configured"""
+        state = self.relay_state_store.load()
+        restored = 0
+        for relay_url, saved in state['relays'].items():
+            if relay_url in self.relay_status and isinstance(saved, dict):
+                self.relay_status[relay_url].update(saved)
+                restored += 1
+        if state['last_good_relay'] in self.relay_status:
+            self.last_good_relay = state['last_good_relay']
+        if restored:
+            logger.info(f"Restored state for {restored} relay(s), last known good relay: {self.last_good_relay}")
+    
+    def save_relay_state(self) -> None:
+        """Persist relay health so the next start can skip known-dead relays"""
+        if self.relay_state_store:
+            self.relay_state_store.save(self.relay_status, self.last_good_relay)
+    
+    def _record_connect_failure(self, relay_url: str) -> None:
+        """Count a failed connection and back off further attempts"""
+        status = self.relay_status[relay_url]
+        status['connected'] = False
+        status['failure_count'] += 1
+        relay_state_config = self.config.relay_state_config
+        delay = backoff_delay(status['failure_count'], relay_state_config.get('backoff_base', 30),
+                              relay_state_config.get('backoff_max', 3600))
+        status['retry_after'] = time.time() + delay
+    
+    def ranked_relays(self) -> List[str]:
+        """Configured relays in the order connections should be attempted
+
+        Relays whose NIP-11 document rules out our gift wraps are left out
+        unless no other relay is configured, and relays that list their NIPs
+        without NIP-59 go after those that do.
+        """
+        ranked = rank_relays(self.config.relay_urls, self.relay_status, self.last_good_relay)
+        # NIP-42 AUTH challenges are answered by the SDK, so auth_required relays stay usable
+        usable = [url for url in ranked if not publish_blockers(self.relay_status[url]['limits'], can_auth=True)]
+        blocked = [url for url in ranked if url not in usable]
+        preferred = [url for url in usable if advertises_gift_wraps(self.relay_status[url]['limits'])] + \
+                    [url for url in usable if not advertises_gift_wraps(self.relay_status[url]['limits'])]
+        return preferred or blocked
+    
+    async def refresh_relay_info(self, relay_url: str, force: bool = False) -> Dict[str, Any]:
+        """Fetch a relay's NIP-11 document unless the cached limits are still fresh"""
+        relay_info_config = self.config.relay_info_config
+        limits = self._ensure_relay_status(relay_url)['limits']
+        fresh = time.time() - limits.get('fetched_at', 0) < relay_info_config.get('ttl', 86400)
+        if not relay_info_config.get('enabled', True) or (fresh and not force):
+            return limits
+        try:
+            document = await asyncio.to_thread(fetch_relay_info, relay_url, relay_info_config.get('timeout', 5))
+        except Exception as e:
+            logger.debug(f"Could not fetch NIP-11 document for {relay_url}: {e}")
+            return limits
+        # Keep the pacing learned from rejections across refreshes
+        limits = {**parse_limits(document), 'min_publish_interval': limits.get('min_publish_interval', 0)}
+        self.relay_status[relay_url]['limits'] = limits
+        blocker = publish_blockers(limits, can_auth=True)
+        if blocker:
+            logger.warning(f"Relay {relay_url} cannot take gift wraps: {blocker}")
+        logger.debug(f"NIP-11 limits for {relay_url}: {limits}")
+        return limits
+    
+    async def refresh_all_relay_info(self) -> None:
+        """Refresh stale NIP-11 documents of all configured relays concurrently"""
+        await asyncio.gather(*(self.refresh_relay_info(relay_url) for relay_url in self.config.relay_urls))
+    
+    def message_budget(self, relay_url: str) -> int:
+        """Largest JSON-escaped message size a single gift wrap to this relay can carry"""
+        limits = self._ensure_relay_status(relay_url)['limits']
+        return max_message_size(max_event_size(limits))
+    
+    async def _pace(self, relay_url: str) -> None:
+        """Wait for the relay's publish slot when it has been rate limiting us"""
+        interval = self.relay_status[relay_url]['limits'].get('min_publish_interval') or 0
+        if not interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next_publish_at.get(relay_url, 0))
+        self._next_publish_at[relay_url] = slot + interval
+        if slot > now:
+            with start_span('nostr.pace', {'relay': relay_url}):
+                await asyncio.sleep(slot - now)
+    
+    def _configured_relay_url(self, relay_url: Any) -> str:
+        """Map a RelayUrl reported by the SDK back to the configured relay url"""
+        url = str(relay_url)
+        return self._relay_url_index.get(url.rstrip('/'), url)
+    
+    def _record_rejection(self, relay_url: str, message: Optional[str]) -> None:
+        """Count a rejected publish against a relay"""
+        status = self._ensure_relay_status(relay_url)
+        reason = classify_rejection(message)
+        status['rejected'] += 1
+        status['rejection_reasons'][reason] = status['rejection_reasons'].get(reason, 0) + 1
+        status['last_rejection'] = {'reason': reason, 'message': message, 'time': time.time()}
+        logger.warning(f"Relay {relay_url} rejected event ({reason}): {message}")
+        if reason == 'rate-limited':
+            interval = slow_down(status['limits'])
+            logger.info(f"Pacing publishes to {relay_url} at one every {interval:.1f}s")
+    
+    def _record_send_output(self, output: Any, elapsed: float) -> None:
+        """Record per-relay OK/rejection results of a publish"""
+        for relay_url in output.success:
+            url = self._configured_relay_url(relay_url)
+            status = self._ensure_relay_status(url)
+            status['accepted'] += 1
+            update_latency(status, elapsed)
+            speed_up(status['limits'])
+            self.publish_latency[url].observe(elapsed)
+        for relay_url, message in output.failed.items():
+            self._record_rejection(self._configured_relay_url(relay_url), message)
+    
+    def get_relay_metrics(self) -> Dict[str, Any]:
+        """Return per-relay ack counters and publish latency histograms"""
+        relays: Dict[str, Any] = {}
+        rejection_totals: Dict[str, int] = {}
+        for relay_url, status in self.relay_status.items():
+            relays[relay_url] = {
+                'accepted': status['accepted'],
+                'rejected': status['rejected'],
+                'rejection_reasons': dict(status['rejection_reasons']),
+                'last_rejection': status['last_rejection'],
+                'publish_latency': self.publish_latency[relay_url].snapshot()
+            }
+            for reason, count in status['rejection_reasons'].items():
+                rejection_totals[reason] = rejection_totals.get(reason, 0) + count
+        return {'relays': relays, 'rejections': rejection_totals}
+    
     async def connect_to_relay(self, relay_url: str) -> bool:
         """Connect to a specific Nostr relay with proper connection options"""
         try:
@@ -83,8 +274,10 @@ class NostrClient:
                     if relay_url in self.clients:
                         del self.clients[relay_url]
             
-            # Create a fresh client for this relay
+            # Create a fresh client for this relay; it answers NIP-42 AUTH challenges with our key
+            start_time = time.monotonic()
             client = Client(self.signer)
+            client.automatic_authentication(True)
             self.clients[relay_url] = client
             
             # Parse relay URL
@@ -103,8 +296,8 @@ class NostrClient:
             # Connect to relay with timeout
             await asyncio.wait_for(client.connect(), timeout=15.0)
             
-            # Wait a bit for the connection to stabilize
-            await asyncio.sleep(2)
+            # Wait for the connection to come up, returning as soon as it does
+            await client.wait_for_connection(timedelta(seconds=2))
             
             # Check if relay is actually connected by trying to get relay info
             try:
@@ -113,27 +306,28 @@ class NostrClient:
                     relay = relays[parsed_relay_url]
                     if relay.is_connected():
                         logger.debug(f"Relay {relay_url} is connected")
-                        self.relay_status[relay_url]['connected'] = True
-                        self.relay_status[relay_url]['failure_count'] = 0
+                        status = self.relay_status[relay_url]
+                        status['connected'] = True
+                        status['failure_count'] = 0
+                        status['retry_after'] = 0
+                        update_latency(status, time.monotonic() - start_time)
                         return True
                     else:
                         logger.debug(f"Relay {relay_url} is not connected")
-                        self.relay_status[relay_url]['connected'] = False
+                        self._record_connect_failure(relay_url)
                 else:
                     logger.debug(f"Relay {relay_url} not found in relays list")
-                    self.relay_status[relay_url]['connected'] = False
+                    self._record_connect_failure(relay_url)
             except Exception as e:
                 logger.debug(f"Could not get relay info for {relay_url}: {e}")
-                self.relay_status[relay_url]['connected'] = False
+                self._record_connect_failure(relay_url)
                 
         except asyncio.TimeoutError:
             logger.error(f"Timeout connecting to Nostr relay: {relay_url}")
-            self.relay_status[relay_url]['connected'] = False
-            self.relay_status[relay_url]['failure_count'] += 1
+            self._record_connect_failure(relay_url)
         except Exception as e:
             logger.error(f"Error connecting to Nostr relay {relay_url}: {e}")
-            self.relay_status[relay_url]['connected'] = False
-            self.relay_status[relay_url]['failure_count'] += 1
+            self._record_connect_failure(relay_url)
         finally:
             # Clean up client if connection failed
             if relay_url in self.relay_status and not self.relay_status[relay_url]['connected']:
@@ -171,7 +365,7 @@ class NostrClient:
                 self.relay_status[relay_url]['connected'] = False
                 return False
             
-            logger.debug(f"Active connection test successful for {relay_url}")
+            logger.debug("Active connection test successful for %s", relay_url)
             self.relay_status[relay_url]['connected'] = True
             return True
                 
@@ -181,30 +375,79 @@ class NostrClient:
             return False
     
     async def connect_to_primary_relay(self) -> bool:
-        """Connect to the primary (first) relay, or failover to next available"""
-        for relay_url in self.config.relay_urls:
+        """Connect to the best ranked relay, or failover to next available
+
+        Relays still backing off after earlier failures are only tried once
+        every other relay has failed.
+        """
+        for relay_url in self.ranked_relays():
             if await self.connect_to_relay(relay_url):
                 self.active_relay = relay_url
+                self.last_good_relay = relay_url
                 logger.info(f"Connected to primary relay: {relay_url}")
+                self.save_relay_state()
                 return True
         
+        self.save_relay_state()
+        
         logger.error("Failed to connect to any relay")
         self.active_relay = None
         return False
     
-    async def send_dm(self, message: str) -> Optional[str]:
-        """Send encrypted DM using NIP-17 with failover support"""
-        # Ensure we have a recipient public key
-        if not self.recipient_public_key:
-            logger.error("No recipient public key configured")
-            return None
-            
+    async def switch_active_relay(self, relay_url: str) -> bool:
+        """Make relay_url the active relay, connecting to it first unless it is already connected"""
+        if relay_url not in self.relay_status:
+            raise RelayConnectionError(f"Unknown relay {relay_url}")
+        async with self._connect_lock:
+            if not (self.relay_status[relay_url]['connected'] and await self.verify_relay_connection(relay_url)):
+                if not await self.connect_to_relay(relay_url):
+                    return False
+            previous, self.active_relay = self.active_relay, relay_url
+        self.last_good_relay = relay_url
+        self.save_relay_state()
+        logger.info(f"Active relay switched from {previous} to {relay_url}")
+        return True
+    
+    async def reconnect_relay(self, relay_url: str) -> bool:
+        """Replace a relay's connection with a fresh one"""
+        if relay_url not in self.relay_status:
+            raise RelayConnectionError(f"Unknown relay {relay_url}")
+        async with self._connect_lock:
+            connected = await self.connect_to_relay(relay_url)
+        self.save_relay_state()
+        return connected
+    
+    def get_pool_state(self) -> Dict[str, Any]:
+        """Relay pool snapshot: active relay, ranking, per-relay status and metrics
+
+        Call it on the client's loop. The result is a deep copy, so it can be
+        serialized on another thread while the loop keeps updating the status.
+        """
+        return copy.deepcopy({
+            'active_relay': self.active_relay,
+            'last_good_relay': self.last_good_relay,
+            'ranked_relays': self.ranked_relays(),
+            'relays': {relay_url: dict(status) for relay_url, status in self.relay_status.items()},
+            'metrics': self.get_relay_metrics(),
+            'inbox_relays': self.inbox_relays.snapshot(),
+            'inbox_connected': dict(self.inbox_connected),
+            'key_pool': self.get_key_pool_stats(),
+            'delivery': self.get_delivery_stats()
+        })
+    
+    async def _ensure_active_relay(self) -> bool:
+        """Make sure there is a verified active relay, reconnecting or failing over if needed"""
+        # Whoever waited on the lock sees the relay the previous holder connected
+        async with self._connect_lock:
+            return await self._ensure_active_relay_locked()
+    
+    async def _ensure_active_relay_locked(self) -> bool:
         # Ensure we have an active relay, or establish one
         if not self.active_relay or not self.relay_status[self.active_relay]['connected']:
             logger.info("No active relay or connection lost, attempting to connect to primary relay")
             if not await self.connect_to_primary_relay():
                 logger.error("Failed to establish connection to any relay")
-                return None
+                return False
         
         # Verify the active relay is still connected before sending
         if not await self.verify_relay_connection(self.active_relay):
@@ -214,26 +457,197 @@ class NostrClient:
                 # If that fails, try to connect to primary relay
                 if not await self.connect_to_primary_relay():
                     logger.error("Failed to reconnect to any relay")
-                    return None
+                    return False
+        return True
+    
+    def _resolve_recipient(self, recipient: Optional[Union[str, PublicKey]]) -> Optional[PublicKey]:
+        """Resolve an npub/hex string or PublicKey, defaulting to the configured recipient"""
+        if recipient is None:
+            return self.recipient_public_key
+        if isinstance(recipient, PublicKey):
+            return recipient
+        return PublicKey.parse(recipient)
+    
+    async def send_dm(self, message: str, recipient: Optional[Union[str, PublicKey]] = None) -> Optional[str]:
+        """Send encrypted DM using NIP-17 with failover support
+        
+        Goes to the recipient's kind 10050 inbox relays when they advertise
+        any, otherwise (or if none of those accept it) to the configured relays.
+        Messages too large for one gift wrap on the target relays are split into
+        numbered parts; the event ids of all parts are returned comma separated.
+        When a part fails None is returned, and sending the same message again
+        resumes at the first undelivered part.
+        """
+        with start_span('nostr.send_dm', {'message.bytes': len(message)}, kind=SPAN_KIND_CLIENT) as span:
+            event_ids = await self._send_dm(message, recipient)
+            if event_ids is None:
+                span.set_error("not delivered")
+            return event_ids
+    
+    async def _send_dm(self, message: str, recipient: Optional[Union[str, PublicKey]]) -> Optional[str]:
+        # Ensure we have a recipient public key
+        try:
+            recipient_public_key = self._resolve_recipient(recipient)
+        except Exception as e:
+            logger.error(f"Invalid recipient public key {recipient}: {e}")
+            return None
+        if not recipient_public_key:
+            logger.error("No recipient public key configured")
+            return None
+        
+        with start_span('nostr.verify_connection') as span:
+            ready = await self._ensure_active_relay()
+            span.set_attribute('relay', self.active_relay or '')
+        if not ready:
+            return None
         
+        # Publish where the recipient reads DMs when they advertise inbox relays
+        with start_span('nostr.inbox_lookup') as span:
+            inbox = await self.get_inbox_relays(recipient_public_key)
+            span.set_attribute('inbox.relays', len(inbox))
+        targets = self._send_targets(inbox)
+        parts = split_message(message, min(self.message_budget(relay_url) for relay_url in targets))
+        current_span().set_attribute('message.parts', len(parts))
+        if len(parts) > 1:
+            logger.info(f"Message of {json_text_size(message)} bytes exceeds the size budget of relay(s) "
+                        f"{', '.join(targets)}, sending {len(parts)} parts")
+        message_key = self._message_key(recipient_public_key, message) if len(parts) > 1 else None
+        delivered = self._pop_delivered_parts(message_key)
+        event_ids: List[str] = []
+        for index, part in enumerate(parts, start=1):
+            part_key = hashlib.sha256(part.encode('utf-8')).hexdigest()
+            event_id = delivered.get(part_key)
+            if event_id is None:
+                event_id = await self._send_to_inbox(part, recipient_public_key, inbox) if inbox else None
+            if event_id is None:
+                event_id = await self._send_dm_part(part, recipient_public_key)
+            if event_id is None:
+                if message_key and delivered:
+                    self._delivered_parts[message_key] = (time.monotonic(), delivered)
+                    logger.warning(f"Sent {len(delivered)}/{len(parts)} parts, a retry resumes at part {index}")
+                return None
+            delivered[part_key] = event_id
+            event_ids.append(event_id)
+        return ",".join(event_ids)
+    
+    def _send_targets(self, inbox: List[str]) -> List[str]:
+        """Every relay a message may end up on: the inbox relays, then the active relay and failover"""
+        return list(dict.fromkeys(inbox + [self.active_relay] + self.ranked_relays()))
+    
+    @staticmethod
+    def _message_key(recipient_public_key: PublicKey, message: str) -> str:
+        return hashlib.sha256(f"{recipient_public_key.to_hex()}\n{message}".encode('utf-8')).hexdigest()
+    
+    def _pop_delivered_parts(self, message_key: Optional[str]) -> Dict[str, str]:
+        """Parts of message_key delivered by an earlier, partly failed send (forgetting expired ones)"""
+        now = time.monotonic()
+        self._delivered_parts = {key: entry for key, entry in self._delivered_parts.items()
+                                 if now - entry[0] < PARTIAL_SEND_TTL}
+        if message_key is None:
+            return {}
+        return self._delivered_parts.pop(message_key, (now, {}))[1]
+    
+    async def get_inbox_relays(self, recipient_public_key: PublicKey) -> List[str]:
+        """Recipient's kind 10050 DM relays, looked up on the connected relays and cached with a TTL"""
+        inbox_config = self.config.inbox_relays_config
+        if not inbox_config.get('enabled', True):
+            return []
+        recipient_hex = recipient_public_key.to_hex()
+        cached = self.inbox_relays.get(recipient_hex)
+        if cached is not None:
+            return cached
+        
+        event_filter = Filter().kind(Kind(INBOX_RELAYS_KIND)).author(recipient_public_key).limit(1)
+        timeout = timedelta(seconds=inbox_config.get('timeout', 5))
+        clients = [client for relay_url, client in self.clients.items() if self.relay_status[relay_url]['connected']]
+        results = await asyncio.gather(*(client.fetch_events(event_filter, timeout) for client in clients),
+                                       return_exceptions=True)
+        newest: Optional[Event] = None
+        for result in results:
+            if isinstance(result, Exception):
+                logger.debug(f"Inbox relay lookup failed: {result}")
+                continue
+            for event in result.to_vec():
+                if newest is None or event.created_at().as_secs() > newest.created_at().as_secs():
+                    newest = event
+        
+        relays = parse_inbox_relays([tag.as_vec() for tag in newest.tags().to_vec()],
+                                    inbox_config.get('max_relays', 3)) if newest else []
+        if clients:
+            # Only cache answers; with nothing connected try again next time
+            self.inbox_relays.put(recipient_hex, relays)
+        if relays:
+            logger.info(f"Recipient {recipient_public_key.to_bech32()} reads DMs on {', '.join(relays)}")
+            await asyncio.gather(*(self.refresh_relay_info(relay_url) for relay_url in relays))
+        return relays
+    
+    async def _connect_inbox_relays(self, relay_urls: List[str]) -> List[str]:
+        """Add inbox relays to the shared inbox client and return the ones that are connected"""
+        if self.inbox_client is None:
+            self.inbox_client = Client(self.signer)
+            self.inbox_client.automatic_authentication(True)
+        added = False
+        for relay_url in relay_urls:
+            self._ensure_relay_status(relay_url)
+            self._relay_url_index.setdefault(relay_url.rstrip('/'), relay_url)
+            if await self.inbox_client.add_relay(RelayUrl.parse(relay_url)):
+                added = True
+        if added:
+            await self.inbox_client.connect()
+            await self.inbox_client.wait_for_connection(timedelta(seconds=2))
+        relays = await asyncio.wait_for(self.inbox_client.relays(), timeout=5.0)
+        connected = {self._configured_relay_url(url) for url, relay in relays.items() if relay.is_connected()}
+        for relay_url in relay_urls:
+            self.inbox_connected[relay_url] = relay_url in connected
+        return [relay_url for relay_url in relay_urls if relay_url in connected]
+    
+    async def _send_to_inbox(self, message: str, recipient_public_key: PublicKey, relay_urls: List[str]) -> Optional[str]:
+        """Publish one gift wrap to the recipient's inbox relays only; None if none accepted it"""
+        try:
+            connected = await self._connect_inbox_relays(relay_urls)
+            if not connected:
+                raise RelayConnectionError("none connected")
+            event_id = await asyncio.wait_for(
+                self._send_private_msg(self.inbox_client, recipient_public_key, message, connected),
+                timeout=15.0
+            )
+            logger.info("Sent DM with event ID: %s via inbox relays %s", event_id, ", ".join(connected))
+            return event_id
+        except Exception as e:
+            logger.warning(f"Could not deliver to inbox relays {', '.join(relay_urls)}, using configured relays: {e}")
+            return None
+    
+    async def _send_dm_part(self, message: str, recipient_public_key: PublicKey) -> Optional[str]:
+        """Send one gift wrap via the active relay, failing over to the other relays
+
+        A relay that is connected but refuses the event is not counted as
+        failed and stays active; the event is still offered to the others.
+        """
+        rejected = False
         # Try to send message with the active relay
         try:
             client = self.clients[self.active_relay]
+            await self._pace(self.active_relay)
             
             # Send encrypted direct message with timeout
             event_id = await asyncio.wait_for(
-                client.send_private_msg(self.recipient_public_key, message),
+                self._send_private_msg(client, recipient_public_key, message),
                 timeout=15.0
             )
-            logger.info(f"Sent DM with event ID: {event_id} via relay {self.active_relay}")
+            logger.info("Sent DM with event ID: %s via relay %s", event_id, self.active_relay)
             return str(event_id)
             
         except asyncio.TimeoutError:
             logger.error(f"Timeout sending DM via relay {self.active_relay}")
+            self._record_rejection(self.active_relay, "timeout: no OK received")
             # Mark relay as disconnected and try failover
             self.relay_status[self.active_relay]['connected'] = False
             self.relay_status[self.active_relay]['failure_count'] += 1
             
+        except RelayRejectedError as e:
+            logger.warning(f"Relay {self.active_relay} refused DM, offering it to the other relays: {e}")
+            rejected = True
+            
         except Exception as e:
             logger.error(f"Error sending DM via relay {self.active_relay}: {e}")
             # Mark relay as disconnected and try failover
@@ -242,29 +656,211 @@ class NostrClient:
         
         # Try failover to next available relay
         logger.info("Attempting failover to next available relay")
-        for relay_url in self.config.relay_urls:
+        failed_relay = self.active_relay
+        for relay_url in self.ranked_relays():
             # Skip the currently failed relay
-            if relay_url == self.active_relay:
+            if relay_url == failed_relay:
                 continue
                 
-            if await self.connect_to_relay(relay_url):
-                self.active_relay = relay_url
+            with start_span('nostr.failover_connect', {'relay': relay_url}):
+                async with self._connect_lock:
+                    connected = (self.relay_status[relay_url]['connected'] and relay_url in self.clients
+                                 and await self.verify_relay_connection(relay_url)) \
+                        or await self.connect_to_relay(relay_url)
+                    if connected and not rejected:
+                        self.active_relay = relay_url
+                        self.last_good_relay = relay_url
+                    client = self.clients.get(relay_url)
+            if connected:
                 try:
-                    client = self.clients[self.active_relay]
+                    await self._pace(relay_url)
                     event_id = await asyncio.wait_for(
-                        client.send_private_msg(self.recipient_public_key, message),
+                        self._send_private_msg(client, recipient_public_key, message),
                         timeout=15.0
                     )
-                    logger.info(f"Sent DM with event ID: {event_id} via failover relay {self.active_relay}")
+                    logger.info(f"Sent DM with event ID: {event_id} via failover relay {relay_url}")
                     return str(event_id)
+                except RelayRejectedError as e2:
+                    logger.warning(f"Failover relay {relay_url} refused DM: {e2}")
                 except Exception as e2:
-                    logger.error(f"Error sending DM via failover relay {self.active_relay}: {e2}")
-                    self.relay_status[self.active_relay]['connected'] = False
-                    self.relay_status[self.active_relay]['failure_count'] += 1
+                    logger.error(f"Error sending DM via failover relay {relay_url}: {e2}")
+                    self.relay_status[relay_url]['connected'] = False
+                    self.relay_status[relay_url]['failure_count'] += 1
         
         logger.error("Failed to send DM via any relay")
         return None
     
+    async def send_many(self, items: List[Tuple[Optional[Union[str, PublicKey]], str]]) -> List[Optional[str]]:
+        """Send a batch of (recipient, message) DMs concurrently
+        
+        Each item goes where send_dm would send it: the recipient's inbox relays
+        when they advertise any, otherwise the active relay. A recipient of None
+        means the configured recipient. Results are returned in input order; items
+        that fail, or need splitting, are retried one by one through send_dm so
+        they still get failover.
+        """
+        results: List[Optional[str]] = [None] * len(items)
+        if not items:
+            return results
+        
+        if not await self._ensure_active_relay():
+            return results
+        
+        relay_url = self.active_relay
+        client = self.clients[relay_url]
+        semaphore = asyncio.Semaphore(self.config.batch_config.get('max_concurrency', 16))
+        # Items published to the active relay, and those it answered with a rejection,
+        # which says nothing about the connection
+        attempted: List[int] = []
+        rejected: List[int] = []
+        # Inbox relays looked up once per distinct recipient, not once per item
+        inboxes: Dict[str, List[str]] = {}
+        
+        async def send_item(index: int, recipient: Optional[Union[str, PublicKey]], message: str) -> None:
+            async with semaphore:
+                try:
+                    recipient_public_key = self._resolve_recipient(recipient)
+                    if not recipient_public_key:
+                        logger.error(f"No recipient public key for batch item {index}")
+                        return
+                    inbox = inboxes[recipient_public_key.to_hex()]
+                    if json_text_size(message) > min(self.message_budget(url) for url in self._send_targets(inbox)):
+                        # Left for send_dm, which splits it
+                        return
+                    if inbox:
+                        results[index] = await self._send_to_inbox(message, recipient_public_key, inbox)
+                        if results[index]:
+                            return
+                    attempted.append(index)
+                    await self._pace(relay_url)
+                    event_id = await asyncio.wait_for(
+                        self._send_private_msg(client, recipient_public_key, message),
+                        timeout=15.0
+                    )
+                    results[index] = str(event_id)
+                except RelayRejectedError as e:
+                    rejected.append(index)
+                    logger.debug(f"Batch item {index} refused by relay {relay_url}: {e}")
+                except Exception as e:
+                    logger.debug(f"Batch item {index} failed via relay {relay_url}: {e}")
+        
+        for recipient, _ in items:
+            try:
+                recipient_public_key = self._resolve_recipient(recipient)
+            except Exception:
+                continue
+            if recipient_public_key and recipient_public_key.to_hex() not in inboxes:
+                inboxes[recipient_public_key.to_hex()] = await self.get_inbox_relays(recipient_public_key)
+        await asyncio.gather(*(send_item(i, recipient, message) for i, (recipient, message) in enumerate(items)))
+        
+        failed = [i for i, result in enumerate(results) if result is None]
+        logger.info(f"Sent {len(items) - len(failed)}/{len(items)} batched DMs, relay {relay_url} for those without inbox relays")
+        if attempted and all(results[i] is None for i in attempted) and len(rejected) < len(attempted):
+            # Nothing got through, the relay is most likely gone
+            self.relay_status[relay_url]['connected'] = False
+            self.relay_status[relay_url]['failure_count'] += 1
+        
+        for index in failed:
+            recipient, message = items[index]
+            results[index] = await self.send_dm(message, recipient)
+        
+        return results
+    
+    async def _build_gift_wrap(self, recipient_public_key: PublicKey, message: str) -> Event:
+        """Build a NIP-17 gift wrap, signing the outer layer with a pooled ephemeral key"""
+        rumor = EventBuilder.private_msg_rumor(recipient_public_key, message).build(self.keys.public_key())
+        seal_builder = await EventBuilder.seal(self.signer, recipient_public_key, rumor)
+        seal = await seal_builder.sign(self.signer)
+        
+        ephemeral_keys = self.key_pool.acquire()
+        created_at = Timestamp.from_secs(int(time.time()) - random.randint(0, GIFT_WRAP_TIME_TWEAK))
+        
+        def wrap() -> Event:
+            content = nip44_encrypt(ephemeral_keys.secret_key(), recipient_public_key, seal.as_json(), Nip44Version.V2)
+            return EventBuilder(Kind(1059), content)\
+                .tags([Tag.public_key(recipient_public_key)])\
+                .custom_created_at(created_at)\
+                .sign_with_keys(ephemeral_keys)
+        
+        # Encrypting and signing are synchronous; off the loop, the wraps of a batch are built in parallel
+        return await asyncio.to_thread(wrap)
+    
+    async def _send_private_msg(self, client: Client, recipient_public_key: PublicKey, message: str,
+                                relay_urls: Optional[List[str]] = None) -> str:
+        """Send a NIP-17 private message and return its event id once at least one relay accepted it
+        
+        relay_urls restricts publishing to those relays of the client.
+        """
+        targets = [RelayUrl.parse(relay_url) for relay_url in relay_urls] if relay_urls else None
+        gift_wrap: Optional[Event] = None
+        if self.key_pool is None:
+            # The SDK encrypts inside send_private_msg, so this publish span includes encryption
+            with start_span('nostr.publish', {'nostr.sdk_built': True}, kind=SPAN_KIND_CLIENT) as span:
+                start_time = time.monotonic()
+                if targets:
+                    output = await client.send_private_msg_to(targets, recipient_public_key, message)
+                else:
+                    output = await client.send_private_msg(recipient_public_key, message)
+        else:
+            with start_span('nostr.encrypt'):
+                gift_wrap = await self._build_gift_wrap(recipient_public_key, message)
+            with start_span('nostr.publish', kind=SPAN_KIND_CLIENT) as span:
+                start_time = time.monotonic()
+                output = await client.send_event_to(targets, gift_wrap) if targets else await client.send_event(gift_wrap)
+        self._record_send_output(output, time.monotonic() - start_time)
+        self._trace_relay_results(span, output)
+        
+        if not output.success:
+            reasons = "; ".join(f"{relay_url}: {error}" for relay_url, error in output.failed.items())
+            raise RelayRejectedError(f"Event {output.id.to_hex()} rejected by all relays: {reasons or 'no OK received'}")
+        if self.delivery:
+            self.delivery.track(output.id.to_hex(), gift_wrap, recipient_public_key,
+                                [self._configured_relay_url(relay_url) for relay_url in output.success], start_time)
+        return output.id.to_hex()
+    
+    def _trace_relay_results(self, span: Any, output: Any) -> None:
+        """Per-relay child spans of a finished publish with each relay's OK or rejection
+
+        The SDK reports outcomes but not per-relay timings, so each child covers the whole publish.
+        """
+        if not span.recording:
+            return
+        span.set_attribute('nostr.event_id', output.id.to_hex())
+        results = [(relay_url, True, None) for relay_url in output.success] + \
+                  [(relay_url, False, message) for relay_url, message in output.failed.items()]
+        for relay_url, accepted, message in results:
+            relay_span = start_span('relay.publish', {'relay': self._configured_relay_url(relay_url)},
+                                    kind=SPAN_KIND_CLIENT, parent=span.context(), start_ns=span.start_ns)
+            if not accepted:
+                relay_span.set_error(message or "no OK received")
+            relay_span.end(span.end_ns)
+    
+    async def start_delivery_verification(self) -> None:
+        """Open the read-back subscription when delivery verification is enabled"""
+        delivery_config = self.config.delivery_config
+        if not delivery_config.get('verify') or self.delivery is not None:
+            return
+        verifier = DeliveryVerifier(
+            self.signer,
+            delivery_config.get('verify_relays') or self.config.relay_urls,
+            deadline=delivery_config.get('deadline', 10),
+            max_republish=delivery_config.get('max_republish', 1)
+        )
+        try:
+            await verifier.start([self.recipient_public_key])
+            self.delivery = verifier
+        except Exception as e:
+            logger.error(f"Failed to start delivery verification: {e}")
+            await verifier.stop()
+    
+    def get_delivery_stats(self) -> Optional[Dict[str, Any]]:
+        """Return confirmed/re-published/unconfirmed counts and time-to-visible, or None when disabled"""
+        return self.delivery.get_stats() if self.delivery else None
+    
+    def get_key_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Return ephemeral key pool hit/miss counters, or None when the pool is disabled"""
+        return self.key_pool.stats() if self.key_pool else None
+    
     async def health_check_relays(self) -> None:
         """Periodically check relay health and attempt reconnections"""
         while True:
@@ -273,6 +869,17 @@ class NostrClient:
                 check_interval = health_config.get('check_interval', 300)  # Default 5 minutes
                 
                 logger.debug("Running relay health check")
+                await self.refresh_all_relay_info()
+                if self.key_pool:
+                    logger.debug(f"Ephemeral key pool stats: {self.key_pool.stats()}")
+                rejections = self.get_relay_metrics()['rejections']
+                if rejections:
+                    logger.info(f"Relay rejections since start: {rejections}")
+                if self.delivery:
+                    delivery_stats = self.delivery.get_stats()
+                    logger.info(f"Delivery confirmation: {delivery_stats['confirmed']}/{delivery_stats['tracked']} seen, "
+                                f"{delivery_stats['republished']} re-published, {delivery_stats['unconfirmed']} unconfirmed, "
+                                f"p50 time-to-visible {delivery_stats['time_to_visible']['p50']}s")
                 
                 # Check each relay
                 for relay_url in self.config.relay_urls:
@@ -297,11 +904,17 @@ class NostrClient:
                         else:
                             logger.debug(f"Relay {relay_url} connection verified")
                     
-                    # If relay is disconnected and we haven't exceeded retry attempts
+                    # If relay is disconnected, reconnect once its backoff has expired; the backoff grows
+                    # with failure_count, so a dead relay is retried ever more rarely but never given up on.
                     # This is a fallback in case auto-reconnect fails
-                    if not status['connected'] and status['failure_count'] < health_config.get('retry_attempts', 3):
-                        logger.info(f"Attempting to reconnect to relay {relay_url}")
-                        await self.connect_to_relay(relay_url)
+                    if not status['connected'] and current_time >= status['retry_after']:
+                        async with self._connect_lock:
+                            # A send may have reconnected it while we waited for the lock
+                            if not status['connected']:
+                                logger.info(f"Attempting to reconnect to relay {relay_url}")
+                                await self.connect_to_relay(relay_url)
+                
+                self.save_relay_state()
                 
                 # Wait for next check
                 await asyncio.sleep(check_interval)
@@ -335,6 +948,7 @@ class NostrClient:
         if self.health_check_task is None or self.health_check_task.done():
             self.health_check_task = asyncio.create_task(self.health_check_relays())
             logger.info("Started relay health monitoring")
+        await self.start_delivery_verification()
     
     async def stop_health_monitoring(self) -> None:
         """Stop background health monitoring task"""
@@ -379,6 +993,23 @@ class NostrClient:
                     del self.clients[relay_url]
         
         self.active_relay = None
+        self.save_relay_state()
+        
+        if self.delivery is not None:
+            await self.delivery.stop()
+            self.delivery = None
+        
+        if self.inbox_client is not None:
+            try:
+                await asyncio.wait_for(self.inbox_client.disconnect(), timeout=5.0)
+            except Exception as e:
+                logger.error(f"Error disconnecting from inbox relays: {e}")
+            self.inbox_client = None
+            self.inbox_connected.clear()
+        
+        if self.key_pool:
+            self.key_pool.stop()
+            self.key_pool = None
         logger.info("Finished disconnecting from all Nostr relays")
 
 # Example of how to use the Nostr client
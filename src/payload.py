@@ -0,0 +1,182 @@
+"""
+Alert payload encoding, gift wrap size estimation and splitting of messages that exceed a relay's limits
+"""
+import json
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+# JSON around the message in each layer (ids, pubkeys, signatures, tags, timestamps),
+# measured on nostr_sdk output and rounded up
+RUMOR_OVERHEAD = 290
+SEAL_OVERHEAD = 350
+GIFT_WRAP_OVERHEAD = 420
+# ["EVENT", ...] framing counted by NIP-11 max_message_length
+EVENT_FRAME_OVERHEAD = 12
+
+# Largest plaintext NIP-44 v2 can encrypt; the seal is the plaintext of the outer layer
+NIP44_MAX_PLAINTEXT = 65535
+
+# Room reserved for the "(12/34)\n" part header
+PART_HEADER_RESERVE = 16
+# Smallest size messages are split to; relays too small for a gift wrap of it are not published to
+MIN_MESSAGE_SIZE = 128
+TRUNCATION_MARK = '…'
+
+# Longest line the compact encoding emits by default, well under any part budget so splitting never truncates it
+COMPACT_LINE_WIDTH = 512
+
+def json_text_size(text: str) -> int:
+    """UTF-8 size of text once escaped as a JSON string, without the quotes"""
+    return len(json.dumps(text, ensure_ascii=False).encode('utf-8')) - 2
+
+def nip44_padded_len(length: int) -> int:
+    """NIP-44 v2 plaintext padding"""
+    if length <= 32:
+        return 32
+    next_power = 1 << (math.floor(math.log2(length - 1)) + 1)
+    chunk = 32 if next_power <= 256 else next_power // 8
+    return chunk * ((length - 1) // chunk + 1)
+
+def nip44_payload_size(plaintext_size: int) -> int:
+    """Base64 size of a NIP-44 v2 payload: version, nonce, length prefix, padded text, MAC"""
+    raw = 1 + 32 + 2 + nip44_padded_len(plaintext_size) + 32
+    return 4 * math.ceil(raw / 3)
+
+def estimate_gift_wrap_size(message: str) -> int:
+    """Estimated size of the EVENT message carrying a NIP-17 gift wrap of message"""
+    return estimate_gift_wrap_size_for(json_text_size(message))
+
+def estimate_gift_wrap_size_for(message_size: int) -> int:
+    """estimate_gift_wrap_size for a message whose JSON-escaped size is already known"""
+    seal_content = nip44_payload_size(message_size + RUMOR_OVERHEAD)
+    wrap_content = nip44_payload_size(seal_content + SEAL_OVERHEAD)
+    return wrap_content + GIFT_WRAP_OVERHEAD + EVENT_FRAME_OVERHEAD
+
+def _fits(message_size: int, max_event_size: Optional[int]) -> bool:
+    seal_size = nip44_payload_size(message_size + RUMOR_OVERHEAD) + SEAL_OVERHEAD
+    if message_size + RUMOR_OVERHEAD > NIP44_MAX_PLAINTEXT or seal_size > NIP44_MAX_PLAINTEXT:
+        return False
+    return max_event_size is None or estimate_gift_wrap_size_for(message_size) <= max_event_size
+
+def max_message_size(max_event_size: Optional[int] = None) -> int:
+    """Largest JSON-escaped message size whose gift wrap fits in max_event_size and NIP-44
+
+    Never below MIN_MESSAGE_SIZE: a relay with a smaller limit rejects our
+    gift wraps whatever their size, and splitting further would not help.
+    """
+    low, high = MIN_MESSAGE_SIZE, NIP44_MAX_PLAINTEXT
+    if not _fits(low, max_event_size):
+        return MIN_MESSAGE_SIZE
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _fits(middle, max_event_size):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def _truncate(line: str, budget: int) -> str:
+    """Cut a line so its JSON-escaped size fits budget, marking the cut"""
+    budget -= json_text_size(TRUNCATION_MARK)
+    size = 0
+    for index, char in enumerate(line):
+        size += json_text_size(char)
+        if size > budget:
+            return line[:index] + TRUNCATION_MARK
+    return line
+
+def split_message(message: str, max_size: Optional[int]) -> List[str]:
+    """Split a message on line boundaries into numbered parts of at most max_size escaped bytes
+
+    Lines that do not fit in a part on their own are truncated. Returns the
+    message unchanged when it already fits or max_size is None (no limit known).
+    """
+    if max_size is None or json_text_size(message) <= max_size:
+        return [message]
+    budget = max(1, max_size - PART_HEADER_RESERVE)
+    newline_size = json_text_size('\n')
+
+    chunks: List[List[str]] = [[]]
+    chunk_size = 0
+    # A trailing newline would otherwise become an empty last part
+    for line in message.rstrip('\n').split('\n'):
+        line_size = json_text_size(line)
+        if line_size > budget:
+            line = _truncate(line, budget)
+            line_size = json_text_size(line)
+        added = line_size + (newline_size if chunks[-1] else 0)
+        if chunks[-1] and chunk_size + added > budget:
+            chunks.append([])
+            chunk_size = 0
+            added = line_size
+        chunks[-1].append(line)
+        chunk_size += added
+
+    total = len(chunks)
+    return [f"({index}/{total})\n" + "\n".join(lines) for index, lines in enumerate(chunks, start=1)]
+
+def render_lines(rows: List[Tuple[str, str]]) -> str:
+    """One "name: state" line per entity"""
+    return "\n".join(f"{name}: {state}" for name, state in rows)
+
+def _render_members(label: str, members: List[Tuple[str, str]]) -> str:
+    """label followed by the names, those sharing a first word written once as Kitchen [Light, Door]"""
+    buckets: Dict[str, List[str]] = {}
+    for prefix, rest in members:
+        buckets.setdefault(prefix, []).append(rest)
+    items: List[str] = []
+    for prefix, rests in buckets.items():
+        if not prefix:
+            items.extend(rests)
+        elif len(rests) == 1:
+            items.append(f"{prefix} {rests[0]}")
+        else:
+            items.append(f"{prefix} [{', '.join(rests)}]")
+    return label + ", ".join(items)
+
+def render_compact(rows: List[Tuple[str, str]], line_width: int = COMPACT_LINE_WIDTH) -> str:
+    """Tabular encoding: entities sharing a state become one "state (n): name, name, ..." line
+
+    Entities with a state of their own keep the "name: state" form. Within a
+    line, names starting with the same word (usually the area) share it:
+    "off (3): Kitchen [Light, Plug], Garage Door". Groups appear in order of
+    their first entity and wrap at line_width escaped bytes, repeating the
+    state label, so every line fits in a single message part.
+    """
+    groups: Dict[str, List[str]] = {}
+    for name, state in rows:
+        groups.setdefault(state, []).append(name)
+
+    lines: List[str] = []
+    for state, names in groups.items():
+        if len(names) == 1:
+            lines.append(f"{names[0]}: {state}")
+            continue
+        label = f"{state} ({len(names)}): "
+        members: List[Tuple[str, str]] = []
+        prefixes: Set[str] = set()
+        size = json_text_size(label)
+        for name in names:
+            prefix, _, rest = name.partition(' ')
+            member = (prefix, rest) if rest else ('', name)
+            # Upper bound of what the member adds: separator, brackets and the prefix unless already on the line
+            added = json_text_size(member[1]) + 5 + (0 if prefix in prefixes else json_text_size(prefix))
+            if members and size + added > line_width:
+                lines.append(_render_members(label, members))
+                members, prefixes, size = [], set(), json_text_size(label)
+            members.append(member)
+            prefixes.add(member[0])
+            size += added
+        lines.append(_render_members(label, members))
+    return "\n".join(lines)
+
+def encode_rows(rows: List[Tuple[str, str]], payload_format: str = 'lines',
+                line_width: int = COMPACT_LINE_WIDTH) -> str:
+    """Render (name, state) rows as 'lines', 'compact', or whichever of the two is smaller ('auto')"""
+    if payload_format == 'lines':
+        return render_lines(rows)
+    compact = render_compact(rows, line_width)
+    if payload_format == 'compact':
+        return compact
+    lines = render_lines(rows)
+    return compact if json_text_size(compact) < json_text_size(lines) else lines
@@ -0,0 +1,97 @@
+"""
+NIP-11 relay information documents: fetching, the limits we act on, and publish pacing
+"""
+import json
+import logging
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse, urlunparse
+from payload import EVENT_FRAME_OVERHEAD, GIFT_WRAP_OVERHEAD, MIN_MESSAGE_SIZE, estimate_gift_wrap_size_for
+
+logger = logging.getLogger(__name__)
+
+# Publish pacing learned from rate-limited rejections, in seconds between events
+MIN_PACING_INTERVAL = 0.5
+MAX_PACING_INTERVAL = 60.0
+# Interval kept after each accepted event while recovering from rate limiting
+PACING_DECAY = 0.9
+
+# Largest NIP-11 document we are willing to read
+MAX_DOCUMENT_SIZE = 256 * 1024
+
+def info_url(relay_url: str) -> str:
+    """HTTP(S) URL serving the NIP-11 document of a ws(s):// relay"""
+    parsed = urlparse(relay_url)
+    scheme = 'https' if parsed.scheme == 'wss' else 'http'
+    return urlunparse(parsed._replace(scheme=scheme, path=parsed.path or '/'))
+
+def fetch_relay_info(relay_url: str, timeout: float = 5.0) -> Dict[str, Any]:
+    """Blocking fetch of a relay's NIP-11 document"""
+    request = urllib.request.Request(info_url(relay_url), headers={'Accept': 'application/nostr+json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        document = json.loads(response.read(MAX_DOCUMENT_SIZE))
+    if not isinstance(document, dict):
+        raise ValueError("NIP-11 document is not a JSON object")
+    return document
+
+def parse_limits(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the NIP-11 fields that affect publishing gift wraps"""
+    limitation = document.get('limitation') if isinstance(document.get('limitation'), dict) else {}
+    supported_nips = document.get('supported_nips')
+
+    def positive_int(value: Any) -> Optional[int]:
+        return value if isinstance(value, int) and not isinstance(value, bool) and value > 0 else None
+
+    return {
+        'max_message_length': positive_int(limitation.get('max_message_length')),
+        'max_content_length': positive_int(limitation.get('max_content_length')),
+        'min_pow_difficulty': positive_int(limitation.get('min_pow_difficulty')) or 0,
+        'auth_required': bool(limitation.get('auth_required', False)),
+        'payment_required': bool(limitation.get('payment_required', False)),
+        'restricted_writes': bool(limitation.get('restricted_writes', False)),
+        'supported_nips': [nip for nip in supported_nips if isinstance(nip, int)]
+                          if isinstance(supported_nips, list) else None,
+        'fetched_at': time.time()
+    }
+
+def publish_blockers(limits: Dict[str, Any], can_auth: bool = False) -> Optional[str]:
+    """Why a relay cannot take our gift wraps according to its NIP-11 limits, or None"""
+    if limits.get('payment_required'):
+        return 'payment required'
+    if limits.get('restricted_writes'):
+        return 'restricted writes'
+    if limits.get('min_pow_difficulty'):
+        return f"proof of work {limits['min_pow_difficulty']} required"
+    if limits.get('auth_required') and not can_auth:
+        return 'auth required'
+    event_size = max_event_size(limits)
+    if event_size is not None and event_size < estimate_gift_wrap_size_for(MIN_MESSAGE_SIZE):
+        return f"events limited to {event_size} bytes"
+    return None
+
+def advertises_gift_wraps(limits: Dict[str, Any]) -> bool:
+    """False only when the relay lists its NIPs and NIP-59 is not among them"""
+    supported_nips = limits.get('supported_nips')
+    return supported_nips is None or 59 in supported_nips
+
+def max_event_size(limits: Dict[str, Any]) -> Optional[int]:
+    """Byte budget for one EVENT message carrying a gift wrap on this relay, if it advertises one"""
+    budgets = [limits.get('max_message_length')]
+    if limits.get('max_content_length'):
+        budgets.append(limits['max_content_length'] + GIFT_WRAP_OVERHEAD + EVENT_FRAME_OVERHEAD)
+    budgets = [budget for budget in budgets if budget]
+    return min(budgets) if budgets else None
+
+def slow_down(limits: Dict[str, Any]) -> float:
+    """Double the pacing interval after a rate-limited rejection"""
+    interval = limits.get('min_publish_interval') or 0
+    limits['min_publish_interval'] = min(MAX_PACING_INTERVAL, max(MIN_PACING_INTERVAL, interval * 2))
+    return limits['min_publish_interval']
+
+def speed_up(limits: Dict[str, Any]) -> None:
+    """Shorten the pacing interval after an accepted event, dropping it once small"""
+    interval = limits.get('min_publish_interval') or 0
+    if interval:
+        interval *= PACING_DECAY
+        limits['min_publish_interval'] = interval if interval >= MIN_PACING_INTERVAL else 0
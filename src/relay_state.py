@@ -0,0 +1,95 @@
+"""
+Relay health persisted across restarts so startup targets the best known relay
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+# relay_status fields that survive a restart; connection state is always re-learned
+PERSISTED_FIELDS = ('failure_count', 'retry_after', 'latency', 'accepted', 'rejected',
+                    'rejection_reasons', 'last_rejection', 'limits')
+
+# Weight of the newest sample in the per-relay latency score
+LATENCY_SMOOTHING = 0.3
+
+def update_latency(status: Dict[str, Any], elapsed: float) -> None:
+    """Fold a connect/publish latency sample into the relay's moving-average score"""
+    previous: Optional[float] = status.get('latency')
+    status['latency'] = elapsed if previous is None else previous + LATENCY_SMOOTHING * (elapsed - previous)
+
+def backoff_delay(failure_count: int, base: float, maximum: float) -> float:
+    """Exponential backoff after consecutive connection failures"""
+    if failure_count <= 0:
+        return 0.0
+    return min(maximum, base * 2 ** (failure_count - 1))
+
+def rank_relays(relay_urls: List[str], relay_status: Dict[str, Dict[str, Any]],
+                last_good: Optional[str] = None, now: Optional[float] = None) -> List[str]:
+    """Order relays for connection attempts
+
+    Relays outside their backoff come first: the last-known-good relay, then
+    fewest failures and lowest latency score, with configured order breaking
+    ties. Relays still backing off follow, soonest retry first.
+    """
+    now = now if now is not None else time.time()
+
+    def key(indexed: Any) -> Any:
+        index, relay_url = indexed
+        status = relay_status.get(relay_url, {})
+        retry_after = status.get('retry_after', 0)
+        if retry_after > now:
+            return (1, retry_after, index)
+        latency = status.get('latency')
+        return (0, relay_url != last_good, status.get('failure_count', 0),
+                latency if latency is not None else float('inf'), index)
+
+    return [relay_url for _, relay_url in sorted(enumerate(relay_urls), key=key)]
+
+class RelayStateStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> Dict[str, Any]:
+        """Return {'last_good_relay', 'relays'}; empty if missing, unreadable or from another version"""
+        try:
+            with open(self.path, 'r') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return {'last_good_relay': None, 'relays': {}}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable relay state {self.path}: {e}")
+            return {'last_good_relay': None, 'relays': {}}
+        if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+            logger.warning(f"Ignoring relay state {self.path} with unknown format")
+            return {'last_good_relay': None, 'relays': {}}
+        return {'last_good_relay': state.get('last_good_relay'), 'relays': state.get('relays') or {}}
+
+    def save(self, relay_status: Dict[str, Dict[str, Any]], last_good_relay: Optional[str]) -> bool:
+        """Atomically write the persisted fields of every relay"""
+        state = {
+            'version': STATE_VERSION,
+            'saved_at': time.time(),
+            'last_good_relay': last_good_relay,
+            'relays': {
+                relay_url: {field: status[field] for field in PERSISTED_FIELDS if field in status}
+                for relay_url, status in relay_status.items()
+            }
+        }
+        temp_path = f"{self.path}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'w') as file:
+                json.dump(state, file)
+            os.replace(temp_path, self.path)
+            return True
+        except OSError as e:
+            logger.warning(f"Could not save relay state to {self.path}: {e}")
+            return False
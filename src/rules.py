@@ -0,0 +1,213 @@
+"""
+Threshold and expression rules compiled once and evaluated incrementally per state change
+"""
+import ast
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+from exceptions import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+# A compiled expression node: takes the current entity states, returns a value
+Evaluator = Callable[[Dict[str, str]], Any]
+
+def _as_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _compare(op: ast.cmpop, left: Any, right: Any) -> bool:
+    """Compare numerically when both sides are numbers, otherwise as strings (equality only)"""
+    left_number, right_number = _as_number(left), _as_number(right)
+    if left_number is not None and right_number is not None:
+        left, right = left_number, right_number
+    elif isinstance(op, (ast.Eq, ast.NotEq)):
+        left, right = str(left), str(right)
+    else:
+        return False
+    if isinstance(op, ast.Eq):
+        return left == right
+    if isinstance(op, ast.NotEq):
+        return left != right
+    if isinstance(op, ast.Lt):
+        return left < right
+    if isinstance(op, ast.LtE):
+        return left <= right
+    if isinstance(op, ast.Gt):
+        return left > right
+    return left >= right
+
+def _entity_id(node: ast.AST) -> Optional[str]:
+    """Rebuild a dotted entity id such as sensor.temp from an Attribute chain"""
+    parts: List[str] = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name) and parts:
+        parts.append(node.id)
+        return ".".join(reversed(parts))
+    return None
+
+class _Compiler:
+    """Turns a restricted Python expression AST into a tree of closures"""
+
+    def __init__(self) -> None:
+        self.dependencies: Set[str] = set()
+
+    def compile(self, node: ast.AST) -> Evaluator:
+        if isinstance(node, ast.Expression):
+            return self.compile(node.body)
+
+        if isinstance(node, ast.BoolOp):
+            operands = [self.compile(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda states: all(operand(states) for operand in operands)
+            return lambda states: any(operand(states) for operand in operands)
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = self.compile(node.operand)
+            return lambda states: not operand(states)
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+            value = -node.operand.value
+            return lambda states: value
+
+        if isinstance(node, ast.Compare):
+            operands = [self.compile(node.left)] + [self.compile(comparator) for comparator in node.comparators]
+            ops = list(node.ops)
+
+            def compare_chain(states: Dict[str, str]) -> bool:
+                values = [operand(states) for operand in operands]
+                if any(value is None for value in values):
+                    return False
+                return all(_compare(op, values[i], values[i + 1]) for i, op in enumerate(ops))
+            return compare_chain
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            value = node.value
+            return lambda states: value
+
+        # state('sensor.1st_floor') for entity ids that are not valid Python attribute chains
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'state' \
+                and len(node.args) == 1 and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+            return self._state_of(node.args[0].value)
+
+        entity_id = _entity_id(node)
+        if entity_id:
+            return self._state_of(entity_id)
+
+        raise ConfigurationError(f"Unsupported rule expression element: {ast.dump(node)}")
+
+    def _state_of(self, entity_id: str) -> Evaluator:
+        self.dependencies.add(entity_id)
+        return lambda states: states.get(entity_id)
+
+class Rule:
+    def __init__(self, name: str, condition: str, evaluator: Evaluator, dependencies: Set[str],
+                 hold_for: float = 0, message: Optional[str] = None) -> None:
+        self.name = name
+        self.condition = condition
+        self.evaluator = evaluator
+        self.dependencies = dependencies
+        self.hold_for = hold_for
+        self.message = message
+
+def compile_rule(spec: Dict[str, Any], index: int = 0) -> Rule:
+    """Compile a rule definition {name, condition, for, message}"""
+    if not isinstance(spec, dict) or not isinstance(spec.get('condition'), str):
+        raise ConfigurationError(f"Rule #{index} must be a mapping with a 'condition' string")
+    name: str = spec.get('name') or f"rule_{index}"
+    try:
+        tree = ast.parse(spec['condition'], mode='eval')
+    except SyntaxError as e:
+        raise ConfigurationError(f"Invalid condition in rule '{name}': {e}")
+    compiler = _Compiler()
+    evaluator = compiler.compile(tree)
+    if not compiler.dependencies:
+        raise ConfigurationError(f"Rule '{name}' does not reference any entity")
+    hold_for = spec.get('for', 0)
+    if not isinstance(hold_for, (int, float)) or isinstance(hold_for, bool) or hold_for < 0:
+        raise ConfigurationError(f"'for' must be a non-negative number of seconds in rule '{name}'")
+    return Rule(name, spec['condition'], evaluator, compiler.dependencies, hold_for, spec.get('message'))
+
+class RuleSet:
+    """Compiled rules plus the reverse index from entity id to the rules that read it"""
+
+    def __init__(self, specs: List[Dict[str, Any]]) -> None:
+        self.rules: List[Rule] = [compile_rule(spec, index) for index, spec in enumerate(specs)]
+        self.dependents: Dict[str, List[Rule]] = {}
+        for rule in self.rules:
+            for entity_id in rule.dependencies:
+                self.dependents.setdefault(entity_id, []).append(rule)
+
+    @property
+    def entities(self) -> Set[str]:
+        return set(self.dependents)
+
+class RuleEngine:
+    def __init__(self, rule_set: RuleSet) -> None:
+        self.rule_set = rule_set
+        self.states: Dict[str, str] = {}
+        self.friendly_names: Dict[str, str] = {}
+        # Rules currently true and when they became true
+        self._true_since: Dict[Rule, float] = {}
+        # True rules still waiting out their 'for' duration; the only ones tick() looks at
+        self._pending: Set[Rule] = set()
+        self._lock = threading.Lock()
+
+    def update(self, data: Dict[str, Any], now: Optional[float] = None) -> List[Rule]:
+        """Apply a state change and return the rules that fired because of it"""
+        entity_id: str = data.get('entity_id')
+        rules = self.rule_set.dependents.get(entity_id)
+        if not rules:
+            return []
+        new_state: Dict[str, Any] = data.get('new_state') or {}
+        now = now if now is not None else time.time()
+        fired: List[Rule] = []
+        with self._lock:
+            self.states[entity_id] = new_state.get('state')
+            self.friendly_names[entity_id] = new_state.get('attributes', {}).get('friendly_name', entity_id)
+            for rule in rules:
+                try:
+                    matched = bool(rule.evaluator(self.states))
+                except Exception as e:
+                    logger.error(f"Error evaluating rule '{rule.name}': {e}")
+                    matched = False
+                if not matched:
+                    self._true_since.pop(rule, None)
+                    self._pending.discard(rule)
+                    continue
+                if rule not in self._true_since:
+                    # Rising edge: fire now or once the 'for' duration has elapsed
+                    self._true_since[rule] = now
+                    if rule.hold_for:
+                        self._pending.add(rule)
+                    else:
+                        fired.append(rule)
+        return fired
+
+    def tick(self, now: Optional[float] = None) -> List[Rule]:
+        """Fire rules whose 'for' duration elapsed without a new state change"""
+        now = now if now is not None else time.time()
+        fired: List[Rule] = []
+        with self._lock:
+            for rule in list(self._pending):
+                if now - self._true_since[rule] >= rule.hold_for:
+                    self._pending.discard(rule)
+                    fired.append(rule)
+        return fired
+
+    def render(self, rule: Rule) -> str:
+        """Build the alert message for a fired rule"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            lines = [f"{self.friendly_names.get(entity_id, entity_id)}: {self.states.get(entity_id, 'N/A')}"
+                     for entity_id in sorted(rule.dependencies)]
+        header = rule.message or f"Rule triggered: {rule.name}"
+        return f"{timestamp}\n{header}\n" + "\n".join(lines)
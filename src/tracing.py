@@ -0,0 +1,285 @@
+"""
+Request-level tracing spans with OpenTelemetry-compatible (OTLP/JSON) export
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from typing import Any, Awaitable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'ha-nostr-alert'
+SCOPE_NAME = 'ha_nostr_alert'
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Most spans sent in one export batch
+MAX_EXPORT_BATCH = 512
+
+class SpanContext(NamedTuple):
+    """Identifies a span across a thread or queue hand-off; handoff_ns is when it was handed off"""
+    trace_id: str
+    span_id: str
+    handoff_ns: int = 0
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'status_message', 'links', '_token')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, start_ns: int,
+                 attributes: Optional[Dict[str, Any]], links: Optional[List[SpanContext]]) -> None:
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.status = 0
+        self.status_message = ''
+        self.links: List[SpanContext] = list(links) if links else []
+        self._token: Any = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def context(self) -> SpanContext:
+        return SpanContext(self.trace_id, self.span_id, time.time_ns())
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if self.status == 0:
+            self.status = STATUS_OK
+        if _tracer is not None:
+            _tracer.export(self)
+
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self._token)
+        self.end()
+
+class _NoopSpan:
+    """Returned whenever a trace is not sampled, so instrumented code needs no checks"""
+
+    recording = False
+
+    def context(self) -> None:
+        return None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def otlp_span(span: Span) -> Dict[str, Any]:
+    """A finished span in OTLP/JSON encoding"""
+    encoded: Dict[str, Any] = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': span.kind,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns),
+        'attributes': [{'key': key, 'value': _attribute_value(value)} for key, value in span.attributes.items()],
+        'status': {'code': span.status, 'message': span.status_message} if span.status_message
+                  else {'code': span.status}
+    }
+    if span.parent_id:
+        encoded['parentSpanId'] = span.parent_id
+    if span.links:
+        encoded['links'] = [{'traceId': link.trace_id, 'spanId': link.span_id} for link in span.links]
+    return encoded
+
+def otlp_request(spans: List[Span]) -> Dict[str, Any]:
+    """ExportTraceServiceRequest body for a batch of spans"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': SCOPE_NAME}, 'spans': [otlp_span(span) for span in spans]}]
+    }]}
+
+class Tracer:
+    """Samples traces at their root and exports finished spans from a background thread
+
+    Sampling is decided once per trace; children of an unsampled (or absent)
+    parent are the shared no-op span. Spans are batched and written either as
+    OTLP/JSON lines to a file (readable by the OpenTelemetry collector's
+    otlpjsonfile receiver) or POSTed to an OTLP/HTTP collector.
+    """
+
+    def __init__(self, tracing_config: Dict[str, Any]) -> None:
+        self.sample_rate: float = tracing_config.get('sample_rate', 0)
+        self.exporter: str = tracing_config.get('exporter', 'file')
+        self.path: str = tracing_config.get('path', '/data/traces.jsonl')
+        self.max_file_size: int = tracing_config.get('max_file_size', 10 * 1024 * 1024)
+        self.otlp_endpoint: str = tracing_config.get('otlp_endpoint', 'http://localhost:4318/v1/traces')
+        self.export_interval: float = tracing_config.get('export_interval', 5)
+        self.max_queue: int = tracing_config.get('max_queue', 2048)
+        self.stats: Dict[str, int] = {'exported': 0, 'dropped': 0, 'export_errors': 0}
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._stop.wait(self.export_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Export everything queued so far"""
+        while True:
+            batch: List[Span] = []
+            while len(batch) < MAX_EXPORT_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                if self.exporter == 'otlp':
+                    self._post(batch)
+                else:
+                    self._write(batch)
+                self.stats['exported'] += len(batch)
+            except Exception as e:
+                self.stats['export_errors'] += 1
+                logger.warning(f"Could not export {len(batch)} trace span(s) via {self.exporter}: {e}")
+
+    def _write(self, batch: List[Span]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.max_file_size and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_file_size:
+            os.replace(self.path, f"{self.path}.1")
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(otlp_request(batch), separators=(',', ':')) + "\n")
+
+    def _post(self, batch: List[Span]) -> None:
+        body = json.dumps(otlp_request(batch), separators=(',', ':')).encode('utf-8')
+        request = urllib.request.Request(self.otlp_endpoint, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.export_interval + 15)
+        self.flush()
+
+_tracer: Optional[Tracer] = None
+
+def configure_tracing(tracing_config: Dict[str, Any]) -> None:
+    """Start exporting sampled traces; with sample_rate 0 every span is a no-op"""
+    global _tracer
+    stop_tracing()
+    if tracing_config.get('sample_rate', 0) > 0:
+        _tracer = Tracer(tracing_config)
+        logger.info(f"Tracing {tracing_config['sample_rate']:.0%} of requests via {_tracer.exporter}")
+
+def stop_tracing() -> None:
+    """Flush and stop the exporter"""
+    global _tracer
+    if _tracer is not None:
+        tracer, _tracer = _tracer, None
+        tracer.stop()
+
+def get_tracing_stats() -> Optional[Dict[str, int]]:
+    return dict(_tracer.stats) if _tracer is not None else None
+
+def current_span() -> Any:
+    """The span entered in this thread or task, or the no-op span"""
+    return _current_span.get() or NOOP_SPAN
+
+def start_trace(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_SERVER,
+                links: Optional[List[SpanContext]] = None) -> Any:
+    """Root span of a new trace, subject to sampling"""
+    if _tracer is None or not _tracer.sampled():
+        return NOOP_SPAN
+    return Span(name, secrets.token_hex(16), None, kind, time.time_ns(), attributes, links)
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL,
+               parent: Optional[SpanContext] = None, start_ns: Optional[int] = None,
+               links: Optional[List[SpanContext]] = None) -> Any:
+    """Child of parent (default: the current span); a no-op when that trace is not sampled"""
+    if _tracer is None:
+        return NOOP_SPAN
+    if parent is None:
+        current = _current_span.get()
+        if current is None:
+            return NOOP_SPAN
+        trace_id, parent_id = current.trace_id, current.span_id
+    else:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    return Span(name, trace_id, parent_id, kind, start_ns or time.time_ns(), attributes, links)
+
+async def run_in_span(span: Any, awaitable: Awaitable) -> Any:
+    """Await with span current, e.g. in a task submitted to another thread's event loop"""
+    token = _current_span.set(span if span.recording else None)
+    try:
+        return await awaitable
+    finally:
+        _current_span.reset(token)
+
+atexit.register(stop_tracing)
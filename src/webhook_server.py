@@ -6,9 +6,10 @@ import logging
 import threading
 import queue
 from typing import Any, Dict, Optional
+from capture import WebhookCapture
+from logging_setup import PER_EVENT, event_extra
+from tracing import start_trace
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class WebhookServer:
@@ -16,6 +17,12 @@ class WebhookServer:
         self.app: Flask = Flask(__name__)
         self.config = config
         self.message_queue = message_queue
+        # Entities that can produce alerts: monitored, digest and rule inputs
+        self.accepted_entities = config.accepted_entities
+        # Records every received payload for offline replay (benchmarks/replay_benchmark.py)
+        capture_config: Dict[str, Any] = config.capture_config
+        self.capture: Optional[WebhookCapture] = WebhookCapture(capture_config) \
+            if capture_config.get('enabled') else None
         self.setup_routes()
     
     def setup_routes(self) -> None:
@@ -25,8 +32,19 @@ class WebhookServer:
     
     def handle_webhook(self):
         """Handle incoming webhook from Home Assistant"""
+        with start_trace('webhook', {'http.route': '/webhook'}) as span:
+            response = self._handle_webhook(span)
+            span.set_attribute('http.status_code', response[1])
+            if response[1] >= 500:
+                span.set_error(response[0].get_json().get('message', ''))
+            return response
+    
+    def _handle_webhook(self, span: Any):
         try:
             data: Optional[Dict[str, Any]] = request.get_json()
+            if self.capture is not None and data is not None:
+                # Copied, as a trace context may be added to the queued payload
+                self.capture.record(dict(data) if isinstance(data, dict) else data)
             
             # Validate data structure with detailed error messages
             if not isinstance(data, dict):
@@ -51,16 +69,21 @@ class WebhookServer:
                     }
                 }), 400
             
-            logger.info(f"Received webhook data for {entity_id}")
+            logger.debug("Received webhook data for %s", entity_id, extra=PER_EVENT)
+            span.set_attribute('entity_id', entity_id)
             
-            # Check if this is a monitored entity
-            if entity_id in self.config.monitored_entities:
-                logger.info(f"Monitored entity {entity_id} changed to {new_state.get('state', 'N/A')}")
+            # Check if this is a monitored, digest or rule entity
+            if entity_id in self.accepted_entities:
+                logger.info("Monitored entity %s changed to %s", entity_id, new_state.get('state', 'N/A'),
+                            extra=event_extra(entity_id=entity_id))
                 
                 # Add to message queue for processing
                 if self.message_queue.qsize() < self.config.max_queue_size:
+                    if span.recording:
+                        # The trace continues in the worker that picks the update up
+                        data['trace_context'] = span.context()
                     self.message_queue.put(data)
-                    logger.info(f"Added to queue. Queue size: {self.message_queue.qsize()}")
+                    logger.debug("Added to queue. Queue size: %d", self.message_queue.qsize(), extra=PER_EVENT)
                 else:
                     logger.warning(f"Queue full, dropping message for {entity_id}")
                     return jsonify({
@@ -91,6 +114,11 @@ class WebhookServer:
         """Run the webhook server"""
         logger.info(f"Starting webhook server on {host}:{port}")
         self.app.run(host=host, port=port, debug=False)
+    
+    def stop_capture(self) -> None:
+        """Write out captured webhooks still waiting in memory"""
+        if self.capture is not None:
+            self.capture.stop()
 
 # Example of how to use the webhook server
 if __name__ == "__main__":